@@ -0,0 +1,71 @@
+"""Benchmark the convolution methods against each other, to check the automatic selection of
+``terrainlib.filters.convolution`` picks the fastest one.
+
+Run with ``python -m benchmarks.convolution [size]`` from the project root."""
+# TerrainLib - A fast terrain generation library
+# Copyright © 2018  Nathan "SolarLiner" Graule
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import sys
+import time
+
+import numpy
+
+from terrainlib.filters.convolution import (AUTO, DIRECT, FFT, RUNNING_SUM, BoxBlurFilter, ConvolutionFilter,
+                                            GaussianBlurFilter)
+from terrainlib.terrain import Terrain
+
+
+def timed(func, *args, repeat=3):
+    """Best wall time of ``repeat`` calls, in seconds."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(size=1024):
+    terrain = Terrain(array=numpy.random.uniform(size=(size, size)), copy=False)
+    print('Terrain {0}x{0}'.format(size))
+
+    print('\nGaussian blur (separable)')
+    print('{:>8} {:>8} {:>10} {:>10} {:>8}'.format('sigma', 'kernel', 'direct', 'fft', 'auto'))
+    for sigma in (0.5, 1, 2, 4, 8, 16, 32):
+        direct = GaussianBlurFilter(sigma, method=DIRECT)
+        fft = GaussianBlurFilter(sigma, method=FFT)
+        auto = GaussianBlurFilter(sigma).select_method(terrain._heightmap.shape)
+        print('{:>8} {:>8} {:>10.4f} {:>10.4f} {:>8}'.format(sigma, len(direct.kernel), timed(direct, terrain),
+                                                          timed(fft, terrain), auto))
+
+    print('\nArbitrary kernel (not separable)')
+    print('{:>8} {:>10} {:>10} {:>8}'.format('kernel', 'direct', 'fft', 'auto'))
+    for width in (3, 5, 7, 9, 13):
+        kernel = numpy.random.uniform(size=(width, width))
+        direct = ConvolutionFilter(kernel, DIRECT)
+        fft = ConvolutionFilter(kernel, FFT)
+        auto = ConvolutionFilter(kernel).select_method(terrain._heightmap.shape)
+        print('{:>8} {:>10.4f} {:>10.4f} {:>8}'.format(width, timed(direct, terrain), timed(fft, terrain), auto))
+
+    print('\nBox blur')
+    print('{:>8} {:>10} {:>10} {:>10}'.format('radius', RUNNING_SUM, 'direct', 'fft'))
+    for radius in (1, 4, 16, 64):
+        print('{:>8} {:>10.4f} {:>10.4f} {:>10.4f}'.format(radius, timed(BoxBlurFilter(radius, AUTO), terrain),
+                                                         timed(BoxBlurFilter(radius, DIRECT), terrain, repeat=1),
+                                                         timed(BoxBlurFilter(radius, FFT), terrain)))
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,69 @@
+"""Benchmark the cold import time of TerrainLib, each statement running in a fresh interpreter, and check which heavy
+dependencies actually got loaded.
+
+Run with ``python -m benchmarks.import_time [runs]`` from the project root."""
+# TerrainLib - A fast terrain generation library
+# Copyright © 2018  Nathan "SolarLiner" Graule
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import json
+import statistics
+import subprocess
+import sys
+
+# Pairs of untimed setup and timed statement. NumPy alone takes most of the import time of any module handling
+# terrains, so statements are also timed with NumPy already imported to show the cost of TerrainLib itself.
+STATEMENTS = (
+    ('pass', 'import numpy'),
+    ('pass', 'import terrainlib'),
+    ('pass', 'from terrainlib import Terrain'),
+    ('pass', 'from terrainlib import DiamondSquareGenerator'),
+    ('import numpy', 'from terrainlib import Terrain'),
+    ('import numpy', 'from terrainlib import DiamondSquareGenerator'),
+    ('import numpy', 'import terrainlib.filters.erosion'),
+    ('import numpy', 'import terrainlib.readers.analysis'),
+    ('import numpy', 'import terrainlib.readers.image'),
+)
+
+# Modules loaded lazily by TerrainLib. They only appear in ``sys.modules`` once actually used.
+HEAVY = ('numexpr', 'PIL.Image')
+
+PROBE = '''
+import json, sys, time
+{}
+start = time.perf_counter()
+{}
+elapsed = time.perf_counter() - start
+loaded = [name for name in {!r} if name in sys.modules]
+print(json.dumps([elapsed, loaded]))
+'''
+
+
+def cold_import(setup: str, statement: str):
+    """Time a statement in a fresh interpreter. Returns the elapsed seconds and the heavy modules it loaded."""
+    output = subprocess.check_output([sys.executable, '-c', PROBE.format(setup, statement, HEAVY)])
+    return json.loads(output)
+
+
+def main(runs=10):
+    print('{:<14} {:<46} {:>10} {:>10}  {}'.format('setup', 'statement', 'median ms', 'best ms', 'heavy modules'))
+    for setup, statement in STATEMENTS:
+        results = [cold_import(setup, statement) for _ in range(runs)]
+        times = [1000 * elapsed for elapsed, _ in results]
+        print('{:<14} {:<46} {:>10.1f} {:>10.1f}  {}'.format(setup, statement, statistics.median(times), min(times),
+                                                            ', '.join(results[0][1]) or '-'))
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,78 @@
+"""Compare multi-resolution thermal erosion with full resolution erosion, in time and in how closely the results match.
+
+Errors are RMS differences with the full resolution result, relative to the RMS change made by full resolution
+erosion, both for the heights and for their large-scale shapes (Gaussian blurred). Plain erosion with the iterations
+of the coarse level shows what the same budget gives without the multi-resolution scheme.
+
+Run with ``python -m benchmarks.multiresolution [size] [iterations]`` from the project root."""
+# TerrainLib - A fast terrain generation library
+# Copyright © 2018  Nathan "SolarLiner" Graule
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import sys
+import time
+
+import numpy
+
+from terrainlib.filters.convolution import GaussianBlurFilter
+from terrainlib.filters.erosion import ThermalErosionFilter
+from terrainlib.filters.multiresolution import MultiResolutionFilter
+from terrainlib.generators.procedural import DiamondSquareGenerator
+from terrainlib.terrain import Terrain
+
+TALUS = 1.
+REFINE_ITERATIONS = 10
+
+
+def timed(func, *args):
+    """Output and wall time of a call, in seconds."""
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def errors(heights: numpy.ndarray, reference: numpy.ndarray, change: numpy.ndarray, blur):
+    """Relative RMS errors of the heights and of their large-scale shapes."""
+    error = heights - reference
+    rms = numpy.sqrt(numpy.mean(error ** 2) / numpy.mean(change ** 2))
+    large = numpy.sqrt(numpy.mean(blur(error) ** 2) / numpy.mean(blur(change) ** 2))
+    return rms, large
+
+
+def main(size=512, iterations=400):
+    terrain = DiamondSquareGenerator((size - 1).bit_length(), .3, seed=1, extent=size)()
+
+    def blur(heights):
+        return GaussianBlurFilter(size / 64)(Terrain(array=heights, copy=False))._heightmap
+
+    full, full_time = timed(ThermalErosionFilter(iterations, talus=TALUS), terrain)
+    change = full._heightmap - terrain._heightmap
+    print('Terrain {0}x{0}, {1} iterations at full resolution: {2:.2f}s'.format(size, iterations, full_time))
+
+    print('{:>8} {:>12} {:>10} {:>8} {:>10} {:>10} {:>10}'.format('levels', 'iterations', 'time', 'speedup', 'error',
+                                                                 'large', 'plain'))
+    for levels in (2, 3, 4):
+        coarse = max(10, iterations // 2 ** (levels - 1))
+        multi = MultiResolutionFilter(ThermalErosionFilter(coarse, talus=TALUS),
+                                      ThermalErosionFilter(REFINE_ITERATIONS, talus=TALUS), levels)
+        result, elapsed = timed(multi, terrain)
+        rms, large = errors(result._heightmap, full._heightmap, change, blur)
+        plain = ThermalErosionFilter(coarse, talus=TALUS)(terrain)
+        _, plain_large = errors(plain._heightmap, full._heightmap, change, blur)
+        print('{:>8} {:>12} {:>10.2f} {:>8.1f} {:>10.3f} {:>10.3f} {:>10.3f}'.format(
+            levels, coarse, elapsed, full_time / elapsed, rms, large, plain_large))
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,62 @@
+"""Measure how independent generate, filter and read pipelines scale on a thread pool.
+
+Every job generates a Diamond Square terrain, erodes it and computes its slope. The same batch of jobs runs on 1, 2,
+4, ... threads up to the number of CPUs, and the throughput is compared to a single thread. Scaling stays close to
+linear as long as the stages spend their time in NumPy and numexpr, which release the GIL.
+
+Run with ``python -m benchmarks.thread_scaling [jobs] [size exponent]`` from the project root."""
+# TerrainLib - A fast terrain generation library
+# Copyright © 2018  Nathan "SolarLiner" Graule
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import os
+import sys
+import time
+
+from terrainlib.pipeline import Pipeline, run_pipelines
+
+STAGES = [
+    {'type': 'DiamondSquareGenerator', 'size': None, 'roughness': .2, 'seed': None},
+    {'type': 'ThermalErosionFilter', 'iterations': 20},
+    {'type': 'SlopeReader'},
+]
+
+
+def pipelines(jobs: int, size: int):
+    """Independent pipelines, differing by their seed."""
+    return [Pipeline([dict(STAGES[0], size=size, seed=seed)] + STAGES[1:]) for seed in range(jobs)]
+
+
+def main(jobs=32, size=9):
+    cpus = os.cpu_count()
+    workers = [1]
+    while workers[-1] * 2 <= cpus:
+        workers.append(workers[-1] * 2)
+    if workers[-1] != cpus:
+        workers.append(cpus)
+    print('{} jobs on {}x{} terrains, {} CPUs'.format(jobs, 2 ** size + 1, 2 ** size + 1, cpus))
+    print('{:>8} {:>10} {:>12} {:>8} {:>11}'.format('threads', 'time', 'jobs/s', 'speedup', 'efficiency'))
+    base = None
+    for count in workers:
+        batch = pipelines(jobs, size)
+        start = time.perf_counter()
+        run_pipelines(batch, count)
+        elapsed = time.perf_counter() - start
+        base = base or elapsed
+        print('{:>8} {:>10.2f} {:>12.1f} {:>8.2f} {:>10.0%}'.format(count, elapsed, jobs / elapsed, base / elapsed,
+                                                                    base / elapsed / count))
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,98 @@
+"""Benchmark the tile server under concurrent load, reporting latency percentiles.
+
+Clients request tiles drawn from a small area, so that some requests hit the cache or a generation already running,
+as when several users pan over the same region.
+
+Run with ``python -m benchmarks.tile_server [clients] [requests] [area]`` from the project root. A server is started
+on a free port unless ``TILE_SERVER`` holds the ``host:port`` of a running one."""
+# TerrainLib - A fast terrain generation library
+# Copyright © 2018  Nathan "SolarLiner" Graule
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+from terrainlib.server import TileServer
+
+
+async def fetch(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, path: str):
+    """GET a path on a kept-alive connection. Returns the status code and body."""
+    writer.write('GET {} HTTP/1.1\r\nHost: localhost\r\n\r\n'.format(path).encode())
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line == b'\r\n':
+            break
+        name, _, value = line.decode().partition(':')
+        if name.lower() == 'content-length':
+            length = int(value)
+    return status, await reader.readexactly(length)
+
+
+async def client(host: str, port: int, requests: int, area: int, rng: random.Random, latencies: list):
+    """One client sending requests one after the other on its own connection."""
+    reader, writer = await asyncio.open_connection(host, port)
+    for _ in range(requests):
+        path = '/tiles/{}/{}.{}'.format(rng.randrange(area), rng.randrange(area), rng.choice(('png', 'raw')))
+        start = time.perf_counter()
+        status, _ = await fetch(reader, writer, path)
+        latencies.append(time.perf_counter() - start)
+        if status != 200:
+            raise RuntimeError('{} answered {}'.format(path, status))
+    writer.close()
+
+
+def percentile(values: list, q: float):
+    """Nearest-rank percentile of values, ``q`` between 0 and 100."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(q / 100 * len(ordered))) - 1))]
+
+
+async def run(clients=32, requests=20, area=6):
+    server = None
+    if 'TILE_SERVER' in os.environ:
+        host, port = os.environ['TILE_SERVER'].rsplit(':', 1)
+        port = int(port)
+    else:
+        server = TileServer()
+        host, port = await server.start(port=0)
+
+    latencies = []
+    rng = random.Random(0)
+    start = time.perf_counter()
+    try:
+        await asyncio.gather(*(client(host, port, requests, area, random.Random(rng.random()), latencies)
+                               for _ in range(clients)))
+        elapsed = time.perf_counter() - start
+        reader, writer = await asyncio.open_connection(host, port)
+        _, stats = await fetch(reader, writer, '/stats')
+        writer.close()
+    finally:
+        if server is not None:
+            await server.close()
+
+    print('{} clients x {} requests over {}x{} tiles, {:.2f} s'.format(clients, requests, area, area, elapsed))
+    print('throughput {:.1f} requests/s'.format(len(latencies) / elapsed))
+    for q in (50, 90, 99):
+        print('p{:<3} {:8.2f} ms'.format(q, 1000 * percentile(latencies, q)))
+    print('server', json.loads(stats.decode()))
+
+
+if __name__ == '__main__':
+    asyncio.run(run(*(int(arg) for arg in sys.argv[1:])))
@@ -1,53 +1,12 @@
-from datetime import timedelta
-import logging
-from itertools import product
-import time
+import os
+import sys
 
-import numpy
-from PIL import Image
+from terrainlib.cli import main
 
-from terrainlib.generators.procedural import DiamondSquareGenerator, VoronoiGenerator
-from terrainlib.generators.image import PILInputGenerator
-from terrainlib.filters.erosion import ThermalErosionFilter, HydraulicErosionFilter, StrataFilter
-from terrainlib.readers.image import PILImageReader
-
-
-class ElapsedFormatter(logging.Formatter):
-    def __init__(self, fmt=None):
-        super().__init__(fmt)
-        self.start = time.time()
-
-    def format(self, record):
-        message = super(__class__, self).format(record)
-        elapsed_time = timedelta(seconds=record.created - self.start)
-        return '[{} s] {}'.format(elapsed_time, message)
-
-logging.basicConfig(format='%(levelname)s: %(message)s', level=logging.INFO)
-
-sh = logging.FileHandler('debug.log', 'w')
-sh.setFormatter(ElapsedFormatter('%(levelname)s @ %(module)s: %(message)s'))
-
-def main():
-    # generator = PILInputGenerator('data/terrain_in.png', PILInputGenerator.BITDEPTH_8)
-    generator = DiamondSquareGenerator(10, 0.2)
-    # hydrerode = HydraulicErosionFilter(100)
-    strata = StrataFilter(22.8)
-    thermal_erode = ThermalErosionFilter(20)
-    img_reader = PILImageReader(PILImageReader.BITDEPTH_8)
-
-    terr = strata(generator())
-    img_reader(terr).save('terrain_strata.png')
-    terr = thermal_erode(terr)
-    img_reader(terr).save('terrain_out.png')
-    # voronoi = VoronoiGenerator(1024)
-    # erosion = ThermalErosionFilter(150)
-    # reader = PILImageReader(PILImageReader.BITDEPTH_8)
-
-    # points = numpy.random.uniform(high=1024, size=(50,2))
-    # terr = erosion(voronoi(points.tolist()))
-    # img = reader(terr)
-    # img.save('terrain_out.png')
+# Diamond Square terrain terraced by strata erosion, then smoothed by thermal erosion. Edit the spec, or write new ones
+# and run them with ``python -m terrainlib run SPEC``.
+SPEC = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'examples', 'strata.json')
 
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main(['run', SPEC] + sys.argv[1:]))
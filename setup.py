@@ -21,5 +21,8 @@ setup(name='TerrainLib',
     author='Nathan Graule',
     author_email='solarliner@gmail.com',
     url='https://www.python.org/community/sigs/',
-    packages=['terrainlib']
+    python_requires='>=3.9',
+    packages=['terrainlib', 'terrainlib.filters', 'terrainlib.generators', 'terrainlib.readers'],
+    extras_require={'yaml': ['pyyaml']},
+    entry_points={'console_scripts': ['terrainlib = terrainlib.cli:main']}
 )
\ No newline at end of file
@@ -12,4 +12,66 @@ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
 GNU General Public License for more details.
 
 You should have received a copy of the GNU General Public License
-along with this program.  If not, see <http://www.gnu.org/licenses/>."""
\ No newline at end of file
+along with this program.  If not, see <http://www.gnu.org/licenses/>."""
+import importlib
+
+# Public names of the library, and the module defining them. They are imported on first access so that importing
+# ``terrainlib`` stays cheap, and only the modules actually used get loaded.
+_EXPORTS = {
+    'Terrain': 'terrain',
+    'SharedTerrain': 'shared',
+    'Pipeline': 'pipeline',
+    'DiamondSquareGenerator': 'generators.procedural',
+    'VoronoiGenerator': 'generators.procedural',
+    'PILInputGenerator': 'generators.image',
+    'PointCloudGenerator': 'generators.pointcloud',
+    'HydraulicErosionFilter': 'filters.erosion',
+    'ThermalErosionFilter': 'filters.erosion',
+    'StrataErosionFilter': 'filters.erosion',
+    'MultiResolutionFilter': 'filters.multiresolution',
+    'WarpFilter': 'filters.warp',
+    'ResampleFilter': 'filters.resample',
+    'LerpFilter': 'filters.composite',
+    'MaxFilter': 'filters.composite',
+    'MinFilter': 'filters.composite',
+    'SoftMaxFilter': 'filters.composite',
+    'HeightSelectFilter': 'filters.composite',
+    'CurveFilter': 'filters.composite',
+    'ConvolutionFilter': 'filters.convolution',
+    'GaussianBlurFilter': 'filters.convolution',
+    'BoxBlurFilter': 'filters.convolution',
+    'UnsharpMaskFilter': 'filters.convolution',
+    'BandPassFilter': 'filters.convolution',
+    'PILImageReader': 'readers.image',
+    'TerrainAnalysisReader': 'readers.analysis',
+    'SlopeReader': 'readers.analysis',
+    'AspectReader': 'readers.analysis',
+    'CurvatureReader': 'readers.analysis',
+    'NormalMapReader': 'readers.analysis',
+    'SinkFillReader': 'readers.hydrology',
+    'FlowDirectionReader': 'readers.hydrology',
+    'FlowAccumulationReader': 'readers.hydrology',
+    'DrainageNetworkReader': 'readers.hydrology',
+    'StatisticsReader': 'readers.statistics',
+    'Fingerprint': 'fingerprint',
+    'content_hash': 'fingerprint',
+    'Profiler': 'profiling',
+}
+_SUBMODULES = ('filters', 'generators', 'readers', 'cli', 'fingerprint', 'lazy', 'pipeline', 'profiling', 'server', 'shared', 'terrain', 'tiles')
+
+__all__ = sorted(_EXPORTS)
+
+
+def __getattr__(name):
+    if name in _EXPORTS:
+        value = getattr(importlib.import_module('.' + _EXPORTS[name], __name__), name)
+    elif name in _SUBMODULES:
+        value = importlib.import_module('.' + name, __name__)
+    else:
+        raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_EXPORTS) | set(_SUBMODULES))
@@ -0,0 +1,161 @@
+"""Command line interface of TerrainLib.
+
+``terrainlib run SPEC [SPEC ...]`` runs pipeline specs (see ``terrainlib.pipeline``) for every combination of their
+sweep variables, on a process pool. Outputs newer than their spec are skipped. A table of the time and peak memory of
+every stage is printed and written next to the first spec.
+
+``terrainlib serve`` starts the tile server, see ``terrainlib.server``."""
+# TerrainLib - A fast terrain generation library
+# Copyright © 2018  Nathan "SolarLiner" Graule
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import argparse
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import logging
+import os
+import sys
+import time
+
+from .pipeline import Pipeline, load_spec, save, sweep
+from .profiling import megabytes
+
+logger = logging.getLogger(__name__)
+
+RAN = 'ran'
+SKIPPED = 'skipped'
+FAILED = 'failed'
+
+
+def output_path(spec_path: str, spec: dict, variables: dict):
+    """Path of the output of a job, relative paths being relative to the spec file.
+
+    :param spec_path: Path of the spec file.
+    :param spec: Spec dictionary.
+    :param variables: Values of the sweep variables of the job.
+    :returns: output path."""
+    output = spec.get('output') or {}
+    template = output if isinstance(output, str) else output.get('path')
+    if not template:
+        raise TypeError('Pipeline spec {} has no output path'.format(spec_path))
+    name = spec.get('name', os.path.splitext(os.path.basename(spec_path))[0])
+    return os.path.join(os.path.dirname(spec_path), template.format(name=name, **variables))
+
+
+def up_to_date(path: str, spec_path: str):
+    """Whether an output exists and is newer than its spec."""
+    return os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(spec_path)
+
+
+def run_job(spec_path: str, spec: dict, variables: dict, force=False, trace_memory=True):
+    """Run one job of a spec and save its output. Runs in the worker processes or threads of the batch.
+
+    :param spec_path: Path of the spec file.
+    :param spec: Spec dictionary.
+    :param variables: Values of the sweep variables of the job.
+    :param force: Run the job even if its output is up to date.
+    :param trace_memory: Measure the peak memory of the stages, see ``Pipeline.__call__``.
+    :returns: dictionary with the job ``status``, ``output`` path (None if the spec has none), and list of
+    ``stages`` timings (``name``, seconds, peak bytes or None), or ``error`` message."""
+    job = {'spec': spec_path, 'variables': variables, 'output': None, 'stages': []}
+    try:
+        path = job['output'] = output_path(spec_path, spec, variables)
+        if not force and up_to_date(path, spec_path):
+            return dict(job, status=SKIPPED)
+        pipeline = Pipeline.from_spec(spec, variables)
+        result = pipeline(job['stages'], trace_memory)
+        start = time.perf_counter()
+        output = spec['output'] if isinstance(spec['output'], dict) else {}
+        save(result, path, output.get('bitdepth', 16), output.get('normalize', True))
+        job['stages'].append(('save', time.perf_counter() - start, 0 if trace_memory else None))
+    except Exception as error:
+        logger.exception('Job %s %s failed', spec_path, variables)
+        return dict(job, status=FAILED, error='{}: {}'.format(type(error).__name__, error))
+    return dict(job, status=RAN)
+
+
+def run_batch(spec_paths: list, workers=1, force=False, threads=False):
+    """Run every job of the given specs.
+
+    :param spec_paths: Paths of the spec files.
+    :param workers: Number of processes or threads running jobs. Jobs run in this process when 1.
+    :param force: Run jobs even if their outputs are up to date.
+    :param threads: Run jobs on threads rather than processes, which saves starting processes and pickling specs and
+    results, see ``pipeline.run_pipelines``. Peak memory is not measured then.
+    :returns: list of job dictionaries, see ``run_job``, in spec and sweep order."""
+    jobs = []
+    for spec_path in spec_paths:
+        spec = load_spec(spec_path)
+        jobs.extend((spec_path, spec, variables, force, not threads) for variables in sweep(spec))
+    if workers <= 1 or len(jobs) <= 1:
+        return [run_job(*job) for job in jobs]
+    with (ThreadPoolExecutor if threads else ProcessPoolExecutor)(workers) as executor:
+        return list(executor.map(run_job, *zip(*jobs)))
+
+
+def summary(results: list):
+    """Table of the stage timings and peak memory of every job.
+
+    :param results: List of job dictionaries returned by ``run_batch``.
+    :returns: table as a string."""
+    row = '{:<40} {:<24} {:>10} {:>10}'
+    lines = [row.format('job', 'stage', 'time (s)', 'peak (MB)'), '-' * 87]
+    for result in results:
+        variables = ' '.join('{}={}'.format(name, value) for name, value in sorted(result['variables'].items()))
+        job = '{} {}'.format(os.path.basename(result['output'] or result['spec']), variables).strip()
+        if result['status'] != RAN:
+            lines.append(row.format(job, SKIPPED if result['status'] == SKIPPED else 'FAILED ' + result['error'],
+                                    '', '').rstrip())
+            continue
+        for name, seconds, peak in result['stages']:
+            lines.append(row.format(job, name, '{:.3f}'.format(seconds), megabytes(peak)).rstrip())
+            job = ''
+        total = sum(seconds for _, seconds, _ in result['stages'])
+        peaks = [peak for _, _, peak in result['stages'] if peak is not None]
+        lines.append(row.format('', 'total', '{:.3f}'.format(total), megabytes(max(peaks, default=None))).rstrip())
+    counts = {status: sum(result['status'] == status for result in results) for status in (RAN, SKIPPED, FAILED)}
+    lines.append('{} jobs: {ran} ran, {skipped} skipped, {failed} failed'.format(len(results), **counts))
+    return '\n'.join(lines) + '\n'
+
+
+def main(argv=None):
+    """Command line entry point.
+
+    :param argv: Command line arguments, defaults to ``sys.argv[1:]``.
+    :returns: exit status."""
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if argv[:1] == ['serve']:
+        from .server import main as serve
+        return serve(argv[1:])
+
+    parser = argparse.ArgumentParser(prog='terrainlib', description='Run terrain pipelines described by spec files.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('serve', help='serve heightmap tiles over HTTP, see terrainlib serve --help')
+    run = commands.add_parser('run', help='run pipeline specs')
+    run.add_argument('specs', nargs='+', help='JSON or YAML pipeline spec files')
+    run.add_argument('-j', '--workers', type=int, default=os.cpu_count(), help='number of processes running jobs')
+    run.add_argument('-t', '--threads', action='store_true',
+                     help='run jobs on threads of this process rather than on processes, without measuring memory')
+    run.add_argument('-f', '--force', action='store_true', help='run jobs even if their output is up to date')
+    run.add_argument('--summary', help='path of the summary table, next to the first spec by default')
+    run.add_argument('-v', '--verbose', action='store_true', help='log the progress of every stage')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(format='%(levelname)s: %(message)s', level=logging.INFO if args.verbose else logging.WARNING)
+    results = run_batch(args.specs, args.workers, args.force, args.threads)
+    table = summary(results)
+    summary_path = args.summary or os.path.splitext(args.specs[0])[0] + '.summary.txt'
+    with open(summary_path, 'w') as file:
+        file.write(table)
+    print(table, end='')
+    return 1 if any(result['status'] == FAILED for result in results) else 0
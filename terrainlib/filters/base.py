@@ -16,9 +16,34 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 import abc
 
+from ..terrain import Terrain
+from ..tiles import crop, dirty_windows, read_region, write_region
+
 
 class TerrainFilter(metaclass=abc.ABCMeta):
     """Modifies a Terrain object."""
+    #: Distance, in cells, over which editing the input changes the output. None when any edit may change all of it,
+    #: which disables incremental updates.
+    halo = None
+
     @abc.abstractmethod
     def __call__(self, terrain, *args, **kwargs):
         """Apply transform onto the terrain. Must output terrain afterwards."""
+
+    def incremental(self, terrain: Terrain, previous: Terrain, regions=None):
+        """Update the output of a previous call after edits of the terrain, recomputing only the edited regions and
+        their ``halo``. Dirty regions are left untouched, call ``terrain.clear_dirty()`` once all outputs are updated.
+
+        :param terrain: Edited Terrain object.
+        :param previous: Terrain object returned by the previous call of the filter, updated in place.
+        :param regions: Edited regions. Defaults to the dirty regions of the terrain.
+        :returns: the updated ``previous`` Terrain object."""
+        heightmap = terrain._heightmap
+        windows = dirty_windows(terrain.dirty_regions if regions is None else regions, self.halo, heightmap.shape)
+        if windows is None:
+            previous._heightmap[...] = self(terrain)._heightmap
+            return previous
+        for window, region in windows:
+            result = self(Terrain(array=read_region(heightmap, window), copy=False))
+            write_region(previous._heightmap, region, crop(result._heightmap, self.halo))
+        return previous
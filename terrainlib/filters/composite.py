@@ -0,0 +1,256 @@
+"""Compositing filters combine the terrain with other layers: blending through masks, keeping the highest or lowest
+heights, selecting layers by height and remapping heights through curves.
+
+Chained ``Terrain`` operators allocate a full temporary for every step. These filters instead evaluate blocks of rows
+small enough to stay in the CPU cache, on a thread pool, and write straight into the output."""
+# TerrainLib - A fast terrain generation library
+# Copyright © 2018  Nathan "SolarLiner" Graule
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import abc
+
+import numpy
+
+from ..terrain import Terrain
+from ..tiles import map_blocks
+from .base import TerrainFilter
+
+# Number of cells per block when the number of rows is not given: 64k doubles, a few temporaries of which fit in the
+# L2 cache of most CPUs
+BLOCK_CELLS = 2 ** 16
+
+
+class CompositeFilter(TerrainFilter):
+    """Base of the compositing filters. Layers are Terrain objects, arrays of the shape of the terrain, or scalars.
+    Layers only depend on the cells at the same position, so compositing filters have no halo."""
+    halo = 0
+
+    def __init__(self, in_place=False, block_rows=None, workers=1):
+        """Initialize the evaluation settings.
+
+        :param in_place: Write the result into the input terrain instead of a new one.
+        :param block_rows: Number of rows processed at once. Defaults to blocks of about ``BLOCK_CELLS`` cells.
+        :param workers: Number of threads processing blocks concurrently.
+        """
+        self.in_place = in_place
+        self.block_rows = block_rows
+        self.workers = workers
+
+    def __call__(self, terrain: Terrain, out=None):
+        """Composite the terrain with the layers of the filter.
+
+        :param terrain: Terrain object to composite.
+        :param out: Optional Terrain object or floating point array of the shape of the terrain receiving the result,
+        which may be the terrain itself.
+        :returns: Terrain object holding the result: ``out`` if it is a Terrain object, the input terrain when
+        compositing in place, or a new Terrain object wrapping the output array."""
+        heights = terrain._heightmap
+        rows, cols = heights.shape
+        if out is None and self.in_place:
+            out = terrain
+        buffer = out._heightmap if isinstance(out, Terrain) else out
+        if buffer is None:
+            buffer = numpy.empty((rows, cols))
+        elif buffer.shape != heights.shape or not numpy.issubdtype(buffer.dtype, numpy.floating):
+            raise TypeError('Output should be a floating point array of shape {}'.format(heights.shape))
+        for layer in self.layers():
+            if numpy.ndim(layer) and numpy.shape(layer) != heights.shape:
+                raise TypeError('Layer of shape {} does not match terrain of shape {}'.format(numpy.shape(layer),
+                                                                                              heights.shape))
+
+        def composite(start, stop):
+            self.composite(heights[start:stop], start, stop, buffer[start:stop])
+
+        map_blocks(composite, rows, self.block_rows or max(1, BLOCK_CELLS // cols), self.workers)
+        return out if isinstance(out, Terrain) else Terrain(array=buffer, copy=False)
+
+    def layers(self):
+        """Layers combined with the terrain, checked against its shape before compositing."""
+        return ()
+
+    @abc.abstractmethod
+    def composite(self, heights: numpy.ndarray, start: int, stop: int, out: numpy.ndarray):
+        """Composite one block of rows. ``out`` may be the same array as ``heights``, so it should only be written once
+        ``heights`` is no longer needed.
+
+        :param heights: Rows ``start:stop`` of the terrain.
+        :param start: First row of the block.
+        :param stop: Row after the last row of the block.
+        :param out: Rows ``start:stop`` of the output."""
+
+
+def _rows(layer, start: int, stop: int):
+    """Rows of a layer, or the layer itself for scalars. Should not be called directly."""
+    if isinstance(layer, Terrain):
+        return layer._heightmap[start:stop]
+    if numpy.ndim(layer):
+        return layer[start:stop]
+    return layer
+
+
+def _layer(layer):
+    """Layer as a Terrain object, array or float. Should not be called directly."""
+    if isinstance(layer, Terrain) or numpy.ndim(layer):
+        return layer if isinstance(layer, Terrain) else numpy.asanyarray(layer)
+    return float(layer)
+
+
+class LerpFilter(CompositeFilter):
+    """Linear interpolation between the terrain and another layer through a mask: ``terrain + (other - terrain) *
+    mask``. The mask is 0 where the terrain is kept, 1 where the other layer replaces it."""
+    def __init__(self, other, mask, in_place=False, block_rows=None, workers=1):
+        """Initialize the blend.
+
+        :param other: Layer blended in.
+        :param mask: Layer of blending weights, usually between 0 and 1.
+        :param in_place: Write the result into the input terrain instead of a new one.
+        :param block_rows: Number of rows processed at once. Defaults to blocks of about ``BLOCK_CELLS`` cells.
+        :param workers: Number of threads processing blocks concurrently.
+        """
+        super().__init__(in_place, block_rows, workers)
+        self.other = _layer(other)
+        self.mask = _layer(mask)
+
+    def layers(self):
+        return self.other, self.mask
+
+    def composite(self, heights, start, stop, out):
+        blend = numpy.subtract(_rows(self.other, start, stop), heights)
+        blend *= _rows(self.mask, start, stop)
+        numpy.add(heights, blend, out=out)
+
+
+class MaxFilter(CompositeFilter):
+    """Highest of the terrain and another layer, for instance to add mountains onto a base."""
+    def __init__(self, other, in_place=False, block_rows=None, workers=1):
+        """Initialize the blend.
+
+        :param other: Layer compared to the terrain.
+        :param in_place: Write the result into the input terrain instead of a new one.
+        :param block_rows: Number of rows processed at once. Defaults to blocks of about ``BLOCK_CELLS`` cells.
+        :param workers: Number of threads processing blocks concurrently.
+        """
+        super().__init__(in_place, block_rows, workers)
+        self.other = _layer(other)
+
+    def layers(self):
+        return self.other,
+
+    def composite(self, heights, start, stop, out):
+        numpy.maximum(heights, _rows(self.other, start, stop), out=out)
+
+
+class MinFilter(MaxFilter):
+    """Lowest of the terrain and another layer, for instance to carve valleys."""
+    def composite(self, heights, start, stop, out):
+        numpy.minimum(heights, _rows(self.other, start, stop), out=out)
+
+
+class SoftMaxFilter(MaxFilter):
+    """Smooth maximum of the terrain and another layer, ``k * log(exp(terrain / k) + exp(other / k))``. Unlike the
+    maximum, it leaves no crease where both layers meet: heights are raised by up to ``k * log(2)`` where they are
+    close."""
+    def __init__(self, other, smoothness=1., in_place=False, block_rows=None, workers=1):
+        """Initialize the blend.
+
+        :param other: Layer blended with the terrain.
+        :param smoothness: Height difference ``k`` over which the layers blend. Negative values give a smooth minimum.
+        :param in_place: Write the result into the input terrain instead of a new one.
+        :param block_rows: Number of rows processed at once. Defaults to blocks of about ``BLOCK_CELLS`` cells.
+        :param workers: Number of threads processing blocks concurrently.
+        """
+        if not smoothness:
+            raise TypeError('Smoothness should not be 0, use MaxFilter or MinFilter instead')
+        super().__init__(other, in_place, block_rows, workers)
+        self.smoothness = float(smoothness)
+
+    def composite(self, heights, start, stop, out):
+        other = _rows(self.other, start, stop)
+        # max + k * log(1 + exp(-|a - b| / k)) does not overflow, whatever the heights
+        k = self.smoothness
+        blend = numpy.subtract(heights, other)
+        numpy.abs(blend, out=blend)
+        blend /= -abs(k)
+        numpy.exp(blend, out=blend)
+        numpy.log1p(blend, out=blend)
+        blend *= k
+        (numpy.maximum if k > 0 else numpy.minimum)(heights, other, out=out)
+        out += blend
+
+
+class HeightSelectFilter(CompositeFilter):
+    """Replaces the terrain by another layer where its heights lie within a range, with a linear transition of
+    ``falloff`` outside of the range. Typically used to lay rocks over high grounds, or sand along the shore."""
+    def __init__(self, other, low=-numpy.inf, high=numpy.inf, falloff=0., in_place=False, block_rows=None,
+                 workers=1):
+        """Initialize the selection.
+
+        :param other: Layer selected within the range.
+        :param low: Lowest height of the range.
+        :param high: Highest height of the range.
+        :param falloff: Height difference over which the other layer fades out, on both ends of the range.
+        :param in_place: Write the result into the input terrain instead of a new one.
+        :param block_rows: Number of rows processed at once. Defaults to blocks of about ``BLOCK_CELLS`` cells.
+        :param workers: Number of threads processing blocks concurrently.
+        """
+        if low > high:
+            raise TypeError('The range of heights should not be empty')
+        super().__init__(in_place, block_rows, workers)
+        self.other = _layer(other)
+        self.low = low
+        self.high = high
+        self.falloff = max(0., falloff)
+
+    def layers(self):
+        return self.other,
+
+    def weights(self, heights: numpy.ndarray):
+        """Weight of the other layer, from 0 out of the range to 1 within it.
+
+        :param heights: Array of heights of the terrain.
+        :returns: new array of weights."""
+        if not self.falloff:
+            return ((heights >= self.low) & (heights <= self.high)).astype(float)
+        # Distance out of the range, in falloffs
+        weights = numpy.maximum(self.low - heights, heights - self.high)
+        weights /= -self.falloff
+        weights += 1.
+        return numpy.clip(weights, 0., 1., out=weights)
+
+    def composite(self, heights, start, stop, out):
+        blend = numpy.subtract(_rows(self.other, start, stop), heights)
+        blend *= self.weights(heights)
+        numpy.add(heights, blend, out=out)
+
+
+class CurveFilter(CompositeFilter):
+    """Remaps heights through a curve, for instance to flatten valleys and sharpen peaks. The curve is piecewise linear
+    between its control points, which it hits exactly."""
+    def __init__(self, inputs, outputs, in_place=False, block_rows=None, workers=1):
+        """Initialize the remapping.
+
+        :param inputs: Increasing heights of the control points of the curve. Heights outside of them are clamped.
+        :param outputs: Heights the control points map to.
+        :param in_place: Write the result into the input terrain instead of a new one.
+        :param block_rows: Number of rows processed at once. Defaults to blocks of about ``BLOCK_CELLS`` cells.
+        :param workers: Number of threads processing blocks concurrently.
+        """
+        inputs, outputs = numpy.asarray(inputs, dtype=float), numpy.asarray(outputs, dtype=float)
+        if inputs.ndim != 1 or inputs.shape != outputs.shape or len(inputs) < 2 or (numpy.diff(inputs) <= 0).any():
+            raise TypeError('Curves need at least two control points of increasing inputs')
+        super().__init__(in_place, block_rows, workers)
+        self.inputs, self.outputs = inputs, outputs
+
+    def composite(self, heights, start, stop, out):
+        out[...] = numpy.interp(heights, self.inputs, self.outputs)
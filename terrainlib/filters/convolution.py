@@ -0,0 +1,333 @@
+"""Convolution filters smooth, sharpen and band-pass terrains. Boundaries wrap around, just like ``Terrain`` indexing,
+so filtered terrains still tile.
+
+Each filter picks the fastest method for its kernel: separable kernels are applied one axis at a time, large kernels
+through FFT, and box filters through running sums whose cost does not depend on their size."""
+# TerrainLib - A fast terrain generation library
+# Copyright © 2018  Nathan "SolarLiner" Graule
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import logging
+import math
+
+import numpy
+
+from ..terrain import Terrain
+from ..tiles import map_blocks
+from .base import TerrainFilter
+
+logger = logging.getLogger(__name__)
+
+AUTO = 'auto'
+DIRECT = 'direct'
+FFT = 'fft'
+RUNNING_SUM = 'running_sum'
+
+# Rough cost of a FFT convolution, in multiply-adds per cell and per log2 of the number of cells, measured against
+# direct convolution by ``benchmarks/convolution.py``.
+FFT_COST = 2.
+
+
+def convolve_axis(heights: numpy.ndarray, kernel: numpy.ndarray, axis: int, block_rows=64, workers=1):
+    """Convolve along one axis with a 1D kernel, wrapping around the grid.
+
+    :param heights: 2D array to convolve.
+    :param kernel: 1D kernel, centred on its ``len(kernel) // 2`` element.
+    :param axis: Axis to convolve along.
+    :param block_rows: Number of rows processed at once.
+    :param workers: Number of threads processing blocks concurrently.
+    :returns: new array."""
+    kernel = numpy.asarray(kernel, dtype=float)[::-1]
+    size = len(kernel)
+    out = numpy.empty(heights.shape)
+
+    def convolve(padded, block):
+        block[:] = kernel[0] * _window(padded, 0, block.shape, axis)
+        for k in range(1, size):
+            block += kernel[k] * _window(padded, k, block.shape, axis)
+
+    _padded_blocks(convolve, heights, out, axis, size - 1 - size // 2, size // 2, block_rows, workers)
+    return out
+
+
+def running_sum_axis(heights: numpy.ndarray, radius: int, axis: int, block_rows=64, workers=1):
+    """Mean over a window of ``2 * radius + 1`` cells along one axis, wrapping around the grid. Uses running sums, so
+    the cost does not depend on the radius.
+
+    :param heights: 2D array to filter.
+    :param radius: Number of cells on each side of the window.
+    :param axis: Axis to filter along.
+    :param block_rows: Number of rows processed at once.
+    :param workers: Number of threads processing blocks concurrently.
+    :returns: new array."""
+    size = 2 * radius + 1
+    out = numpy.empty(heights.shape)
+
+    def box(padded, block):
+        sums = numpy.cumsum(padded, axis=axis)
+        first = _window(sums, size - 1, block.shape, axis)
+        if axis == 0:
+            block[0] = first[0]
+            numpy.subtract(sums[size:], sums[:-size], out=block[1:])
+        else:
+            block[:, 0] = first[:, 0]
+            numpy.subtract(sums[:, size:], sums[:, :-size], out=block[:, 1:])
+        block /= size
+
+    # Along rows, blocks are padded by whole rows: keep them large compared to the padding
+    if axis == 0:
+        block_rows = max(block_rows, 4 * radius)
+    _padded_blocks(box, heights, out, axis, radius, radius, block_rows, workers)
+    return out
+
+
+def _window(padded: numpy.ndarray, offset: int, shape: tuple, axis: int):
+    """View of a padded block, shifted by ``offset`` cells along ``axis``. Should not be called directly."""
+    if axis == 0:
+        return padded[offset:offset + shape[0]]
+    return padded[:, offset:offset + shape[1]]
+
+
+def _padded_blocks(func, heights: numpy.ndarray, out: numpy.ndarray, axis: int, before: int, after: int,
+                   block_rows: int, workers: int):
+    """Calls ``func(padded, out_block)`` on blocks of rows padded along ``axis`` by wrapping around the grid. Should
+    not be called directly."""
+    rows, cols = heights.shape
+    columns = numpy.arange(-before, cols + after) % cols
+
+    def process(start, stop):
+        if axis == 0:
+            padded = heights.take(numpy.arange(start - before, stop + after) % rows, axis=0)
+        else:
+            padded = heights[start:stop].take(columns, axis=1)
+        func(padded.astype(float, copy=False), out[start:stop])
+
+    map_blocks(process, rows, block_rows, workers)
+
+
+def convolve_direct(heights: numpy.ndarray, kernel: numpy.ndarray, block_rows=64, workers=1):
+    """Convolve with a 2D kernel by summing shifted copies of the terrain, wrapping around the grid.
+
+    :param heights: 2D array to convolve.
+    :param kernel: 2D kernel, centred on its ``(rows // 2, cols // 2)`` element.
+    :param block_rows: Number of rows processed at once.
+    :param workers: Number of threads processing blocks concurrently.
+    :returns: new array."""
+    kernel = numpy.asarray(kernel, dtype=float)[::-1, ::-1]
+    krows, kcols = kernel.shape
+    rows, cols = heights.shape
+    out = numpy.empty(heights.shape)
+    columns = numpy.arange(-(kcols - 1 - kcols // 2), cols + kcols // 2) % cols
+
+    def convolve(start, stop):
+        indices = numpy.arange(start - (krows - 1 - krows // 2), stop + krows // 2) % rows
+        padded = heights.take(indices, axis=0).take(columns, axis=1).astype(float, copy=False)
+        block = out[start:stop]
+        block[:] = 0.
+        for a in range(krows):
+            for b in range(kcols):
+                if kernel[a, b]:
+                    block += kernel[a, b] * padded[a:a + stop - start, b:b + cols]
+
+    map_blocks(convolve, rows, block_rows, workers)
+    return out
+
+
+def convolve_fft(heights: numpy.ndarray, kernel: numpy.ndarray):
+    """Convolve with a 2D kernel through FFT. Circular convolution is exactly convolution on the wrapped-around grid.
+
+    :param heights: 2D array to convolve.
+    :param kernel: 2D kernel, centred on its ``(rows // 2, cols // 2)`` element. It may be larger than the terrain.
+    :returns: new array."""
+    kernel = numpy.asarray(kernel, dtype=float)
+    shape = heights.shape
+    embedded = numpy.zeros(shape)
+    rows = (numpy.arange(kernel.shape[0]) - kernel.shape[0] // 2) % shape[0]
+    cols = (numpy.arange(kernel.shape[1]) - kernel.shape[1] // 2) % shape[1]
+    numpy.add.at(embedded, (rows[:, None], cols[None, :]), kernel)
+    spectrum = numpy.fft.rfft2(heights)
+    spectrum *= numpy.fft.rfft2(embedded)
+    return numpy.fft.irfft2(spectrum, shape)
+
+
+def separate(kernel: numpy.ndarray, tolerance=1e-10):
+    """Split a 2D kernel into the outer product of two 1D kernels, if possible.
+
+    :param kernel: 2D kernel.
+    :param tolerance: Relative tolerance on the kernel values.
+    :returns: tuple of the kernels along the first and second axes, or None if the kernel is not separable."""
+    kernel = numpy.asarray(kernel, dtype=float)
+    row, col = numpy.unravel_index(numpy.argmax(numpy.abs(kernel)), kernel.shape)
+    pivot = kernel[row, col]
+    if not pivot:
+        return None
+    first, second = kernel[:, col] / pivot, kernel[row]
+    if not numpy.allclose(numpy.outer(first, second), kernel, rtol=0, atol=tolerance * abs(pivot)):
+        return None
+    return first, second
+
+
+class ConvolutionFilter(TerrainFilter):
+    """Convolves the terrain with an arbitrary kernel."""
+    def __init__(self, kernel: numpy.ndarray, method=AUTO, block_rows=64, workers=1):
+        """Initialize the convolution filter.
+
+        :param kernel: 2D kernel, centred on its ``(rows // 2, cols // 2)`` element.
+        :param method: One of ``convolution.AUTO``, ``convolution.DIRECT`` or ``convolution.FFT``. Automatic selection
+        estimates the cost of each method from the kernel size.
+        :param block_rows: Number of rows processed at once by direct convolution.
+        :param workers: Number of threads processing blocks concurrently.
+        """
+        kernel = numpy.asarray(kernel, dtype=float)
+        if kernel.ndim != 2:
+            raise TypeError('Kernel must be 2-dimensional')
+        if method not in (AUTO, DIRECT, FFT):
+            raise TypeError('Method should be one of convolution.AUTO, convolution.DIRECT or convolution.FFT')
+        self.kernel = kernel
+        self.method = method
+        self.block_rows = block_rows
+        self.workers = workers
+        self._separated = separate(kernel)
+
+    def __call__(self, terrain: Terrain):
+        """Convolve the terrain.
+
+        :param terrain: Terrain object to filter.
+        :returns: new Terrain object."""
+        return Terrain(array=self.convolve(terrain._heightmap), copy=False)
+
+    def convolve(self, heights: numpy.ndarray):
+        """Convolve a heightmap with the kernel of this filter.
+
+        :param heights: 2D array to convolve.
+        :returns: new array."""
+        method = self.select_method(heights.shape)
+        logger.debug('Convolving %s terrain with a %s kernel through %s', heights.shape, self.kernel.shape, method)
+        if method == FFT:
+            return convolve_fft(heights, self.kernel)
+        if self._separated is not None:
+            first, second = self._separated
+            smoothed = convolve_axis(heights, second, 1, self.block_rows, self.workers)
+            return convolve_axis(smoothed, first, 0, self.block_rows, self.workers)
+        return convolve_direct(heights, self.kernel, self.block_rows, self.workers)
+
+    @property
+    def halo(self):
+        """Radius of the kernel."""
+        return max(self.kernel.shape) // 2
+
+    def select_method(self, shape: tuple):
+        """Method used to convolve a terrain of the given shape.
+
+        :param shape: Shape of the heightmap.
+        :returns: ``convolution.DIRECT`` or ``convolution.FFT``."""
+        if self.method != AUTO:
+            return self.method
+        krows, kcols = self.kernel.shape
+        direct = krows + kcols if self._separated is not None else numpy.count_nonzero(self.kernel)
+        return FFT if direct > FFT_COST * math.log2(shape[0] * shape[1]) else DIRECT
+
+
+class GaussianBlurFilter(ConvolutionFilter):
+    """Smooths the terrain with a Gaussian kernel."""
+    def __init__(self, sigma: float, truncate=4., method=AUTO, block_rows=64, workers=1):
+        """Initialize the Gaussian blur.
+
+        :param sigma: Standard deviation of the Gaussian, in cells.
+        :param truncate: Radius of the kernel, in standard deviations.
+        :param method: One of ``convolution.AUTO``, ``convolution.DIRECT`` or ``convolution.FFT``.
+        :param block_rows: Number of rows processed at once by direct convolution.
+        :param workers: Number of threads processing blocks concurrently.
+        """
+        self.sigma = sigma
+        radius = max(1, int(truncate * sigma + .5))
+        weights = numpy.exp(-.5 * (numpy.arange(-radius, radius + 1) / sigma) ** 2)
+        weights /= weights.sum()
+        super().__init__(numpy.outer(weights, weights), method, block_rows, workers)
+
+
+class BoxBlurFilter(ConvolutionFilter):
+    """Averages the terrain over square windows. Running sums make the cost independent of the window size."""
+    def __init__(self, radius: int, method=AUTO, block_rows=64, workers=1):
+        """Initialize the box blur.
+
+        :param radius: Number of cells on each side of the window, which is ``2 * radius + 1`` cells wide.
+        :param method: One of ``convolution.AUTO``, ``convolution.RUNNING_SUM``, ``convolution.DIRECT`` or
+        ``convolution.FFT``. Automatic selection always uses running sums.
+        :param block_rows: Number of rows processed at once.
+        :param workers: Number of threads processing blocks concurrently.
+        """
+        self.radius = max(0, int(radius))
+        size = 2 * self.radius + 1
+        weights = numpy.full(size, 1. / size)
+        super().__init__(numpy.outer(weights, weights), FFT if method == FFT else DIRECT, block_rows, workers)
+        self.method = RUNNING_SUM if method == AUTO else method
+
+    def convolve(self, heights: numpy.ndarray):
+        if self.method != RUNNING_SUM:
+            return super().convolve(heights)
+        smoothed = running_sum_axis(heights, self.radius, 1, self.block_rows, self.workers)
+        return running_sum_axis(smoothed, self.radius, 0, self.block_rows, self.workers)
+
+    def select_method(self, shape: tuple):
+        return self.method
+
+
+class UnsharpMaskFilter(GaussianBlurFilter):
+    """Sharpens the terrain by adding back the details removed by a Gaussian blur."""
+    def __init__(self, sigma: float, amount=1., truncate=4., method=AUTO, block_rows=64, workers=1):
+        """Initialize the unsharp mask.
+
+        :param sigma: Standard deviation of the Gaussian blur, in cells. Details smaller than this are enhanced.
+        :param amount: Strength of the sharpening.
+        :param truncate: Radius of the kernel, in standard deviations.
+        :param method: One of ``convolution.AUTO``, ``convolution.DIRECT`` or ``convolution.FFT``.
+        :param block_rows: Number of rows processed at once by direct convolution.
+        :param workers: Number of threads processing blocks concurrently.
+        """
+        super().__init__(sigma, truncate, method, block_rows, workers)
+        self.amount = amount
+
+    def convolve(self, heights: numpy.ndarray):
+        blurred = super().convolve(heights)
+        # heights + amount * (heights - blurred), computed in place in the blurred array
+        blurred -= heights
+        blurred *= -self.amount
+        blurred += heights
+        return blurred
+
+
+class BandPassFilter(GaussianBlurFilter):
+    """Keeps the features of the terrain between two scales, as a difference of Gaussians."""
+    def __init__(self, sigma_low: float, sigma_high: float, truncate=4., method=AUTO, block_rows=64, workers=1):
+        """Initialize the band-pass filter.
+
+        :param sigma_low: Standard deviation of the narrow Gaussian, in cells. Smaller features are removed.
+        :param sigma_high: Standard deviation of the wide Gaussian, in cells. Larger features are removed.
+        :param truncate: Radius of the kernels, in standard deviations.
+        :param method: One of ``convolution.AUTO``, ``convolution.DIRECT`` or ``convolution.FFT``.
+        :param block_rows: Number of rows processed at once by direct convolution.
+        :param workers: Number of threads processing blocks concurrently.
+        """
+        super().__init__(sigma_low, truncate, method, block_rows, workers)
+        self.wide = GaussianBlurFilter(sigma_high, truncate, method, block_rows, workers)
+
+    @property
+    def halo(self):
+        return max(super().halo, self.wide.halo)
+
+    def convolve(self, heights: numpy.ndarray):
+        narrow = super().convolve(heights)
+        narrow -= self.wide.convolve(heights)
+        return narrow
@@ -19,11 +19,14 @@ all other kind of goodies that elevate a terrain from 'just nice' to 'completely
 import logging
 
 import numpy
-import numexpr
 
+from ..lazy import lazy_import
 from ..terrain import Terrain
+from ..tiles import NORTH, NORTH_EAST, EAST, SOUTH_EAST, SOUTH, SOUTH_WEST, WEST, read_region, row_blocks, \
+    wrapped_block
 from .base import TerrainFilter
 
+numexpr = lazy_import('numexpr')
 logger = logging.getLogger(__name__)
 
 def north(matrix):
@@ -63,6 +66,59 @@ def sign(x, bias=0.001):
     return 0
 vsign = numpy.vectorize(sign)
 
+# Auxiliary maps erosion filters can output, see ``ErosionResult``
+SEDIMENT = 'sediment'
+WATER = 'water'
+DIFFERENCE = 'difference'
+EROSION = 'erosion'
+DEPOSITION = 'deposition'
+
+
+class ErosionResult:
+    """Output of ``run`` on an erosion filter: the eroded terrain, the auxiliary maps requested, and the number of
+    iterations run. Results belong to the caller, so one filter instance can run on several threads at once."""
+    def __init__(self, terrain: Terrain, maps: dict, iterations: int):
+        """Create an erosion result.
+
+        :param terrain: Eroded Terrain object.
+        :param maps: Dictionary of map name to array, holding the requested maps only.
+        :param iterations: Number of iterations run.
+        """
+        self.terrain = terrain
+        self.maps = maps
+        self.iterations = iterations
+
+    def __getitem__(self, name: str):
+        return self.maps[name]
+
+    def __repr__(self):
+        return 'ErosionResult({}, maps={}, iterations={})'.format(self.terrain, sorted(self.maps), self.iterations)
+
+
+def _output_maps(outputs, names: tuple, shape: tuple):
+    """Zeroed arrays of the maps requested from an erosion filter, allocating those not given a buffer. Should not be
+    called directly.
+
+    :param outputs: Iterable of map names, or dictionary of map name to floating point array or None.
+    :param names: Names of the maps the filter can output.
+    :param shape: Shape of the terrain.
+    :returns: dictionary of map name to array."""
+    if not isinstance(outputs, dict):
+        outputs = dict.fromkeys(outputs or ())
+    maps = {}
+    for name, buffer in outputs.items():
+        if name not in names:
+            raise TypeError('Unknown map {!r}, expected one of {}'.format(name, ', '.join(names)))
+        if buffer is None:
+            buffer = numpy.zeros(shape)
+        elif buffer.shape != shape or not numpy.issubdtype(buffer.dtype, numpy.floating):
+            raise TypeError('Map {!r} should be a floating point array of shape {}'.format(name, shape))
+        else:
+            buffer[...] = 0.
+        maps[name] = buffer
+    return maps
+
+
 class HydraulicErosionFilter(TerrainFilter):
     """Hydraulic erosion occurs when the motion of water against a rock surface produces mechanical
     weathering. Most generally, it is the ability of moving water (flowing or waves) to dislodge and transport rock
@@ -91,21 +147,37 @@ class HydraulicErosionFilter(TerrainFilter):
         self.evaporation = max(0.01, min(1., evaporation))
         self.capacity = max(0.01, min(1., capacity))
 
-    def __call__(self, terrain: Terrain):
-        """Runs the erosion algorithm with the input Terrain object.
+    OUTPUTS = (SEDIMENT, WATER, DIFFERENCE)
 
-        Additional data is available once the simulation has run:
-        - A difference map ``HydraulicErosionFilter.difference_map`` tracks the changes from original to eroded
-        - A sediment map ``HydraulicErosionFilter.sediment_map`` shows where sediment has been deposited
-        - A water map ``HydraulicErosionFilter.water_map`` shows where water has flowed
+    def __call__(self, terrain: Terrain, water: numpy.ndarray = None):
+        """Runs the erosion algorithm with the input Terrain object.
 
         :param terrain: Terrain object to apply erosion to.
+        :param water: Optional initial water distribution, for instance a scaled down ``FlowAccumulationReader``
+        output. Defaults to a dry terrain.
         :returns: new Terrain object with erosion applied"""
-        h = numpy.array(terrain._heightmap)
+        return self.run(terrain, water).terrain
+
+    def run(self, terrain: Terrain, water: numpy.ndarray = None, outputs=None):
+        """Runs the erosion algorithm, optionally returning auxiliary maps:
+        - ``erosion.SEDIMENT`` shows where sediment is still carried by water
+        - ``erosion.WATER`` shows where water has flowed
+        - ``erosion.DIFFERENCE`` tracks the changes from original to eroded
+
+        The sediment and water maps are simulated anyway, so given buffers are used in place of the internal arrays.
+
+        :param terrain: Terrain object to apply erosion to.
+        :param water: Optional initial water distribution, see ``HydraulicErosionFilter.__call__``.
+        :param outputs: Names of the maps to return, or dictionary of map name to a floating point array of the shape
+        of the terrain receiving the map, or None to allocate it.
+        :returns: ``ErosionResult`` instance."""
+        h = numpy.array(terrain._heightmap, dtype=float)
         shape = h.shape
-        difference = numpy.zeros(shape)
-        m = numpy.zeros(shape)
-        w = numpy.zeros(shape)
+        maps = _output_maps(outputs, self.OUTPUTS, shape)
+        m = maps[SEDIMENT] if SEDIMENT in maps else numpy.zeros(shape)
+        w = maps[WATER] if WATER in maps else numpy.zeros(shape)
+        if water is not None:
+            w[...] = water
 
         nsew = (north,east,south,west)
 
@@ -116,57 +188,87 @@ class HydraulicErosionFilter(TerrainFilter):
             w += self.rainfall
 
             # Step 2: erosion
-            h -= self.solubility
-            m += self.solubility
+            dissolved = self.solubility * w
+            h -= dissolved
+            m += dissolved
 
             # Step 3: movement
             a = numpy.add(w, h)
-            avg_a = numpy.divide(numpy.sum([dir(a) for dir in nsew]), 4.0)
+            avg_a = numpy.divide(sum(dir(a) for dir in nsew), 4.0)
             delta_a = numpy.subtract(a, avg_a)
 
-            d_i = [(a - dir(a)) for dir in nsew]
-            d_tot = numpy.sum(numpy.where(numexpr.evaluate('d_i > 0'), d_i, 0), 2)
-
-            delta_mi = []
-            for i in range(4):
-                d = d_i[i]
-                delta_wi = numpy.multiply(numpy.divide(d, d_tot), numpy.min(w, delta_a))
-                delta_mi.append(numpy.multiply(m, numpy.divide(delta_wi, w)))
-
+            d_i = [(a - dir(a)).clip(0., None) for dir in nsew]
+            d_tot = sum(d_i)
+            moving = numexpr.evaluate('d_tot > 0')
+            delta_w = numpy.minimum(w, delta_a).clip(0., None)
+            share = numpy.divide(delta_w, d_tot, out=numpy.zeros(shape), where=moving)
+            carried = numpy.divide(m, w, out=numpy.zeros(shape), where=w > 0)
+
+            delta_wi = [d * share for d in d_i]
+            delta_mi = [d * carried for d in delta_wi]
+            w -= sum(delta_wi)
+            m -= sum(delta_mi)
             for i in range(4):
                 dir = nsew[i]
+                w += dir(delta_wi[(i+2)%4])
                 m += dir(delta_mi[(i+2)%4])
 
             # Step 4: evaporation
             w *= 1 - self.evaporation
-            difference = numpy.maximum(self.capacity - m, numpy.zeros(shape))
+            difference = numpy.maximum(m - self.capacity * w, 0.)
             m -= difference
             h += difference
 
-        self.sediments_map = m
-        self.water_map = w
-        self.difference_map = difference
+        if DIFFERENCE in maps:
+            numpy.subtract(h, terrain._heightmap, out=maps[DIFFERENCE])
+        return ErosionResult(Terrain(array=h, copy=False), maps, self.iterations)
 
-        new_terrain = Terrain(terrain.size)
-        new_terrain._heightmap = h.tolist()
-        return new_terrain
+    @property
+    def halo(self):
+        """Water reaches the neighbours of its cell at every iteration, and carries the sediment of cells up to two
+        cells away."""
+        return 2 * self.iterations
 
 
 class ThermalErosionFilter(TerrainFilter):
     """Thermal weathering is caused by temperature changes causing small portions of the material to crumble and pile
     up on the bottom of an incline. The thermal weathering erosion ends the slopes of uniform angles.
 
+    By default the algorithm runs a fixed number of iterations. Given a tolerance, it stops as soon as no height
+    changes by more than the tolerance in an iteration, and ``ThermalErosionFilter.run`` tells the number of
+    iterations actually run. Settled parts of the terrain can then also be skipped: the terrain is
+    split into square blocks, and only the blocks still changing, and their neighbours, are eroded again. Blocks which
+    changed by less than the tolerance are frozen, so the small changes they would still have undergone are dropped.
+
     Source: http://old.cescg.org/CESCG97/marak/node11.html"""
-    def __init__(self, iterations: int, power=.5, talus=1.):
+    DIRECTIONS = (NORTH, NORTH_EAST, EAST, SOUTH_EAST, SOUTH, SOUTH_WEST, WEST)
+    OUTPUTS = (EROSION, DEPOSITION, DIFFERENCE)
+
+    def __init__(self, iterations: int, power=.5, talus=1., tolerance=None, active_mask=False, deposit=False,
+                 block_size=64):
         """Initialize the thermal erosion algorithm.
 
-        :param iterations: Number of successive times the algorithm will be run. The more, the better.
+        :param iterations: Number of successive times the algorithm will be run. The more, the better. With a
+        tolerance, this is the maximum number of iterations.
         :param power: Amount of soil falling downhill.
         :param talus: Critical angle over which soil will fall.
+        :param tolerance: Stop once the largest height change of an iteration falls below this value. Defaults to
+        always running all iterations.
+        :param active_mask: Only erode the blocks which changed by more than the tolerance at the previous iteration,
+        and their neighbours. Changes below the tolerance in the other blocks are dropped. Requires a tolerance.
+        :param deposit: Pile the fallen soil up on the lower neighbours instead of removing it, which conserves the
+        total volume of the terrain.
+        :param block_size: Side length of the blocks tracked by the active mask.
         """
+        if active_mask and tolerance is None:
+            raise TypeError('The active mask needs a tolerance to tell settled blocks apart')
         self.talus = talus / 1000.
         self.iterations = max(10, iterations)
         self.erosion = max(.01, min(1., power))
+        self.tolerance = tolerance
+        self.active_mask = active_mask
+        self.deposit = deposit
+        self.block_size = max(2, int(block_size))
 
     def __call__(self, terrain: Terrain):
         """Runs the algorithm over the input Terrain object.
@@ -174,30 +276,236 @@ class ThermalErosionFilter(TerrainFilter):
         :param terrain: Terrain object to be eroded.
         :returns: new Terrain object with eroded terrain.
         """
-        heights = numpy.array(terrain._heightmap)
-        for i in range(self.iterations):
-            logger.info('Thermal erosion %.1f%%', 100*i/self.iterations)
-            heights = self.erode_once(heights)
+        return self.run(terrain).terrain
+
+    def run(self, terrain: Terrain, outputs=None):
+        """Runs the algorithm, optionally returning auxiliary maps:
+        - ``erosion.EROSION`` holds the total amount of soil which fell from each cell
+        - ``erosion.DEPOSITION`` holds the total amount of soil which fell onto each cell, even when it is not
+        deposited on the terrain
+        - ``erosion.DIFFERENCE`` tracks the changes from original to eroded
+
+        Maps which are not requested are not computed.
 
-        return Terrain(array=heights)
+        :param terrain: Terrain object to be eroded.
+        :param outputs: Names of the maps to return, or dictionary of map name to a floating point array of the shape
+        of the terrain receiving the map, or None to allocate it.
+        :returns: ``ErosionResult`` instance."""
+        heights = numpy.array(terrain._heightmap, dtype=float)
+        maps = _output_maps(outputs, self.OUTPUTS, heights.shape)
+        erosion, deposition = maps.get(EROSION), maps.get(DEPOSITION)
+        if self.active_mask:
+            iterations = self._erode_active(heights, erosion, deposition)
+        else:
+            gains = self.deposit or deposition is not None
+            halo = 2 if gains else 1
+            work = self._workspace(heights.shape, halo, gains)
+            for i in range(self.iterations):
+                logger.info('Thermal erosion %.1f%%', 100*i/self.iterations)
+                block = wrapped_block(heights, 0, heights.shape[0], halo, out=work['block'])
+                loss, gain = self._transfers(block, halo, gains, work)
+                settled = self.tolerance is not None and self._largest_change(loss, gain, work) < self.tolerance
+                heights -= loss
+                if self.deposit:
+                    heights += gain
+                if erosion is not None:
+                    erosion += loss
+                if deposition is not None:
+                    deposition += gain
+                if settled:
+                    break
+            iterations = i + 1
+        if self.tolerance is not None:
+            logger.info('Thermal erosion settled after %i iterations', iterations)
+        if DIFFERENCE in maps:
+            numpy.subtract(heights, terrain._heightmap, out=maps[DIFFERENCE])
+        return ErosionResult(Terrain(array=heights, copy=False), maps, iterations)
+
+    @property
+    def halo(self):
+        """Soil only falls to the direct neighbours of a cell at every iteration, and reaches the neighbours of these
+        when deposited. Early exit makes the result depend on the whole terrain."""
+        if self.tolerance is not None:
+            return None
+        return self.iterations * (2 if self.deposit else 1)
 
     def erode_once(self, heights: numpy.ndarray):
         """Erode once. Should not be called directly.
 
         :param heights: 2D numpy array containing the heights of the terrain at each grid point."""
-        nsew = [(heights - x(heights)).clip(0., 1.) for x in (north, north_east, east, south_east, south, south_west, west)]
-        nsew = [(x - x.clip(-self.talus, self.talus)) for x in nsew]
-        
-        arr = heights - sum(nsew) * (self.erosion / 8.0)
+        halo = 2 if self.deposit else 1
+        loss, gain = self._transfers(wrapped_block(heights, 0, heights.shape[0], halo), halo, self.deposit)
+        arr = heights - loss
+        if gain is not None:
+            arr += gain
         return arr
 
+    def _workspace(self, shape: tuple, halo: int, gains: bool):
+        """Buffers reused by every iteration on a terrain of the given shape, see ``_transfers``. Should not be called
+        directly."""
+        rows, cols = shape
+        return {'block': numpy.empty((rows + 2 * halo, cols + 2 * halo)),
+                'moved': numpy.empty((rows + 2 * halo - 2, cols + 2 * halo - 2)),
+                'loss': numpy.empty(shape), 'gain': numpy.empty(shape) if gains else None}
+
+    def _transfers(self, block: numpy.ndarray, halo: int, gains: bool, work=None):
+        """Soil lost and, if ``gains`` is set, gained by the cells of a block padded by ``halo`` cells, 2 for gains,
+        during one iteration. Should not be called directly.
+
+        :param work: Buffers returned by ``_workspace`` for the shape of the block, allocated if not given. The
+        returned arrays are buffers of the workspace."""
+        rows, cols = block.shape[0] - 2 * halo, block.shape[1] - 2 * halo
+        work = work or self._workspace((rows, cols), halo, gains)
+        loss, gain, moved = work['loss'], work['gain'] if gains else None, work['moved']
+        margin = halo - 1
+        # Soil leaving each cell towards each neighbour, computed on the block but its outermost ring. With drops
+        # clipped to [0, 1], ``drop - drop.clip(-talus, talus)`` is ``max(min(drop, 1) - talus, 0)``.
+        centre = block[1:-1, 1:-1]
+        for index, (drow, dcol) in enumerate(self.DIRECTIONS):
+            numpy.subtract(centre, block[1 + drow:block.shape[0] - 1 + drow, 1 + dcol:block.shape[1] - 1 + dcol],
+                           out=moved)
+            numpy.minimum(moved, 1., out=moved)
+            moved -= self.talus
+            numpy.maximum(moved, 0., out=moved)
+            # A cell receives the soil its neighbour at the opposite offset sends towards it
+            for total, (top, left) in ((loss, (margin, margin)), (gain, (1 - drow, 1 - dcol))):
+                if total is None:
+                    continue
+                if index:
+                    total += moved[top:top + rows, left:left + cols]
+                else:
+                    total[...] = moved[top:top + rows, left:left + cols]
+        loss *= self.erosion / 8.0
+        if gain is not None:
+            gain *= self.erosion / 8.0
+        return loss, gain
+
+    def _largest_change(self, loss: numpy.ndarray, gain: numpy.ndarray, work: dict):
+        """Largest height change of an iteration, computed in the workspace. Should not be called directly."""
+        if not self.deposit:
+            return loss.max()
+        change = numpy.subtract(gain, loss, out=work['moved'][:loss.shape[0], :loss.shape[1]])
+        return max(change.max(), -change.min())
+
+    def _erode_active(self, heights: numpy.ndarray, erosion: numpy.ndarray, deposition: numpy.ndarray):
+        """Erodes, in place, the blocks still changing until none changes by more than the tolerance, adding the soil
+        lost and gained to the erosion and deposition maps if any. Should not be called directly.
+
+        :returns: the number of iterations run."""
+        gains = self.deposit or deposition is not None
+        halo = 2 if gains else 1
+        row_ranges = row_blocks(heights.shape[0], self.block_size)
+        col_ranges = row_blocks(heights.shape[1], self.block_size)
+        active = numpy.ones((len(row_ranges), len(col_ranges)), dtype=bool)
+        for i in range(self.iterations):
+            logger.info('Thermal erosion %.1f%%, %i active blocks', 100*i/self.iterations, numpy.count_nonzero(active))
+            changes = []
+            moving = numpy.zeros_like(active)
+            for block_row, block_col in zip(*numpy.nonzero(active)):
+                (top, bottom), (left, right) = row_ranges[block_row], col_ranges[block_col]
+                block = read_region(heights, (top - halo, left - halo, bottom + halo, right + halo))
+                loss, gain = self._transfers(block, halo, gains)
+                change = gain - loss if self.deposit else -loss
+                changes.append((top, bottom, left, right, change, loss, gain))
+                moving[block_row, block_col] = numpy.abs(change).max() >= self.tolerance
+            # All blocks read the heights of the previous iteration before any is updated
+            for top, bottom, left, right, change, loss, gain in changes:
+                heights[top:bottom, left:right] += change
+                if erosion is not None:
+                    erosion[top:bottom, left:right] += loss
+                if deposition is not None:
+                    deposition[top:bottom, left:right] += gain
+            if not moving.any():
+                break
+            # Blocks are larger than the halo, so changes only reach the direct neighbours of moving blocks
+            active = moving.copy()
+            for offset in ((1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (1, -1), (-1, 1), (-1, -1)):
+                active |= numpy.roll(moving, offset, (0, 1))
+        return i + 1
+
 
 class StrataErosionFilter(TerrainFilter):
-
-    def __init__(self, number=5.0):
+    """Strata are layers of sedimentary rock of varying hardness. Soft layers erode faster than the hard ones above
+    them, carving the landscape into terraces of flat benches and steep risers.
+
+    Heights are remapped onto ``number`` layers with a smooth step profile whose steepness depends on the hardness of
+    each layer. Layer boundaries are warped by a tileable noise so that they do not follow contour lines exactly.
+
+    The whole remapping is evaluated block by block with numexpr, costing about as much as one elementwise pass."""
+    WAVES = 4
+
+    def __init__(self, number=5.0, hardness=None, sharpness=4., warp=0., seed=None, in_place=False, block_rows=64):
+        """Initialize the strata filter.
+
+        :param number: Number of layers between the lowest and the highest point of the terrain.
+        :param hardness: Sequence of hardness factors, cycled through the layers from the bottom. Harder layers form
+        sharper cliffs. Defaults to all layers being equally hard.
+        :param sharpness: Steepness of the steps, 1 leaves the terrain untouched, higher values give flatter benches
+        and steeper risers.
+        :param warp: Amplitude of the noise warping the layer boundaries, in layers.
+        :param seed: Seed of the warping noise, passed down to ``numpy.random.RandomState``.
+        :param in_place: Write the result into the input terrain instead of a new one.
+        :param block_rows: Number of rows processed at once.
+        """
         self.levels = float(max(2., number))
+        self.hardness = numpy.ones(1) if hardness is None else numpy.maximum(numpy.ravel(hardness), .01)
+        self.sharpness = max(1., sharpness)
+        self.warp = warp
+        self.in_place = in_place
+        self.block_rows = block_rows
 
-    def __call__(self, terrain: Terrain):
-        heights = numpy.multiply(terrain._heightmap, self.levels)
+        # Waves with integer frequencies tile with the terrain, as its indexing wraps around
+        rng = numpy.random.RandomState(seed)
+        self._frequencies = rng.randint(1, 9, (self.WAVES, 2))
+        self._phases = rng.uniform(0, 2 * numpy.pi, self.WAVES)
 
-        return Terrain(array=heights)
\ No newline at end of file
+    def __call__(self, terrain: Terrain):
+        """Terrace the terrain.
+
+        :param terrain: Terrain object to terrace.
+        :returns: Terrain object with strata applied, the input terrain itself when filtering in place."""
+        heights = terrain._heightmap
+        rows, cols = heights.shape
+        low, high = float(heights.min()), float(heights.max())
+        scale = self.levels / (high - low) if high > low else 0.
+        out = heights if self.in_place else numpy.empty((rows, cols))
+        if self.in_place and not numpy.issubdtype(heights.dtype, numpy.floating):
+            raise TypeError('Strata can only be applied in place on floating point terrains')
+
+        waves_x = self._waves(cols, 0)
+        for start, stop in row_blocks(rows, self.block_rows):
+            h = heights[start:stop]
+            noise = self._noise(waves_x, self._waves(rows, 1, start, stop))
+            t = numexpr.evaluate('(h - low) * scale + noise')
+            layer = numexpr.evaluate('floor(t)')
+            if len(self.hardness) == 1:
+                exponent = self.sharpness * self.hardness[0]
+            else:
+                exponent = self.sharpness * numpy.take(self.hardness, layer.astype(int), mode='wrap')
+            # f ** e / (f ** e + (1 - f) ** e) with a single power, where f is the position within the layer
+            expression = 'low + (layer + 1 / (1 + ((1 - (t - layer)) / (t - layer)) ** exponent) - noise) / scale'
+            with numpy.errstate(divide='ignore'):
+                numexpr.evaluate(expression if scale else 'h', out=out[start:stop])
+
+        if self.in_place:
+            return terrain
+        return Terrain(array=out, copy=False)
+
+    def _waves(self, length: int, axis: int, start=0, stop=None):
+        """Sines and cosines of the warping waves along one axis, with shape ``(2, WAVES, positions)``. Should not be
+        called directly."""
+        angles = numpy.arange(start, length if stop is None else stop) * (2 * numpy.pi / length)
+        angles = self._frequencies[:, axis, None] * angles[None, :]
+        if axis == 1:
+            angles += self._phases[:, None]
+        return numpy.stack((numpy.sin(angles), numpy.cos(angles)))
+
+    def _noise(self, waves_x: numpy.ndarray, waves_y: numpy.ndarray):
+        """Tileable warping noise, in layers. Each wave ``sin(x + y)`` is expanded into products of sines and cosines
+        of each axis, sparing transcendental functions per cell. Should not be called directly."""
+        if not self.warp:
+            return numpy.zeros((waves_y.shape[2], 1))
+        amplitude = self.warp / numpy.sqrt(self.WAVES / 2.)
+        sin_x, cos_x = waves_x * amplitude
+        sin_y, cos_y = waves_y
+        return numpy.dot(cos_y.T, sin_x) + numpy.dot(sin_y.T, cos_x)
@@ -0,0 +1,101 @@
+"""Multi-resolution filtering. Erosion moves material by one cell per iteration, so shaping large features takes
+thousands of iterations on large terrains. Running the filter on a downsampled terrain first, and only refining the
+result at each finer resolution, gets the large-scale shapes in a fraction of the time."""
+# TerrainLib - A fast terrain generation library
+# Copyright © 2018  Nathan "SolarLiner" Graule
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import logging
+
+import numpy
+
+from ..terrain import Terrain
+from .base import TerrainFilter
+from .resample import AREA, BILINEAR, resample
+
+logger = logging.getLogger(__name__)
+
+
+def downsample(heights: numpy.ndarray, factor=2):
+    """Average blocks of ``factor`` by ``factor`` cells, wrapping around the grid when the size is not a multiple of
+    the factor.
+
+    :param heights: 2D array to downsample.
+    :param factor: Number of cells averaged along each axis.
+    :returns: new array of ``ceil(rows / factor), ceil(columns / factor)`` cells."""
+    rows, cols = heights.shape
+    return resample(heights, (-(-rows // factor), -(-cols // factor)), AREA, wrap=True, scale=factor)
+
+
+def upsample(heights: numpy.ndarray, shape: tuple, factor=2):
+    """Bilinear interpolation of a downsampled array back to its original shape, wrapping around the grid.
+
+    :param heights: 2D array returned by :func:`downsample`.
+    :param shape: ``(rows, columns)`` of the original array.
+    :param factor: Factor the array was downsampled by.
+    :returns: new array of the given shape."""
+    return resample(heights, shape, BILINEAR, wrap=True, scale=1 / factor)
+
+
+class MultiResolutionFilter(TerrainFilter):
+    """Runs a filter coarse-to-fine. The terrain is repeatedly halved in size; the filter runs on the smallest terrain,
+    then the changes it made are upsampled and added to the terrain of the next resolution, which keeps its own fine
+    details, and a refining filter (typically the same erosion with few iterations) cleans up every finer resolution.
+
+    Heights are divided by the cell size of each resolution, so that slopes, and thus talus angles, are the same at all
+    resolutions. Thermal erosion moves soil by one cell per iteration whatever the resolution, so the coarse filter
+    needs about half the iterations of the full resolution filter for every halving. ``benchmarks/multiresolution.py``
+    compares both in time and quality."""
+    def __init__(self, coarse: TerrainFilter, refine: TerrainFilter = None, levels=3, scale_heights=True,
+                 min_size=16):
+        """Initialize a multi-resolution filter.
+
+        :param coarse: Filter applied on the smallest terrain.
+        :param refine: Optional filter applied at every finer resolution, including the full one.
+        :param levels: Number of resolutions, including the full one. 1 simply runs the coarse filter.
+        :param scale_heights: Divide heights by the cell size of each resolution, which keeps slopes unchanged.
+        :param min_size: Terrains are not halved below this number of cells along either side.
+        """
+        if levels < 1:
+            raise TypeError('There should be at least one level')
+        self.coarse = coarse
+        self.refine = refine
+        self.levels = int(levels)
+        self.scale_heights = scale_heights
+        self.min_size = min_size
+
+    def __call__(self, terrain: Terrain):
+        """Filter the terrain coarse-to-fine.
+
+        :param terrain: Terrain object to filter.
+        :returns: new Terrain object."""
+        pyramid = [numpy.asarray(terrain._heightmap, dtype=float)]
+        while len(pyramid) < self.levels and min(pyramid[-1].shape) >= 2 * self.min_size:
+            pyramid.append(downsample(pyramid[-1]))
+        levels = len(pyramid)
+        logger.info('Multi-resolution filtering over %i levels, from %s cells', levels, pyramid[-1].shape)
+
+        heights = self._filter(self.coarse, pyramid[-1], levels - 1)
+        for level in range(levels - 2, -1, -1):
+            # Only the changes made at the coarser level are upsampled, fine details are kept as they are
+            heights = pyramid[level] + upsample(heights - pyramid[level + 1], pyramid[level].shape)
+            if self.refine is not None:
+                heights = self._filter(self.refine, heights, level)
+        return Terrain(array=heights, copy=False)
+
+    def _filter(self, filt: TerrainFilter, heights: numpy.ndarray, level: int):
+        """Applies a filter at a level of the pyramid, with heights scaled to keep slopes. Should not be called
+        directly."""
+        scale = 2 ** level if self.scale_heights else 1
+        return filt(Terrain(array=heights / scale, copy=False))._heightmap * scale
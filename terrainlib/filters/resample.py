@@ -0,0 +1,162 @@
+"""Resampling changes the resolution of terrains, for instance between design and production grids. Resampling is
+separable: weights are computed once per output row and column, then applied along each axis in blocks of rows, in
+double precision."""
+# TerrainLib - A fast terrain generation library
+# Copyright © 2018  Nathan "SolarLiner" Graule
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import logging
+import math
+
+import numpy
+
+from ..terrain import Terrain
+from ..tiles import map_blocks
+from .base import TerrainFilter
+
+logger = logging.getLogger(__name__)
+
+AREA = 'area'
+BILINEAR = 'bilinear'
+BICUBIC = 'bicubic'
+LANCZOS = 'lanczos'
+
+
+def _triangle(x: numpy.ndarray):
+    """Bilinear kernel. Should not be called directly."""
+    return numpy.maximum(0., 1. - numpy.abs(x))
+
+
+def _cubic(x: numpy.ndarray):
+    """Keys cubic convolution kernel, with ``a = -0.5``. Should not be called directly."""
+    x = numpy.abs(x)
+    return numpy.where(x <= 1, (1.5 * x - 2.5) * x * x + 1,
+                       numpy.where(x < 2, ((-.5 * x + 2.5) * x - 4) * x + 2, 0.))
+
+
+def _lanczos(x: numpy.ndarray):
+    """Lanczos kernel with three lobes. Should not be called directly."""
+    return numpy.where(numpy.abs(x) < 3, numpy.sinc(x) * numpy.sinc(x / 3), 0.)
+
+
+# Kernel and radius, in input cells when upsampling, of each interpolating mode
+KERNELS = {BILINEAR: (_triangle, 1), BICUBIC: (_cubic, 2), LANCZOS: (_lanczos, 3)}
+
+
+def resample_weights(size: int, out_size: int, mode=BICUBIC, wrap=False, scale=None):
+    """Input cells and weights of every output cell, along one axis.
+
+    Cell centres are aligned, output cell ``i`` being centred on input coordinate ``(i + .5) * scale - .5``. When
+    downsampling, interpolating kernels are stretched by the scale so that they filter out frequencies the output
+    cannot hold.
+
+    :param size: Number of input cells.
+    :param out_size: Number of output cells.
+    :param mode: One of ``resample.AREA``, ``resample.BILINEAR``, ``resample.BICUBIC`` or ``resample.LANCZOS``.
+    :param wrap: Wrap around the edges, instead of repeating the edge cells.
+    :param scale: Input cells per output cell. Defaults to ``size / out_size``.
+    :returns: ``(indices, weights)`` arrays of shape ``(out_size, taps)``, weights of each output cell summing to 1."""
+    scale = size / out_size if scale is None else scale
+    out = numpy.arange(out_size, dtype=float)
+    if mode == AREA:
+        # Output cells cover [i * scale, (i + 1) * scale), weighted by their overlap with input cells
+        low, high = out * scale, (out + 1) * scale
+        first = numpy.floor(low).astype(int)
+        indices = first[:, None] + numpy.arange(math.ceil(scale) + 1)
+        weights = numpy.clip(numpy.minimum(indices + 1, high[:, None]) - numpy.maximum(indices, low[:, None]), 0, None)
+    elif mode in KERNELS:
+        kernel, radius = KERNELS[mode]
+        stretch = max(scale, 1.)
+        centre = (out + .5) * scale - .5
+        first = numpy.floor(centre - radius * stretch).astype(int) + 1
+        indices = first[:, None] + numpy.arange(math.ceil(2 * radius * stretch))
+        weights = kernel((indices - centre[:, None]) / stretch)
+    else:
+        raise TypeError('Mode should be one of resample.AREA, resample.BILINEAR, resample.BICUBIC or resample.LANCZOS')
+    weights /= weights.sum(axis=1, keepdims=True)
+    indices = indices % size if wrap else numpy.clip(indices, 0, size - 1)
+    return indices, weights
+
+
+def resample(heights: numpy.ndarray, shape: tuple, mode=BICUBIC, wrap=False, scale=None, block_rows=64, workers=1):
+    """Resample a heightmap to another shape.
+
+    Blocks of output rows only read the input rows they need, so the input may be memory-mapped.
+
+    :param heights: 2D array to resample.
+    :param shape: ``(rows, columns)`` of the output.
+    :param mode: Resampling mode, see ``resample_weights``.
+    :param wrap: Wrap around the edges, instead of repeating the edge cells.
+    :param scale: Input cells per output cell, the same along both axes. Defaults to the ratio of the shapes.
+    :param block_rows: Number of output rows computed at once.
+    :param workers: Number of threads processing blocks concurrently.
+    :returns: new array of the given shape."""
+    rows, cols = heights.shape
+    out_rows, out_cols = shape
+    row_indices, row_weights = resample_weights(rows, out_rows, mode, wrap, scale)
+    col_indices, col_weights = resample_weights(cols, out_cols, mode, wrap, scale)
+    out = numpy.empty(shape)
+
+    def resample_block(start, stop):
+        indices, weights = row_indices[start:stop], row_weights[start:stop]
+        needed, local = numpy.unique(indices, return_inverse=True)
+        local = local.reshape(indices.shape)
+        source = numpy.asarray(heights[needed], dtype=float)
+        # Columns first: the rows needed by the block are resampled once, whatever the number of taps reading them
+        narrowed = col_weights[:, 0] * source[:, col_indices[:, 0]]
+        for k in range(1, col_indices.shape[1]):
+            narrowed += col_weights[:, k] * source[:, col_indices[:, k]]
+        block = out[start:stop]
+        numpy.multiply(weights[:, 0, None], narrowed[local[:, 0]], out=block)
+        for k in range(1, indices.shape[1]):
+            block += weights[:, k, None] * narrowed[local[:, k]]
+
+    map_blocks(resample_block, out_rows, block_rows, workers)
+    return out
+
+
+class ResampleFilter(TerrainFilter):
+    """Changes the resolution of the terrain. Area averaging suits downsampling; bilinear, bicubic and Lanczos
+    interpolation, from smoothest to sharpest, suit both directions. Cubic and Lanczos kernels may overshoot slightly
+    around sharp features.
+
+    Heights are kept as they are: resampling to a finer grid makes slopes steeper per cell, divide heights by the
+    scale to keep them, as ``MultiResolutionFilter`` does."""
+    def __init__(self, shape, mode=BICUBIC, wrap=False, block_rows=64, workers=1):
+        """Initialize the resampling filter.
+
+        :param shape: Side length, or ``(rows, columns)`` tuple, of the resampled terrains.
+        :param mode: One of ``resample.AREA``, ``resample.BILINEAR``, ``resample.BICUBIC`` or ``resample.LANCZOS``.
+        :param wrap: Wrap around the edges, for tiling terrains, instead of repeating the edge cells.
+        :param block_rows: Number of output rows computed at once.
+        :param workers: Number of threads processing blocks concurrently.
+        """
+        if mode != AREA and mode not in KERNELS:
+            raise TypeError('Mode should be one of resample.AREA, resample.BILINEAR, resample.BICUBIC or '
+                            'resample.LANCZOS')
+        self.shape = tuple(shape) if isinstance(shape, (tuple, list)) else (shape, shape)
+        self.mode = mode
+        self.wrap = wrap
+        self.block_rows = block_rows
+        self.workers = workers
+
+    def __call__(self, terrain: Terrain):
+        """Resample the terrain.
+
+        :param terrain: Terrain object to resample.
+        :returns: new Terrain object of the filter shape."""
+        heights = terrain._heightmap
+        logger.debug('Resampling %s terrain to %s through %s', heights.shape, self.shape, self.mode)
+        return Terrain(array=resample(heights, self.shape, self.mode, self.wrap, block_rows=self.block_rows,
+                                      workers=self.workers), copy=False)
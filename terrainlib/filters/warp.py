@@ -0,0 +1,147 @@
+"""Domain warping displaces every cell of a terrain by a smooth random field, breaking up the straight lines and grid
+artefacts of procedural generators. Displacements wrap around the terrain, so warped terrains still tile."""
+# TerrainLib - A fast terrain generation library
+# Copyright © 2018  Nathan "SolarLiner" Graule
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import logging
+import math
+
+import numpy
+
+from ..terrain import Terrain
+from ..tiles import map_blocks
+from .base import TerrainFilter
+
+logger = logging.getLogger(__name__)
+
+
+def displacement_field(shape: tuple, amplitude: float, waves=16, frequency=8, seed=None):
+    """Smooth random displacement field made of a sum of plane waves. Waves have integer frequencies, so the field
+    tiles with the terrain.
+
+    :param shape: ``(rows, columns)`` of the terrain.
+    :param amplitude: RMS displacement, in cells.
+    :param waves: Number of waves summed for each axis.
+    :param frequency: Highest number of periods of a wave across the terrain. Higher values give finer distortions.
+    :param seed: Seed of the waves, passed down to ``numpy.random.RandomState``.
+    :returns: array of shape ``(2, rows, columns)`` holding the row and column displacements of every cell."""
+    rng = numpy.random.RandomState(seed)
+    rows, cols = shape
+    row_angles = numpy.arange(rows) * (2 * math.pi / rows)
+    col_angles = numpy.arange(cols) * (2 * math.pi / cols)
+    field = numpy.zeros((2, rows, cols))
+    for axis in range(2):
+        row_frequencies = rng.randint(1, frequency + 1, waves)
+        col_frequencies = rng.randint(-frequency, frequency + 1, waves)
+        phases = rng.uniform(0, 2 * math.pi, waves)
+        for row_frequency, col_frequency, phase in zip(row_frequencies, col_frequencies, phases):
+            # sin(a + b) as a sum of two outer products, which costs one multiply-add per cell
+            a = row_frequency * row_angles + phase
+            b = col_frequency * col_angles
+            field[axis] += numpy.outer(numpy.sin(a), numpy.cos(b))
+            field[axis] += numpy.outer(numpy.cos(a), numpy.sin(b))
+    # Each wave has a variance of one half
+    field *= amplitude / math.sqrt(waves / 2)
+    return field
+
+
+class WarpFilter(TerrainFilter):
+    """Moves every cell of the terrain by a displacement field, reading heights at the displaced positions with bilinear
+    interpolation and wrapping around the terrain, like float indexing of ``Terrain`` objects.
+
+    The sampling positions and weights are computed once per terrain shape and cached, about 12 bytes per cell, so
+    warping many terrains with the same field only costs the interpolation."""
+    def __init__(self, amplitude=4., waves=16, frequency=8, seed=None, field: numpy.ndarray = None, block_rows=64,
+                 workers=1):
+        """Initialize the warp filter.
+
+        :param amplitude: RMS displacement of the random field, in cells.
+        :param waves: Number of waves of the random field, see ``displacement_field``.
+        :param frequency: Highest frequency of the random field, see ``displacement_field``.
+        :param seed: Seed of the random field.
+        :param field: Explicit displacement field of shape ``(2, rows, columns)``, in cells, used instead of a random
+        one. Only terrains of that shape can then be warped.
+        :param block_rows: Number of rows processed at once.
+        :param workers: Number of threads processing blocks concurrently.
+        """
+        if field is not None and (numpy.ndim(field) != 3 or len(field) != 2):
+            raise TypeError('Displacement fields should have a shape of (2, rows, columns)')
+        self.amplitude = amplitude
+        self.waves = waves
+        self.frequency = frequency
+        self.seed = seed
+        self.field = None if field is None else numpy.asarray(field, dtype=float)
+        self.block_rows = block_rows
+        self.workers = workers
+        self._sampling = {}
+
+    def displacement(self, shape: tuple):
+        """Displacement field used for terrains of the given shape.
+
+        :param shape: ``(rows, columns)`` of the terrain.
+        :returns: array of shape ``(2, rows, columns)``."""
+        shape = tuple(shape)
+        if self.field is None:
+            return displacement_field(shape, self.amplitude, self.waves, self.frequency, self.seed)
+        if self.field.shape[1:] != shape:
+            raise TypeError('Displacement field of shape {} cannot warp a terrain of shape {}'.format(
+                self.field.shape[1:], shape))
+        return self.field
+
+    def __call__(self, terrain: Terrain):
+        """Warp the terrain.
+
+        :param terrain: Terrain object to warp.
+        :returns: new Terrain object."""
+        heights = terrain._heightmap
+        rows, cols = heights.shape
+        base, row_weights, col_weights = self.sampling(heights.shape)
+        # One more row and column, wrapped around, so that the neighbours of every base index are in bounds
+        padded = heights.take(numpy.arange(rows + 1) % rows, axis=0).take(numpy.arange(cols + 1) % cols, axis=1)
+        padded = padded.astype(float, copy=False).ravel()
+        stride = cols + 1
+        out = numpy.empty((rows, cols))
+
+        def warp(start, stop):
+            index = base[start:stop]
+            col_weight = col_weights[start:stop]
+            top = padded[index]
+            top += (padded[index + 1] - top) * col_weight
+            bottom = padded[index + stride]
+            bottom += (padded[index + stride + 1] - bottom) * col_weight
+            out[start:stop] = top + (bottom - top) * row_weights[start:stop]
+
+        map_blocks(warp, rows, self.block_rows, self.workers)
+        return Terrain(array=out, copy=False)
+
+    def sampling(self, shape: tuple):
+        """Cached sampling positions of a terrain shape.
+
+        :param shape: ``(rows, columns)`` of the terrain.
+        :returns: tuple of the flat indices of the upper left interpolated cell, in the terrain padded with one wrapped
+        row and column, and of the row and column interpolation weights."""
+        shape = tuple(shape)
+        if shape not in self._sampling:
+            logger.debug('Computing warp sampling of shape %s', shape)
+            rows, cols = shape
+            field = self.displacement(shape)
+            row_positions = field[0] + numpy.arange(rows)[:, None]
+            col_positions = field[1] + numpy.arange(cols)[None, :]
+            row_first, col_first = numpy.floor(row_positions), numpy.floor(col_positions)
+            dtype = numpy.int32 if (rows + 1) * (cols + 1) < 2 ** 31 else numpy.int64
+            base = (row_first % rows).astype(dtype) * (cols + 1) + (col_first % cols).astype(dtype)
+            self._sampling[shape] = (base, (row_positions - row_first).astype(numpy.float32),
+                                     (col_positions - col_first).astype(numpy.float32))
+        return self._sampling[shape]
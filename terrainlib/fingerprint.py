@@ -0,0 +1,142 @@
+"""Hashes and fingerprints of heightmaps, to check that outputs do not drift across versions, platforms and
+optimizations without keeping the outputs themselves around.
+
+Both are computed block by block, so they work on memory-mapped heightmaps larger than memory."""
+# TerrainLib - A fast terrain generation library
+# Copyright © 2018  Nathan "SolarLiner" Graule
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import base64
+import hashlib
+
+import numpy
+
+from .tiles import row_blocks
+
+# Integer standing for NaN heights in quantized blocks
+_NAN = numpy.iinfo(numpy.int64).min
+
+
+def _canonical(block: numpy.ndarray):
+    """Copy of a block as little-endian doubles, with a single zero and a single NaN. Should not be called directly."""
+    block = numpy.array(block, dtype='<f8')
+    # -0.0 + 0.0 is 0.0, and assigning NaN writes the standard quiet NaN whatever the payload of the original ones
+    block += 0.
+    block[numpy.isnan(block)] = numpy.nan
+    return block
+
+
+def content_hash(heights: numpy.ndarray, block_rows=256):
+    """Exact hash of a heightmap, read block by block. The same heights give the same hash whatever their data type,
+    byte order and memory layout, and whatever the platform.
+
+    :param heights: 2D array of heights.
+    :param block_rows: Number of rows read at once.
+    :returns: SHA-256 hexadecimal digest."""
+    digest = hashlib.sha256('terrain {} {}\n'.format(*heights.shape).encode())
+    for start, stop in row_blocks(heights.shape[0], block_rows):
+        digest.update(_canonical(heights[start:stop]).tobytes())
+    return digest.hexdigest()
+
+
+class Fingerprint:
+    """Tolerance-aware fingerprint of a heightmap, split into square blocks.
+
+    Heights are rounded to multiples of the tolerance. For each block, the rounded heights are hashed, and for each
+    cell, the low byte of its rounded height is kept. Blocks match when their hashes are equal, which means all their
+    heights agree within the tolerance. As a height drifting by much less than the tolerance may still round the other
+    way, blocks whose hashes differ also match when the low bytes of all their cells differ by at most one, which
+    means every height rounded at most to a neighbouring multiple. Other changes, such as cells swapped or flipped within a
+    block, are missed with a probability of about 1% per changed cell.
+
+    Fingerprints are small, about 1.4 bytes per cell as JSON, and can be stored next to tests as golden outputs."""
+    def __init__(self, shape: tuple, block: int, tolerance: float, digests: list, residues: numpy.ndarray):
+        """Create a fingerprint. Use ``Fingerprint.of`` to fingerprint heights.
+
+        :param shape: ``(rows, columns)`` of the heightmap.
+        :param block: Side length of the blocks.
+        :param tolerance: Height difference considered equal.
+        :param digests: Rows of hexadecimal digests of the blocks.
+        :param residues: Array of the shape of the heightmap holding the low byte of the rounded height of each cell.
+        """
+        self.shape = tuple(shape)
+        self.block = block
+        self.tolerance = tolerance
+        self.digests = [list(row) for row in digests]
+        self.residues = numpy.asarray(residues, dtype=numpy.uint8).reshape(self.shape)
+
+    @classmethod
+    def of(cls, heights: numpy.ndarray, tolerance=1e-6, block=16):
+        """Fingerprint heights.
+
+        :param heights: 2D array of heights.
+        :param tolerance: Height difference considered equal.
+        :param block: Side length of the blocks. Smaller blocks locate differences better, at the cost of larger
+        fingerprints.
+        :returns: ``Fingerprint`` instance."""
+        rows, cols = heights.shape
+        digests, residues = [], numpy.empty((rows, cols), numpy.uint8)
+        for start, stop in row_blocks(rows, block):
+            band = _canonical(heights[start:stop])
+            quantized = numpy.rint(band / tolerance)
+            nan = numpy.isnan(quantized)
+            quantized = numpy.where(nan, 0, quantized).astype('<i8')
+            quantized[nan] = _NAN
+            # Two's complement keeps the low byte of negative heights consistent with the positive ones
+            numpy.bitwise_and(quantized, 0xff, out=residues[start:stop], casting='unsafe')
+            digests.append([hashlib.blake2b(quantized[:, left:right].tobytes(), digest_size=8).hexdigest()
+                            for left, right in row_blocks(cols, block)])
+        return cls((rows, cols), block, tolerance, digests, residues)
+
+    def mismatches(self, other):
+        """Blocks which do not match another fingerprint.
+
+        :param other: ``Fingerprint`` of the same shape and block size.
+        :returns: list of ``(row, column)`` positions of the mismatching blocks, in cells."""
+        if (self.shape, self.block) != (other.shape, other.block):
+            raise TypeError('Fingerprints of {} cells in blocks of {} cannot be compared to {} cells in blocks of {}'
+                            .format(self.shape, self.block, other.shape, other.block))
+        positions = []
+        for i, (row, other_row) in enumerate(zip(self.digests, other.digests)):
+            for j, (digest, other_digest) in enumerate(zip(row, other_row)):
+                if digest == other_digest:
+                    continue
+                window = numpy.s_[i * self.block:(i + 1) * self.block, j * self.block:(j + 1) * self.block]
+                # Differences of -1, 0 and 1 wrap around to 0, 1 and 2
+                steps = self.residues[window] - other.residues[window] + numpy.uint8(1)
+                if (steps > 2).any():
+                    positions.append((i * self.block, j * self.block))
+        return positions
+
+    def matches(self, other):
+        """Whether all blocks match another fingerprint, see ``Fingerprint.mismatches``."""
+        return not self.mismatches(other)
+
+    def to_dict(self):
+        """Fingerprint as a dictionary of JSON types."""
+        return {'shape': list(self.shape), 'block': self.block, 'tolerance': self.tolerance, 'digests': self.digests,
+                'residues': base64.b64encode(self.residues.tobytes()).decode('ascii')}
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        """Fingerprint from a dictionary returned by ``Fingerprint.to_dict``."""
+        residues = numpy.frombuffer(base64.b64decode(data['residues']), numpy.uint8)
+        return cls(data['shape'], data['block'], data['tolerance'], data['digests'], residues)
+
+    def __eq__(self, other):
+        return isinstance(other, Fingerprint) and self.shape == other.shape and self.block == other.block and \
+            self.matches(other)
+
+    def __repr__(self):
+        return 'Fingerprint(shape={}, block={}, tolerance={:g})'.format(self.shape, self.block, self.tolerance)
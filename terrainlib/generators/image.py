@@ -15,11 +15,13 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 import numpy
-from PIL import Image
 
+from ..lazy import lazy_import
 from ..terrain import Terrain
 from .base import TerrainGenerator
 
+Image = lazy_import('PIL.Image')
+
 
 class PILInputGenerator(TerrainGenerator):
     """Generates terrain by copying greyscale data from an input image. This effectively imports the image as a Terrain
@@ -42,9 +44,9 @@ class PILInputGenerator(TerrainGenerator):
         self.bitdepth = bitdepth
 
         if isinstance(img, str):
-            size = self._setup_image(Image.open(img), bitdepth)
+            shape = self._setup_image(Image.open(img), bitdepth)
         elif isinstance(img, Image.Image):
-            size = self._setup_image(img, bitdepth)
+            shape = self._setup_image(img, bitdepth)
         else:
             raise TypeError("Image can only be a string or a PIL.Image instance.")
 
@@ -53,17 +55,8 @@ class PILInputGenerator(TerrainGenerator):
         return Terrain(array=self.data)
 
     def _setup_image(self, image, bitdepth):
-        """Crops the image to be a square. Should not be called directly."""
+        """Reads the image data. Should not be called directly."""
         if isinstance(image, Image.Image):
-            width, height = image.size  # type: (int, int)
-            short_side = min(width, height)   # type: int
-
-            left = (width - short_side) / 2
-            right = (width + short_side) / 2
-            top = (height - short_side) / 2
-            bottom = (height + short_side) / 2
-
-            cropped_img = image.crop((left, top, right, bottom))
-            self.data = numpy.divide(numpy.array(cropped_img, order='F'), bitdepth) # type: numpy.ndarray
+            self.data = numpy.divide(numpy.array(image, order='F'), bitdepth) # type: numpy.ndarray
 
-            return short_side
+            return self.data.shape
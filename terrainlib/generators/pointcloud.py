@@ -0,0 +1,293 @@
+"""Point cloud import grids scattered ``(x, y, z)`` samples, such as surveys and DEM exports, into terrains.
+
+Points are read in chunks and binned into the grid, so the memory used does not depend on the number of points. Cells
+holding samples take their mean height; empty cells are then filled from the centroids of the non-empty ones."""
+# TerrainLib - A fast terrain generation library
+# Copyright © 2018  Nathan "SolarLiner" Graule
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import logging
+import math
+
+import numpy
+
+from ..terrain import Terrain
+from ..tiles import map_blocks
+from .base import TerrainGenerator
+
+logger = logging.getLogger(__name__)
+
+NEAREST = 'nearest'
+IDW = 'idw'
+
+# Side length, in cells, of the largest buckets of the spatial index used by inverse distance weighting
+BUCKET_SIZE = 16
+
+
+def point_chunks(points, chunk_size=2**20):
+    """Chunks of points, as float arrays of shape ``(n, 3)``.
+
+    :param points: Array of shape ``(n, 3)``, possibly memory-mapped, path of a ``.npy`` file holding one, or
+    iterable of such arrays.
+    :param chunk_size: Number of points per chunk read from arrays and files.
+    :returns: generator of arrays."""
+    if isinstance(points, str):
+        points = numpy.load(points, mmap_mode='r')
+    if isinstance(points, numpy.ndarray):
+        array = points
+        points = (array[start:start + chunk_size] for start in range(0, len(array), chunk_size))
+    for chunk in points:
+        chunk = numpy.asarray(chunk, dtype=float)
+        if chunk.ndim != 2 or chunk.shape[1] != 3:
+            raise TypeError('Points should be an array of shape (n, 3), got {}'.format(chunk.shape))
+        yield chunk
+
+
+def point_bounds(points, chunk_size=2**20):
+    """Bounds of points, read in chunks.
+
+    :param points: Points, see ``point_chunks``.
+    :param chunk_size: Number of points per chunk.
+    :returns: ``(x min, y min, x max, y max)`` tuple."""
+    low, high = numpy.full(2, numpy.inf), numpy.full(2, -numpy.inf)
+    for chunk in point_chunks(points, chunk_size):
+        if len(chunk):
+            low = numpy.minimum(low, chunk[:, :2].min(axis=0))
+            high = numpy.maximum(high, chunk[:, :2].max(axis=0))
+    return low[0], low[1], high[0], high[1]
+
+
+class GridIndex:
+    """Spatial index of samples on a grid. The grid is split into square buckets, and samples are sorted by bucket,
+    so that the samples of a row of consecutive buckets are a contiguous slice."""
+    def __init__(self, rows: numpy.ndarray, cols: numpy.ndarray, shape: tuple, bucket: int):
+        """Build the index.
+
+        :param rows: Row of the cell holding each sample.
+        :param cols: Column of the cell holding each sample.
+        :param shape: Shape of the grid.
+        :param bucket: Side length of the buckets, in cells.
+        """
+        self.bucket = bucket
+        self.shape = (-(-shape[0] // bucket), -(-shape[1] // bucket))
+        buckets = (rows // bucket) * self.shape[1] + cols // bucket
+        self.order = numpy.argsort(buckets, kind='stable')
+        self.starts = numpy.concatenate(([0], numpy.cumsum(numpy.bincount(buckets, minlength=self.shape[0] *
+                                                                          self.shape[1]))))
+
+    def around(self, row: int, reach: int):
+        """Samples of the buckets within ``reach`` buckets of every bucket of a row of buckets.
+
+        :param row: Bucket row.
+        :param reach: Number of buckets searched on each side.
+        :returns: array of shape ``(bucket columns, candidates)`` of sample indices, padded with -1."""
+        rows, cols = self.shape
+        columns = numpy.arange(cols)
+        parts = []
+        for r in range(max(row - reach, 0), min(row + reach, rows - 1) + 1):
+            for offset in range(-reach, reach + 1):
+                neighbours = columns + offset
+                valid = (neighbours >= 0) & (neighbours < cols)
+                buckets = r * cols + numpy.clip(neighbours, 0, cols - 1)
+                starts = self.starts[buckets]
+                counts = numpy.where(valid, self.starts[buckets + 1] - starts, 0)
+                positions = starts[:, None] + numpy.arange(counts.max(initial=0))
+                parts.append(numpy.where(positions < (starts + counts)[:, None],
+                                         self.order[numpy.minimum(positions, len(self.order) - 1)], -1))
+        return numpy.concatenate(parts, axis=1)
+
+
+class PointCloudGenerator(TerrainGenerator):
+    """Grids scattered ``(x, y, z)`` samples into a terrain. Rows follow ``y`` and columns follow ``x``, from the
+    minimum bounds.
+
+    Samples are binned with ``numpy.bincount``, every cell holding samples taking their mean height. Empty cells are
+    either left as NaN, filled with the height of the nearest non-empty cell, or interpolated by inverse distance
+    weighting (IDW) of the non-empty cells within a radius, falling back to the nearest one beyond it. Distances are
+    measured to the centroid of the samples of each cell.
+
+    Nearest cells are found by jump flooding: every cell repeatedly looks at the nearest samples found by cells
+    at halving distances, which takes ``log2`` of the terrain size passes over the grid, and is exact in all but rare
+    configurations. IDW searches a grid index of the non-empty cells. Both run in blocks of rows on a thread pool."""
+    def __init__(self, size, bounds=None, fill=NEAREST, radius=8., power=2., chunk_size=2**20, block_rows=64,
+                 workers=1):
+        """Initialize the point cloud generator.
+
+        :param size: Side length, or ``(rows, columns)`` tuple, of the generated terrain.
+        :param bounds: ``(x min, y min, x max, y max)`` covered by the terrain. Points outside are dropped. Defaults to
+        the bounds of the points, which takes an additional pass over them, and is not possible for iterables.
+        :param fill: How empty cells are filled: ``pointcloud.NEAREST``, ``pointcloud.IDW``, or None to leave them as
+        NaN.
+        :param radius: Search radius of IDW, in cells.
+        :param power: Power of the distance in IDW weights. Higher powers favour the closest samples.
+        :param chunk_size: Number of points read at once.
+        :param block_rows: Number of rows filled at once.
+        :param workers: Number of threads filling blocks concurrently.
+        """
+        if fill not in (None, NEAREST, IDW):
+            raise TypeError('Fill should be one of pointcloud.NEAREST, pointcloud.IDW or None')
+        self.shape = size if isinstance(size, tuple) else (size, size)
+        self.bounds = bounds
+        self.fill = fill
+        self.radius = radius
+        self.power = power
+        self.chunk_size = chunk_size
+        self.block_rows = block_rows
+        self.workers = workers
+
+    def __call__(self, points):
+        """Grid points into a terrain.
+
+        :param points: Array of shape ``(n, 3)`` of ``x, y, z`` samples, possibly memory-mapped, path of a ``.npy``
+        file holding one, or iterable of such arrays streamed chunk by chunk. Iterables need explicit bounds.
+        :returns: new Terrain object."""
+        bounds = self.bounds
+        if bounds is None:
+            if not isinstance(points, (str, numpy.ndarray)):
+                raise TypeError('Bounds are needed to grid streamed chunks of points')
+            bounds = point_bounds(points, self.chunk_size)
+        heights, sample_rows, sample_cols = self.bin(points, bounds)
+        cells = numpy.flatnonzero(~numpy.isnan(heights))
+        logger.info('Gridded points into %i non-empty cells out of %i', len(cells), heights.size)
+        if self.fill is not None and len(cells) and len(cells) < heights.size:
+            if self.fill == IDW:
+                self._interpolate(heights, cells, sample_rows, sample_cols)
+            if numpy.isnan(heights).any():
+                self._nearest(heights, cells, sample_rows, sample_cols)
+        return Terrain(array=heights, copy=False)
+
+    def bin(self, points, bounds: tuple):
+        """Bin points into the grid.
+
+        :param points: Points, see ``PointCloudGenerator.__call__``.
+        :param bounds: ``(x min, y min, x max, y max)`` covered by the grid.
+        :returns: tuple of the mean height of every cell, NaN for empty cells, and the row and column coordinates of
+        the centroid of the samples of every cell, cell centres being at integer coordinates."""
+        rows, cols = self.shape
+        x_min, y_min, x_max, y_max = bounds
+        counts = numpy.zeros(rows * cols)
+        sums = numpy.zeros((3, rows * cols))
+        for chunk in point_chunks(points, self.chunk_size):
+            # Continuous cell coordinates, cells spanning [i, i + 1)
+            u = (chunk[:, 0] - x_min) * (cols / ((x_max - x_min) or 1.))
+            v = (chunk[:, 1] - y_min) * (rows / ((y_max - y_min) or 1.))
+            inside = (u >= 0) & (u <= cols) & (v >= 0) & (v <= rows) & ~numpy.isnan(chunk[:, 2])
+            u, v, z = u[inside], v[inside], chunk[inside, 2]
+            cells = numpy.minimum(v.astype(numpy.intp), rows - 1) * cols + numpy.minimum(u.astype(numpy.intp), cols - 1)
+            counts += numpy.bincount(cells, minlength=rows * cols)
+            for total, values in zip(sums, (z, v - .5, u - .5)):
+                total += numpy.bincount(cells, weights=values, minlength=rows * cols)
+        with numpy.errstate(invalid='ignore', divide='ignore'):
+            sums /= counts
+        heights, sample_rows, sample_cols = sums.reshape(3, rows, cols)
+        return heights, sample_rows, sample_cols
+
+    def _interpolate(self, heights: numpy.ndarray, cells: numpy.ndarray, sample_rows: numpy.ndarray,
+                     sample_cols: numpy.ndarray):
+        """Interpolates empty cells within the radius of non-empty ones, in place. Should not be called directly."""
+        rows, cols = heights.shape
+        bucket = max(1, min(BUCKET_SIZE, math.ceil(self.radius)))
+        reach = math.ceil(self.radius / bucket)
+        index = GridIndex(cells // cols, cells % cols, heights.shape, bucket)
+        # Positions and heights of the samples, with a last entry for the padding of candidates
+        sample_rows = numpy.append(sample_rows.flat[cells], 0.)
+        sample_cols = numpy.append(sample_cols.flat[cells], 0.)
+        values = numpy.append(heights.flat[cells], 0.)
+        # Offsets of the cells of a bucket, in row-major order
+        offset_rows = numpy.repeat(numpy.arange(bucket), bucket)
+        offset_cols = numpy.tile(numpy.arange(bucket), bucket)
+
+        def interpolate(start, stop):
+            for row in range(start, stop):
+                top = row * bucket
+                band = heights[top:top + bucket]
+                empty = numpy.isnan(band)
+                columns = numpy.flatnonzero(numpy.logical_or.reduceat(empty.any(axis=0), numpy.arange(0, cols, bucket)))
+                candidates = index.around(row, reach)
+                # Buckets are interpolated in batches, as arrays of shape (buckets, cells of a bucket, candidates)
+                batch = max(1, 2**22 // (bucket * bucket * max(1, candidates.shape[1])))
+                for first in range(0, len(columns), batch):
+                    chosen = columns[first:first + batch]
+                    query_rows = numpy.broadcast_to(top + offset_rows, (len(chosen), bucket * bucket))
+                    query_cols = chosen[:, None] * bucket + offset_cols
+                    query = (query_rows < rows) & (query_cols < cols)
+                    query[query] = empty[query_rows[query] - top, query_cols[query]]
+                    near = candidates[chosen]
+                    distances = (sample_rows[near][:, None, :] - query_rows[:, :, None]) ** 2 + \
+                        (sample_cols[near][:, None, :] - query_cols[:, :, None]) ** 2
+                    with numpy.errstate(divide='ignore'):
+                        weights = numpy.where((distances <= self.radius ** 2) & (near >= 0)[:, None, :],
+                                              distances ** (-self.power / 2), 0.)
+                    total = weights.sum(axis=2)
+                    found = query & (total > 0)
+                    band[query_rows[found] - top, query_cols[found]] = \
+                        numpy.einsum('bqc,bc->bq', weights, values[near])[found] / total[found]
+
+        map_blocks(interpolate, index.shape[0], max(1, self.block_rows // bucket), self.workers)
+
+    def _nearest(self, heights: numpy.ndarray, cells: numpy.ndarray, sample_rows: numpy.ndarray,
+                 sample_cols: numpy.ndarray):
+        """Fills empty cells with the height of the nearest non-empty cell, in place, by jump flooding. Should not be
+        called directly."""
+        rows, cols = heights.shape
+        # Every cell holds the height and position of the nearest sample found so far, at an infinite distance for none
+        state = numpy.full((3, rows, cols), numpy.inf)
+        state[0].flat[cells] = heights.flat[cells]
+        state[1].flat[cells] = sample_rows.flat[cells]
+        state[2].flat[cells] = sample_cols.flat[cells]
+        following = numpy.empty_like(state)
+        grid_cols = numpy.arange(cols)
+
+        # Grow the sample cells, not the cells filled by interpolation, until they cover the grid, to bound the
+        # distance to the nearest sample: cells within ``reach`` rows and columns of a sample grow into cells within
+        # ``2 * reach + 1``. Steps from twice that distance down reach it.
+        reached, reach = numpy.zeros((rows, cols), bool), 0
+        reached.flat[cells] = True
+        while not reached.all():
+            for axis in (0, 1):
+                grown = reached.copy()
+                ahead, behind = [slice(None)] * 2, [slice(None)] * 2
+                ahead[axis], behind[axis] = slice(reach + 1, None), slice(None, -reach - 1)
+                grown[tuple(ahead)] |= reached[tuple(behind)]
+                grown[tuple(behind)] |= reached[tuple(ahead)]
+                reached = grown
+            reach = 2 * reach + 1
+        steps = [2 ** power for power in range((reach + 1).bit_length(), -1, -1)]
+        # A final pass at the smallest step fixes most of the cells jump flooding gets wrong
+        for step in steps + [1]:
+            def jump(start, stop):
+                best = following[:, start:stop]
+                best[...] = state[:, start:stop]
+                grid_rows = numpy.arange(start, stop)[:, None]
+                distances = (best[1] - grid_rows) ** 2 + (best[2] - grid_cols) ** 2
+                for drow in (-step, 0, step):
+                    top, bottom = max(start, -drow), min(stop, rows - drow)
+                    for dcol in (-step, 0, step):
+                        left, right = max(0, -dcol), min(cols, cols - dcol)
+                        if (not drow and not dcol) or top >= bottom or left >= right:
+                            continue
+                        # Samples found by the cells at the offset, for the cells of the block which have such cells
+                        candidates = state[:, top + drow:bottom + drow, left + dcol:right + dcol]
+                        region = best[:, top - start:bottom - start, left:right]
+                        region_distances = distances[top - start:bottom - start, left:right]
+                        candidate_distances = (candidates[1] - grid_rows[top - start:bottom - start]) ** 2 + \
+                            (candidates[2] - grid_cols[left:right]) ** 2
+                        closer = candidate_distances < region_distances
+                        numpy.copyto(region, candidates, where=closer)
+                        numpy.copyto(region_distances, candidate_distances, where=closer)
+
+            map_blocks(jump, rows, self.block_rows, self.workers)
+            state, following = following, state
+        empty = numpy.isnan(heights)
+        heights[empty] = state[0][empty]
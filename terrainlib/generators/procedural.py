@@ -16,6 +16,7 @@ longest to actually run generation. Tradeoffs, tradeoffs everywhere!"""
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import hashlib
 import logging
 import random
 
@@ -40,99 +41,130 @@ class DiamondSquareGenerator(TerrainGenerator):
 
     Source: https://en.wikipedia.org/wiki/Diamond-square_algorithm"""
 
-    def __init__(self, size: int, roughness: float, seed=None):
+    CORNER = 'corner'
+    ROW_EDGE = 'row'
+    COLUMN_EDGE = 'column'
+    CHUNK = 'chunk'
+
+    def __init__(self, size: int, roughness: float, seed=None, extent=None, origin=(0, 0)):
         """Initialize the Diamond Square generator.
 
         :param size: As Diamond Square needs a `2**n+1` sized grid, the size is simply the exponent of the power of two.
+        Larger extents are made of several such chunks, sharing their borders.
         :param roughness: Fraction of the size of the square at each iteration, that will be used as bounds for the
         random offset. Traditional values sit between 0.01 for flat landscapes, to 0.3 for rough hills. Anything above
         will produce unrealistic terrain and should only be used for abstract art.
-        :param seed: Reproduce results by setting the same seed for each generation. Seed can be any type, as it will be
-        passed down to `random.seed()`.
+        :param seed: Reproduce results by setting the same seed for each generation. Seed can be any type, as its
+        ``repr`` seeds the random generators of each chunk.
+        :param extent: Side length, or ``(rows, columns)`` tuple, of the generated terrain. Only the chunks covering
+        the extent are generated, and then cropped to it. Defaults to a single chunk.
+        :param origin: ``(row, column)`` of the first generated cell. Terrains generated with the same seed and
+        different origins are windows of the same infinite terrain, which lets tiles be generated separately.
 
         :Example:
         ``generator = DiamondSquareGenerator(10, 0.1)   # Generates a 1025-sized grid with roughness of 0.1``
+        ``generator = DiamondSquareGenerator(10, 0.1, extent=(4000, 16000))   # Generates 4x16 chunks of 1025``
         """
         self.side_length = (2**size)+1
         self.roughness = min(1., max(0.001, roughness))
-        self.heights = numpy.zeros((self.side_length, self.side_length))
-        if seed is not None:
-            random.seed(seed)
+        if extent is None:
+            extent = self.side_length
+        self.extent = extent if isinstance(extent, tuple) else (extent, extent)
+        self.seed = random.SystemRandom().getrandbits(64) if seed is None else seed
+        self.origin = tuple(origin)
 
     def __call__(self):
         """Generates the terrain. Takes no additional arguments, as all input parameters have been set in the init call.
         """
-        self._setup_terrain()
-        self._divide(self.side_length-1)
-        return Terrain(array=self.heights)
-
-    def _divide(self, size: int):
-        """Recursive function that applies the diamond square process through the entire grid. Should not be called
+        rows, cols = self.extent
+        top, left = self.origin
+        step = self.side_length - 1
+        heights = numpy.empty((rows, cols))
+        # Chunk k spans cells k * step to (k + 1) * step included; its last cell is the first of the next chunk
+        for chunk_row in range(top // step, max(top // step, (top + rows - 2) // step) + 1):
+            row_start, row_stop = max(top, chunk_row * step), min(top + rows, (chunk_row + 1) * step + 1)
+            for chunk_col in range(left // step, max(left // step, (left + cols - 2) // step) + 1):
+                col_start, col_stop = max(left, chunk_col * step), min(left + cols, (chunk_col + 1) * step + 1)
+                chunk = self._chunk(chunk_row, chunk_col)
+                heights[row_start - top:row_stop - top, col_start - left:col_stop - left] = \
+                    chunk[row_start - chunk_row * step:row_stop - chunk_row * step,
+                          col_start - chunk_col * step:col_stop - chunk_col * step]
+        return Terrain(array=heights, copy=False)
+
+    def _random(self, kind: str, row: int, col: int):
+        """Random generator for one part of the grid, so that chunks can be generated independently and in any order,
+        and still agree on their shared corners and borders. Should not be called directly."""
+        key = '{!r}:{}:{}:{}'.format(self.seed, kind, row, col).encode()
+        return numpy.random.RandomState(numpy.frombuffer(hashlib.sha256(key).digest(), dtype='<u4'))
+
+    def _chunk(self, row: int, col: int):
+        """Generates the chunk at the given chunk coordinates. Should not be called directly."""
+        logger.debug('Generating chunk (%i, %i) of size %i', row, col, self.side_length)
+        maximum = self.side_length - 1
+        heights = numpy.zeros((self.side_length, self.side_length))
+        for r, c in ((0, 0), (0, 1), (1, 0), (1, 1)):
+            corner = self._random(self.CORNER, row + r, col + c)
+            heights[r * maximum, c * maximum] = corner.uniform(-self.side_length, self.side_length)
+
+        heights[0] = self._edge(self._random(self.ROW_EDGE, row, col), heights[0, 0], heights[0, maximum])
+        heights[maximum] = self._edge(self._random(self.ROW_EDGE, row + 1, col), heights[maximum, 0],
+                                      heights[maximum, maximum])
+        heights[:, 0] = self._edge(self._random(self.COLUMN_EDGE, row, col), heights[0, 0], heights[maximum, 0])
+        heights[:, maximum] = self._edge(self._random(self.COLUMN_EDGE, row, col + 1), heights[0, maximum],
+                                         heights[maximum, maximum])
+
+        self._divide(heights, self._random(self.CHUNK, row, col))
+        return heights
+
+    def _edge(self, rng: numpy.random.RandomState, start: float, end: float):
+        """Midpoint displacement along a chunk border, shared by the two chunks on each side. Should not be called
         directly.
-        
-        :param size: Current iteration size
-        """
-        id = size // 2
-        if id < 1:
-            return
-        scale = self.roughness * size
-        
-        # Squares
-        for y in range(id, self.side_length-1, size):
-            for x in range(id, self.side_length-1, size):
-                self._square(x,y, id, scale)
-
-        # Diamonds
-        for y in range(0, self.side_length-1, size):
-            for x in range(0, self.side_length-1, size):
-                self._diamond(x+id,y, id, scale)
-                self._diamond(x,y+id, id, scale)
-
-        self._divide(id)
-
-    def _square(self, x: int, y: int, size: int, scale: float):
-        """Performs the square step of the generation algorithm. Should not be called directly.
-
-        :param x: X position on the grid
-        :param y: Y position on the grid
-        :param size: current iteration square size
-        :param scale: current iteration random bounds scaling value
-        """
-        tl = self.heights[x-size,y-size]
-        tr = self.heights[x-size,y+size]
-        br = self.heights[x+size,y+size]
-        bl = self.heights[x+size,y-size]
-
-        average = ((tl + tr + bl + br) / 4)
-        offset = random.uniform(-scale, scale)        
-        self.heights[x,y] = average + offset
-
-    def _diamond(self, x: int, y: int, size: int, scale: float):
-        """Performs the diamond step of the generation algorithm. Should not be called directly.
-
-        :param x: X position on the grid
-        :param y: Y position on the grid
-        :param size: current iteration square size
-        :param scale: current iteration random bounds scaling value
+
+        :param rng: Random generator of the border
+        :param start: Height at the start of the border
+        :param end: Height at the end of the border
         """
-        t = self.heights[x,y-size]
-        l = self.heights[x+size,y]
-        b = self.heights[x,y+size]
-        r = self.heights[x-size,y]
-
-        average = ((t+l+b+r)/4.0)
-        offset = random.uniform(-scale, scale)
-        self.heights[x,y] = average + offset
-
-    def _setup_terrain(self):
-        """Setups the terrain for generation. Should not be called directly."""
-        logger.debug('Setting up terrain size %i', self.side_length)
         maximum = self.side_length - 1
+        edge = numpy.zeros(self.side_length)
+        edge[0], edge[maximum] = start, end
+        size = maximum
+        while size > 1:
+            half = size // 2
+            scale = self.roughness * size
+            midpoints = edge[half:maximum:size]
+            midpoints[:] = (edge[:maximum:size] + edge[size::size]) / 2 + rng.uniform(-scale, scale, len(midpoints))
+            size = half
+        return edge
+
+    def _divide(self, heights: numpy.ndarray, rng: numpy.random.RandomState):
+        """Applies the diamond square process through the entire chunk, one level of detail at a time, each step
+        computing all the cells of the level at once. Borders of the chunk are left untouched. Should not be called
+        directly.
 
-        self.heights[0,0] = random.uniform(-self.side_length, self.side_length)
-        self.heights[maximum,0] = random.uniform(-self.side_length, self.side_length)
-        self.heights[0,maximum] = random.uniform(-self.side_length, self.side_length)
-        self.heights[maximum,maximum] = random.uniform(-self.side_length, self.side_length)
+        :param heights: Chunk being generated
+        :param rng: Random generator of the chunk
+        """
+        maximum = self.side_length - 1
+        size = maximum
+        while size > 1:
+            half = size // 2
+            scale = self.roughness * size
+            corners = heights[::size, ::size]
+
+            # Squares: the centre of each square is the average of its four corners, plus an offset
+            centres = heights[half:maximum:size, half:maximum:size]
+            centres[:] = (corners[:-1, :-1] + corners[:-1, 1:] + corners[1:, :-1] + corners[1:, 1:]) / 4 + \
+                rng.uniform(-scale, scale, centres.shape)
+
+            # Diamonds: the middle of each inner square side is the average of the two corners and two centres
+            # around it. Both kinds of sides only read corners and centres, so they do not depend on each other.
+            across = heights[size:maximum:size, half:maximum:size]
+            across[:] = (corners[1:-1, :-1] + corners[1:-1, 1:] + centres[:-1] + centres[1:]) / 4 + \
+                rng.uniform(-scale, scale, across.shape)
+            down = heights[half:maximum:size, size:maximum:size]
+            down[:] = (corners[:-1, 1:-1] + corners[1:, 1:-1] + centres[:, :-1] + centres[:, 1:]) / 4 + \
+                rng.uniform(-scale, scale, down.shape)
+            size = half
 
 
 class VoronoiGenerator(TerrainGenerator):
@@ -144,10 +176,15 @@ class VoronoiGenerator(TerrainGenerator):
     Source: https://en.wikipedia.org/wiki/Voronoi_diagram"""
 
     def __init__(self, size):
+        """Initialize the Voronoi generator.
+
+        :param size: Side length, or ``(rows, columns)`` tuple, of the generated terrain.
+        """
         self.size = size
+        self.shape = size if isinstance(size, tuple) else (size, size)
 
     def __call__(self, points: list):
-        depthmap = numpy.ones(shape=(self.size, self.size), dtype=float)*1e308
+        depthmap = numpy.ones(shape=self.shape, dtype=float)*1e308
         points = tuple(numpy.round(points).tolist())
 
         def hypot(X,Y):
@@ -0,0 +1,54 @@
+"""Lazy imports of heavy, optional dependencies. Short-lived processes only pay for the modules they actually use."""
+# TerrainLib - A fast terrain generation library
+# Copyright © 2018  Nathan "SolarLiner" Graule
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import importlib
+import importlib.util
+import sys
+import threading
+import types
+
+
+class _LazyModule(types.ModuleType):
+    """Stand-in for a module which is imported on first attribute access. Should not be used directly.
+
+    Unlike ``importlib.util.LazyLoader``, the proxy is never registered in ``sys.modules``: the real import goes through
+    the regular import machinery, behind a lock, so that threads using the module at the same time all wait for the
+    fully executed module instead of seeing a half-initialized one."""
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self.__lock = threading.Lock()
+
+    def __getattr__(self, item):
+        # Only called for attributes missing from the proxy, that is, before the module is loaded.
+        with self.__lock:
+            module = importlib.import_module(self.__name__)
+            self.__dict__.update(module.__dict__)
+        return getattr(module, item)
+
+
+def lazy_import(name: str):
+    """Import a module on first attribute access instead of immediately. Safe to use from several threads.
+
+    Missing modules still raise ``ImportError`` straight away, only their execution is deferred.
+
+    :param name: Absolute name of the module, for instance ``'numexpr'`` or ``'PIL.Image'``.
+    :returns: module object, loaded when one of its attributes is first used."""
+    if name in sys.modules:
+        return sys.modules[name]
+    if importlib.util.find_spec(name) is None:
+        raise ImportError('No module named {!r}'.format(name), name=name)
+    return _LazyModule(name)
@@ -0,0 +1,213 @@
+"""Declarative pipelines: a generator, filters and an optional reader described as plain data, run and saved.
+
+A pipeline spec is a JSON (or YAML, when PyYAML is installed) mapping::
+
+    {
+        "name": "strata",
+        "stages": [
+            {"type": "DiamondSquareGenerator", "size": 10, "roughness": 0.2, "seed": "$seed"},
+            {"type": "StrataErosionFilter", "number": 22.8},
+            {"type": "ThermalErosionFilter", "iterations": "$iterations"}
+        ],
+        "output": {"path": "out/strata_{seed}_{iterations}.png", "bitdepth": 16},
+        "sweep": {"seed": [1, 2, 3], "iterations": [10, 20]}
+    }
+
+``type`` names any class exported by ``terrainlib``, or a ``module:Class`` path. Other keys are passed to its
+constructor, except ``call`` whose mapping is passed when calling it (for instance the points of a
+``VoronoiGenerator``). Strings of the form ``"$name"`` are replaced by the value of the sweep variable ``name``, and the
+output path is formatted with the sweep variables. Every combination of the sweep values is a job."""
+# TerrainLib - A fast terrain generation library
+# Copyright © 2018  Nathan "SolarLiner" Graule
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+from concurrent.futures import ThreadPoolExecutor
+import contextlib
+import importlib
+import itertools
+import json
+import logging
+import os
+
+import numpy
+
+from .filters.base import TerrainFilter
+from .generators.base import TerrainGenerator
+from .profiling import Profiler
+from .readers.base import TerrainReader
+from .readers.image import PILImageReader
+from .terrain import Terrain
+
+logger = logging.getLogger(__name__)
+
+BITDEPTHS = {8: PILImageReader.BITDEPTH_8, 16: PILImageReader.BITDEPTH_16, 32: PILImageReader.BITDEPTH_32,
+             'float': PILImageReader.BITDEPTH_FLOAT}
+
+
+def load_spec(path: str):
+    """Read a pipeline spec file.
+
+    :param path: Path of a ``.json``, ``.yaml`` or ``.yml`` file.
+    :returns: spec dictionary."""
+    with open(path) as file:
+        if path.endswith(('.yaml', '.yml')):
+            try:
+                import yaml
+            except ImportError:
+                raise ImportError('PyYAML is needed to read YAML pipeline specs, install it or use JSON') from None
+            spec = yaml.safe_load(file)
+        else:
+            spec = json.load(file)
+    if not isinstance(spec, dict) or not spec.get('stages'):
+        raise TypeError('Pipeline spec {} should be a mapping with a non-empty list of stages'.format(path))
+    return spec
+
+
+def sweep(spec: dict):
+    """Every combination of the sweep variables of a spec.
+
+    :param spec: Spec dictionary.
+    :returns: list of dictionaries of variable name to value. A spec without sweep gives a single, empty one."""
+    variables = spec.get('sweep') or {}
+    names = sorted(variables)
+    return [dict(zip(names, values)) for values in itertools.product(*(variables[name] for name in names))]
+
+
+def substitute(value, variables: dict):
+    """Replace ``"$name"`` strings, in nested lists and mappings, by the value of the variable ``name``.
+
+    :param value: Parameter value from a spec.
+    :param variables: Dictionary of variable name to value.
+    :returns: value with variables substituted."""
+    if isinstance(value, str) and value.startswith('$'):
+        if value[1:] not in variables:
+            raise TypeError('Unknown pipeline variable {!r}'.format(value))
+        return variables[value[1:]]
+    if isinstance(value, list):
+        return [substitute(item, variables) for item in value]
+    if isinstance(value, dict):
+        return {key: substitute(item, variables) for key, item in value.items()}
+    return value
+
+
+def resolve(name: str):
+    """Class named in a spec stage.
+
+    :param name: Name of a class exported by ``terrainlib``, or ``module:Class`` path.
+    :returns: class."""
+    if ':' in name:
+        module, _, attribute = name.partition(':')
+        return getattr(importlib.import_module(module), attribute)
+    import terrainlib
+    try:
+        return getattr(terrainlib, name)
+    except AttributeError:
+        raise TypeError('Unknown pipeline stage type {!r}'.format(name)) from None
+
+
+def save(result, path: str, bitdepth=16, normalize=True):
+    """Save the output of a pipeline, in a format depending on its type and on the extension of the path.
+
+    Terrains are saved as ``.npy`` arrays, or as images for any other extension. Readers outputs are saved through
+    their own ``save`` method if any (``PIL.Image``), as ``.npy`` for arrays, ``.npz`` for dictionaries of arrays, and
+    as text otherwise.
+
+    :param result: Terrain, or output of a reader.
+    :param path: Output path.
+    :param bitdepth: Bitdepth of images, one of 8, 16, 32 or ``'float'``.
+    :param normalize: Stretch heights to the full range of images. Otherwise heights are expected between 0 and 1.
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    if isinstance(result, Terrain):
+        heights = result._heightmap
+        if path.endswith('.npy'):
+            return numpy.save(path, heights)
+        if normalize:
+            low, high = heights.min(), heights.max()
+            heights = (heights - low) / ((high - low) or 1.)
+        result = PILImageReader(BITDEPTHS[bitdepth])(Terrain(array=heights, copy=False))
+    if hasattr(result, 'save'):
+        result.save(path)
+    elif isinstance(result, numpy.ndarray):
+        numpy.save(path, result)
+    elif isinstance(result, dict):
+        numpy.savez(path, **result)
+    else:
+        with open(path, 'w') as file:
+            file.write('{}\n'.format(result))
+
+
+class Pipeline:
+    """A generator followed by filters, and optionally ending with a reader."""
+    def __init__(self, stages: list):
+        """Initialize the pipeline from stage descriptions.
+
+        :param stages: List of stage dictionaries, with variables already substituted. The first stage must be a
+        generator, the last one may be a reader, and the others filters.
+        """
+        self.names = []
+        self.stages = []
+        self.calls = []
+        for index, stage in enumerate(stages):
+            params = dict(stage)
+            cls = resolve(params.pop('type'))
+            kind = TerrainGenerator if index == 0 else TerrainReader if index == len(stages) - 1 else TerrainFilter
+            if not issubclass(cls, kind) and not (kind is TerrainReader and issubclass(cls, TerrainFilter)):
+                raise TypeError('Stage {} should be a {}, got {}'.format(index, kind.__name__, cls.__name__))
+            self.calls.append(params.pop('call', {}))
+            self.stages.append(cls(**params))
+            self.names.append(cls.__name__)
+
+    @classmethod
+    def from_spec(cls, spec: dict, variables=None):
+        """Build the pipeline of a spec.
+
+        :param spec: Spec dictionary.
+        :param variables: Values of the sweep variables.
+        :returns: new ``Pipeline`` instance."""
+        return cls(substitute(spec['stages'], variables or {}))
+
+    def __call__(self, record=None, trace_memory=True):
+        """Run the pipeline.
+
+        :param record: Optional list receiving a ``(stage name, seconds, peak bytes)`` tuple per stage, see
+        ``profiling.Profiler``. Measuring the peak memory traces allocations, which slows pure Python code down.
+        :param trace_memory: Measure the peak memory of the stages. Allocations are traced for the whole process, so
+        pipelines running on several threads at once should not measure it. Peaks are None otherwise.
+        :returns: the output terrain, or the output of the final reader."""
+        result = None
+        profiler = Profiler(trace_memory)
+        for index, (name, stage, call) in enumerate(zip(self.names, self.stages, self.calls)):
+            with profiler.stage(name) if record is not None else contextlib.nullcontext():
+                result = stage(**call) if index == 0 else stage(result, **call)
+            if record is not None:
+                record.append((name, profiler.stages[-1].seconds, profiler.stages[-1].peak))
+            logger.info('%s done', name)
+        return result
+
+
+def run_pipelines(pipelines: list, workers=None):
+    """Run independent pipelines on a thread pool.
+
+    The hot paths of generators, filters and readers run in NumPy and numexpr, which release the GIL, and keep no
+    global state, so pipelines run in parallel in a single process, without pickling terrains between processes.
+    ``benchmarks/thread_scaling.py`` measures the speedup.
+
+    :param pipelines: ``Pipeline`` instances, or any callables taking no argument.
+    :param workers: Number of threads. Defaults to the number of CPUs.
+    :returns: list of the outputs of the pipelines, in order."""
+    with ThreadPoolExecutor(workers or os.cpu_count()) as executor:
+        return list(executor.map(lambda pipeline: pipeline(), pipelines))
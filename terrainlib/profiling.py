@@ -0,0 +1,139 @@
+"""Memory and time profiling of pipeline stages and hot paths.
+
+Allocations are traced with ``tracemalloc``, which NumPy reports its array buffers to, so the peaks include both
+Python objects and arrays. Tracing slows pure Python code down, and is global to the process: stages of pipelines
+running on several threads at once cannot be told apart."""
+# TerrainLib - A fast terrain generation library
+# Copyright © 2018  Nathan "SolarLiner" Graule
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import contextlib
+import logging
+import time
+import tracemalloc
+
+logger = logging.getLogger(__name__)
+
+
+class StageProfile:
+    """Time and memory used by one stage."""
+    def __init__(self, name: str, seconds: float, peak=None, retained=None):
+        """Create a stage profile.
+
+        :param name: Name of the stage.
+        :param seconds: Wall time of the stage.
+        :param peak: Largest amount of memory allocated during the stage on top of the memory in use when it started,
+        in bytes. None when memory is not traced.
+        :param retained: Memory still allocated at the end of the stage, typically its output, in bytes. None when
+        memory is not traced.
+        """
+        self.name = name
+        self.seconds = seconds
+        self.peak = peak
+        self.retained = retained
+
+    def __repr__(self):
+        return 'StageProfile({!r}, seconds={:.3f}, peak={}, retained={})'.format(self.name, self.seconds, self.peak,
+                                                                                  self.retained)
+
+
+class Profiler:
+    """Records the time and memory used by named stages::
+
+        profiler = Profiler()
+        with profiler.stage('erosion'):
+            terrain = ThermalErosionFilter(100)(terrain)
+        print(profiler.table())
+
+    Stages may be nested, in which case the peak of the outer stage covers the inner ones."""
+    def __init__(self, trace_memory=True):
+        """Initialize a profiler.
+
+        :param trace_memory: Measure memory. Tracing starts with the first stage and stops at the end of the last one
+        if it was not already running.
+        """
+        self.trace_memory = trace_memory
+        self.stages = []
+        self._peaks = []
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        """Context manager profiling the code it runs, appending a ``StageProfile`` to ``stages`` once done, even if
+        the code raises.
+
+        :param name: Name of the stage."""
+        tracing = self.trace_memory and not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start()
+        try:
+            if self.trace_memory:
+                # Stages reset the traced peak; enclosing stages keep the highest peak seen before
+                if self._peaks:
+                    self._peaks[-1] = max(self._peaks[-1], tracemalloc.get_traced_memory()[1])
+                self._peaks.append(0)
+                tracemalloc.reset_peak()
+                baseline = tracemalloc.get_traced_memory()[0]
+            start = time.perf_counter()
+            try:
+                yield
+            finally:
+                seconds = time.perf_counter() - start
+                peak = retained = None
+                if self.trace_memory:
+                    current, traced_peak = tracemalloc.get_traced_memory()
+                    highest = max(self._peaks.pop(), traced_peak)
+                    if self._peaks:
+                        self._peaks[-1] = max(self._peaks[-1], highest)
+                    peak, retained = highest - baseline, current - baseline
+                self.stages.append(StageProfile(name, seconds, peak, retained))
+                logger.debug('%r', self.stages[-1])
+        finally:
+            if tracing:
+                tracemalloc.stop()
+
+    def table(self):
+        """Table of the profiled stages.
+
+        :returns: table as a string."""
+        row = '{:<32} {:>10} {:>10} {:>13}'
+        lines = [row.format('stage', 'time (s)', 'peak (MB)', 'retained (MB)'), '-' * 68]
+        for stage in self.stages:
+            lines.append(row.format(stage.name, '{:.3f}'.format(stage.seconds), megabytes(stage.peak),
+                                    megabytes(stage.retained)).rstrip())
+        return '\n'.join(lines) + '\n'
+
+
+def megabytes(size):
+    """Size in bytes formatted in megabytes, blank if unknown."""
+    return '' if size is None else '{:.1f}'.format(size / 2**20)
+
+
+@contextlib.contextmanager
+def allocation_budget(budget: int, name='block'):
+    """Context manager asserting that the code it runs allocates at most ``budget`` bytes on top of the memory in use
+    when it starts. Meant for tests guarding hot paths against extra copies::
+
+        grid = terrain._heightmap.nbytes
+        with allocation_budget(4 * grid, 'thermal erosion'):
+            ThermalErosionFilter(50)(terrain)
+
+    :param budget: Maximum peak allocation, in bytes.
+    :param name: Name of the code in the error message.
+    :raises AssertionError: when the peak exceeds the budget."""
+    profiler = Profiler()
+    with profiler.stage(name):
+        yield profiler
+    peak = profiler.stages[-1].peak
+    if peak > budget:
+        raise AssertionError('{} allocated {} bytes at peak, over its budget of {} bytes'.format(name, peak, budget))
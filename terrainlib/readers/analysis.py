@@ -0,0 +1,156 @@
+"""Analyse the shape of the terrain. Slope, aspect, curvature and normal maps drive texturing, vegetation and object
+placement."""
+# TerrainLib - A fast terrain generation library
+# Copyright © 2018  Nathan "SolarLiner" Graule
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import numpy
+
+from .base import TerrainReader
+from ..terrain import Terrain
+from ..lazy import lazy_import
+from ..tiles import NORTH, EAST, SOUTH, WEST, map_blocks, shifted, wrapped_block
+
+numexpr = lazy_import('numexpr')
+
+
+class TerrainAnalysisReader(TerrainReader):
+    """Computes several analysis maps of the terrain in a single pass over memory.
+
+    The terrain is processed in blocks of rows padded with a one cell, wrap-around halo. Central differences are
+    computed once per block and every requested map is derived from them while the block is still in cache.
+
+    Neighbours follow the conventions of ``terrainlib.filters.erosion``: the x axis goes along columns (from east to
+    west), the y axis along rows (from south to north)."""
+    SLOPE = 'slope'
+    ASPECT = 'aspect'
+    CURVATURE = 'curvature'
+    NORMALS = 'normals'
+    OUTPUTS = (SLOPE, ASPECT, CURVATURE, NORMALS)
+    halo = 1
+
+    def __init__(self, outputs=OUTPUTS, cell_size=1., block_rows=64, workers=1):
+        """Initialize the analysis reader.
+
+        :param outputs: Maps to compute, any of ``TerrainAnalysisReader.SLOPE, TerrainAnalysisReader.ASPECT,
+        TerrainAnalysisReader.CURVATURE, TerrainAnalysisReader.NORMALS``.
+        :param cell_size: Horizontal distance between two grid points, in height units.
+        :param block_rows: Number of rows processed at once. Smaller blocks stay in cache, larger ones have less
+        overhead.
+        :param workers: Number of threads processing blocks concurrently.
+        """
+        outputs = tuple(outputs)
+        for output in outputs:
+            if output not in self.OUTPUTS:
+                raise TypeError('Unknown analysis output {!r}'.format(output))
+        self.outputs = outputs
+        self.cell_size = float(cell_size)
+        self.block_rows = max(1, int(block_rows))
+        self.workers = max(1, int(workers))
+
+    def __call__(self, terrain: Terrain):
+        """Compute the analysis maps of the terrain.
+
+        :param terrain: Terrain object to analyse.
+        :returns: dictionary of output name to ``numpy.ndarray``. Slope (radians), aspect (radians, direction of
+        steepest descent counter-clockwise from the x axis) and curvature (Laplacian, positive in hollows) have the
+        shape of the terrain; normals have an extra last axis holding the ``(x, y, z)`` components of unit vectors.
+        """
+        heightmap = terrain._heightmap
+        shape = heightmap.shape
+        maps = {}
+        for output in self.outputs:
+            maps[output] = numpy.empty(shape + (3,) if output == self.NORMALS else shape)
+
+        def analyse(start, stop):
+            block = wrapped_block(heightmap, start, stop, 1)
+            self._analyse_block(block, {name: arr[start:stop] for name, arr in maps.items()})
+
+        map_blocks(analyse, shape[0], self.block_rows, self.workers)
+        return maps
+
+    def _analyse_block(self, block: numpy.ndarray, out: dict):
+        """Fills the output maps from a padded block. Should not be called directly."""
+        c = shifted(block, (0, 0), 1)
+        n, e, s, w = (shifted(block, offset, 1) for offset in (NORTH, EAST, SOUTH, WEST))
+        k = 0.5 / self.cell_size
+
+        if self.SLOPE in out or self.ASPECT in out or self.NORMALS in out:
+            dx = numexpr.evaluate('(w - e) * k')
+            dy = numexpr.evaluate('(n - s) * k')
+        if self.SLOPE in out:
+            numexpr.evaluate('arctan(sqrt(dx * dx + dy * dy))', out=out[self.SLOPE])
+        if self.ASPECT in out:
+            numexpr.evaluate('arctan2(-dy, -dx)', out=out[self.ASPECT])
+        if self.CURVATURE in out:
+            k2 = 1. / (self.cell_size * self.cell_size)
+            numexpr.evaluate('(n + e + s + w - 4 * c) * k2', out=out[self.CURVATURE])
+        if self.NORMALS in out:
+            normals = out[self.NORMALS]
+            inv = numexpr.evaluate('1 / sqrt(dx * dx + dy * dy + 1)')
+            numexpr.evaluate('-dx * inv', out=normals[..., 0])
+            numexpr.evaluate('-dy * inv', out=normals[..., 1])
+            normals[..., 2] = inv
+
+
+class SlopeReader(TerrainAnalysisReader):
+    """Slope of the terrain, in radians, from 0 for flat ground to pi/2 for vertical cliffs."""
+    def __init__(self, cell_size=1., block_rows=64, workers=1):
+        super().__init__((self.SLOPE,), cell_size, block_rows, workers)
+
+    def __call__(self, terrain: Terrain):
+        """Compute the slope map.
+
+        :param terrain: Terrain object to analyse.
+        :returns: ``numpy.ndarray`` of slopes in radians."""
+        return super().__call__(terrain)[self.SLOPE]
+
+
+class AspectReader(TerrainAnalysisReader):
+    """Aspect of the terrain: the direction the slope faces, in radians counter-clockwise from the x axis."""
+    def __init__(self, cell_size=1., block_rows=64, workers=1):
+        super().__init__((self.ASPECT,), cell_size, block_rows, workers)
+
+    def __call__(self, terrain: Terrain):
+        """Compute the aspect map.
+
+        :param terrain: Terrain object to analyse.
+        :returns: ``numpy.ndarray`` of aspects in radians, between -pi and pi."""
+        return super().__call__(terrain)[self.ASPECT]
+
+
+class CurvatureReader(TerrainAnalysisReader):
+    """Curvature of the terrain, as the Laplacian of the heights. Positive in valleys, negative on ridges."""
+    def __init__(self, cell_size=1., block_rows=64, workers=1):
+        super().__init__((self.CURVATURE,), cell_size, block_rows, workers)
+
+    def __call__(self, terrain: Terrain):
+        """Compute the curvature map.
+
+        :param terrain: Terrain object to analyse.
+        :returns: ``numpy.ndarray`` of curvatures."""
+        return super().__call__(terrain)[self.CURVATURE]
+
+
+class NormalMapReader(TerrainAnalysisReader):
+    """Unit surface normals of the terrain, ready to be packed into a normal map texture."""
+    def __init__(self, cell_size=1., block_rows=64, workers=1):
+        super().__init__((self.NORMALS,), cell_size, block_rows, workers)
+
+    def __call__(self, terrain: Terrain):
+        """Compute the normal map.
+
+        :param terrain: Terrain object to analyse.
+        :returns: ``numpy.ndarray`` of shape ``(size, size, 3)`` holding the ``(x, y, z)`` normal components."""
+        return super().__call__(terrain)[self.NORMALS]
@@ -17,8 +17,36 @@
 import abc
 
 from ..terrain import Terrain
+from ..tiles import crop, dirty_windows, read_region, write_region
+
 
 class TerrainReader(metaclass=abc.ABCMeta):
+    #: Distance, in cells, over which editing the terrain changes the output. None when any edit may change all of it,
+    #: or when the output is not a map of the terrain, which disables incremental updates.
+    halo = None
+
     @abc.abstractmethod
     def __call__(self, terrain: Terrain, *args, **kwargs):
-        """Caller to process terrain data and output it into another format."""
\ No newline at end of file
+        """Caller to process terrain data and output it into another format."""
+
+    def incremental(self, terrain: Terrain, previous, regions=None):
+        """Update the output of a previous call after edits of the terrain, recomputing only the edited regions and
+        their ``halo``. Dirty regions are left untouched, call ``terrain.clear_dirty()`` once all outputs are updated.
+
+        :param terrain: Edited Terrain object.
+        :param previous: Array, or dictionary of arrays, returned by the previous call of the reader. Arrays are
+        updated in place.
+        :param regions: Edited regions. Defaults to the dirty regions of the terrain.
+        :returns: the updated output, which is a new object when everything had to be recomputed."""
+        heightmap = terrain._heightmap
+        windows = dirty_windows(terrain.dirty_regions if regions is None else regions, self.halo, heightmap.shape)
+        if windows is None:
+            return self(terrain)
+        for window, region in windows:
+            result = self(Terrain(array=read_region(heightmap, window), copy=False))
+            if isinstance(previous, dict):
+                for name, values in result.items():
+                    write_region(previous[name], region, crop(values, self.halo))
+            else:
+                write_region(previous, region, crop(result, self.halo))
+        return previous
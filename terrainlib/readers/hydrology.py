@@ -0,0 +1,418 @@
+"""Hydrology of the terrain: where water goes, and how much of it. Depressions are filled by priority-flood, flow is
+routed with the D8 or D-infinity methods and accumulated into drainage networks to place rivers."""
+# TerrainLib - A fast terrain generation library
+# Copyright © 2018  Nathan "SolarLiner" Graule
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import logging
+import math
+
+import numpy
+
+from .base import TerrainReader
+from ..terrain import Terrain
+from ..tiles import map_blocks, shifted, wrapped_block
+
+logger = logging.getLogger(__name__)
+
+D8 = 'd8'
+DINF = 'dinf'
+
+# Neighbour offsets (rows, columns), counter-clockwise from the x axis (increasing columns). The index in this tuple is
+# the D8 direction code.
+D8_OFFSETS = ((0, 1), (1, 1), (1, 0), (1, -1), (0, -1), (-1, -1), (-1, 0), (-1, 1))
+
+# Number of height bands flooded one after the other by priority_flood
+FLOOD_LEVELS = 64
+
+
+def priority_flood(heights: numpy.ndarray, wrap=False, levels=FLOOD_LEVELS):
+    """Fill the depressions of a heightmap with a bucketed priority-flood.
+
+    Like the priority-flood of Barnes et al. (2014), cells are flooded from the outlets inwards, lowest first, and take
+    the larger of their own height and the height they were flooded from. Instead of popping cells one by one from a
+    heap, heights are split into ``levels`` equal bands processed in ascending order; within a band, the whole
+    flooding front advances one neighbour at a time with vectorized operations, and a cell reached again through a
+    lower path is updated and flooded anew. The filled heights are exactly those of the heap-based algorithm.
+
+    :param heights: 2D array of heights.
+    :param wrap: If True, the grid wraps around like ``Terrain`` indexing and the lowest cell is the only outlet.
+    Otherwise the cells on the border of the grid are outlets.
+    :param levels: Number of height bands. More bands mean fewer cells flooded twice, but more steps overall.
+    :returns: tuple of the filled heights and, for each cell, the flat index of the cell it was flooded from (-1 for
+    outlets). Following those parents always leads to an outlet, which gives flats a drainage direction.
+    """
+    rows, cols = heights.shape
+    if wrap:
+        stride = cols
+        grid = numpy.array(heights, dtype=float).ravel()
+        seeds = numpy.array([numpy.argmin(grid)])
+    else:
+        # A border of infinitely high padding cells spares bound checks, as they are never flooded
+        stride = cols + 2
+        grid = numpy.full((rows + 2, stride), numpy.inf)
+        grid[1:-1, 1:-1] = heights
+        border = numpy.zeros(grid.shape, dtype=bool)
+        border[1:-1, 1:-1] = True
+        border[2:-2, 2:-2] = False
+        grid = grid.ravel()
+        seeds = numpy.flatnonzero(border.ravel())
+
+    filled = numpy.full(grid.shape, numpy.inf)
+    filled[seeds] = grid[seeds]
+    parents = numpy.full(grid.shape, -1, dtype='int64')
+
+    low, high = heights.min(), heights.max()
+    scale = levels / (high - low) if high > low else 0.
+
+    def level(values):
+        return numpy.minimum(((values - low) * scale).astype('int64'), levels - 1)
+
+    dr, dc = numpy.array(D8_OFFSETS).T[..., None]
+    positions = numpy.empty(grid.shape, dtype='int64')
+
+    def neighbours(cells):
+        if not wrap:
+            return cells + (dr * stride + dc)
+        r, c = numpy.divmod(cells, cols)
+        return ((r + dr) % rows) * cols + (c + dc) % cols
+
+    # Cells reached at a height in a later band, which will be flooded from when that band comes
+    deferred = seeds
+    steps = 0
+    for current in range(levels):
+        if not deferred.size:
+            break
+        bands = level(filled[deferred])
+        front = deferred[bands == current]
+        later = [deferred[bands > current]]
+        while front.size:
+            steps += 1
+            # All eight neighbours of the front at once, with one row per direction
+            cells = neighbours(front)
+            spill = numpy.maximum(grid[cells], filled[front])
+            lower = spill < filled[cells]
+            cells, spill, sources = cells[lower], spill[lower], numpy.broadcast_to(front, lower.shape)[lower]
+            # Cells lowered from several directions keep the lowest spill height, and one of the cells it came from
+            numpy.minimum.at(filled, cells, spill)
+            lowest = spill == filled[cells]
+            cells = cells[lowest]
+            parents[cells] = sources[lowest]
+            order = numpy.arange(cells.size)
+            positions[cells] = order
+            cells = cells[positions[cells] == order]
+            spill = filled[cells]
+            now = level(spill) == current
+            front = cells[now]
+            later.append(cells[~now])
+        deferred = numpy.concatenate(later)
+    logger.debug('Depressions filled in %i steps', steps)
+
+    if wrap:
+        return filled.reshape(rows, cols), parents.reshape(rows, cols)
+
+    filled = filled.reshape(rows + 2, stride)[1:-1, 1:-1].copy()
+    parents = parents.reshape(rows + 2, stride)[1:-1, 1:-1]
+    prow, pcol = numpy.divmod(parents, stride)
+    parents = numpy.where(parents < 0, -1, (prow - 1) * cols + (pcol - 1))
+    return filled, parents
+
+
+def _neighbour_block(heights: numpy.ndarray, start: int, stop: int, wrap: bool):
+    """Padded block of rows where, unless wrapping, neighbours outside the grid are infinitely high. Should not be
+    called directly."""
+    block = wrapped_block(heights, start, stop, 1)
+    if not wrap:
+        block[:, 0] = block[:, -1] = numpy.inf
+        if start == 0:
+            block[0] = numpy.inf
+        if stop == heights.shape[0]:
+            block[-1] = numpy.inf
+    return block
+
+
+def _flat_index(rows: int, cols: int, start: int, stop: int, offset: tuple):
+    """Flat indices of the neighbours at ``offset`` of the cells in rows ``start:stop``. Should not be called directly.
+    """
+    r = (numpy.arange(start, stop) + offset[0]) % rows
+    c = (numpy.arange(cols) + offset[1]) % cols
+    return r[:, None] * cols + c[None, :]
+
+
+def d8_directions(heights: numpy.ndarray, parents: numpy.ndarray, wrap=False, block_rows=64, workers=1):
+    """Steepest descent D8 direction codes. Cells without a lower neighbour drain towards their priority-flood parent.
+
+    :param heights: 2D array of depression-filled heights.
+    :param parents: Parents returned by :func:`priority_flood`.
+    :param wrap: Whether the grid wraps around.
+    :param block_rows: Number of rows processed at once.
+    :param workers: Number of threads processing blocks concurrently.
+    :returns: ``int8`` array of indices in ``D8_OFFSETS``, -1 for outlets."""
+    rows, cols = heights.shape
+    codes = numpy.empty((rows, cols), dtype='int8')
+    distances = [math.hypot(*offset) for offset in D8_OFFSETS]
+
+    def route(start, stop):
+        block = _neighbour_block(heights, start, stop, wrap)
+        centre = shifted(block, (0, 0), 1)
+        drops = numpy.stack([(centre - shifted(block, offset, 1)) / distance
+                             for offset, distance in zip(D8_OFFSETS, distances)])
+        best = numpy.argmax(drops, axis=0)
+        flat = numpy.max(drops, axis=0) <= 0
+        if flat.any():
+            best[flat] = _parent_codes(parents[start:stop], rows, cols, start, stop)[flat]
+        codes[start:stop] = best
+
+    map_blocks(route, rows, block_rows, workers)
+    return codes
+
+
+def _parent_codes(parents: numpy.ndarray, rows: int, cols: int, start: int, stop: int):
+    """D8 codes pointing towards the priority-flood parents, -1 for outlets. Should not be called directly."""
+    codes = numpy.full(parents.shape, -1, dtype='int8')
+    for code, offset in enumerate(D8_OFFSETS):
+        codes[parents == _flat_index(rows, cols, start, stop, offset)] = code
+    return codes
+
+
+def dinf_directions(heights: numpy.ndarray, parents: numpy.ndarray, wrap=False, block_rows=64, workers=1):
+    """D-infinity flow directions (Tarboton, 1997). Flow leaves each cell along the steepest of the eight triangular
+    facets around it and is shared between the two neighbours bounding that facet.
+
+    :param heights: 2D array of depression-filled heights.
+    :param parents: Parents returned by :func:`priority_flood`.
+    :param wrap: Whether the grid wraps around.
+    :param block_rows: Number of rows processed at once.
+    :param workers: Number of threads processing blocks concurrently.
+    :returns: tuple of the flow angles (radians counter-clockwise from the x axis, NaN for outlets), the receiving
+    neighbours as D8 codes with shape ``(2, rows, cols)`` and the matching proportions of flow."""
+    rows, cols = heights.shape
+    angles = numpy.empty((rows, cols))
+    receivers = numpy.empty((2, rows, cols), dtype='int8')
+    proportions = numpy.empty((2, rows, cols))
+    quarter = math.pi / 4
+
+    def route(start, stop):
+        block = _neighbour_block(heights, start, stop, wrap)
+        centre = shifted(block, (0, 0), 1)
+        best_slope = numpy.full(centre.shape, -numpy.inf)
+        for facet in range(8):
+            # Facets alternate between going from a cardinal to a diagonal neighbour and the other way around
+            cardinal, diagonal = (facet, facet + 1) if facet % 2 == 0 else ((facet + 1) % 8, facet)
+            e1 = shifted(block, D8_OFFSETS[cardinal], 1)
+            e2 = shifted(block, D8_OFFSETS[diagonal], 1)
+            with numpy.errstate(invalid='ignore'):
+                s1 = centre - e1
+                s2 = e1 - e2
+                r = numpy.arctan2(s2, s1)
+                slope = numpy.hypot(s1, s2)
+                slope = numpy.where(r < 0, s1, slope)
+                slope = numpy.where(r > quarter, (centre - e2) / math.sqrt(2), slope)
+                slope[numpy.isinf(e1) | numpy.isinf(e2)] = -numpy.inf
+            r = numpy.nan_to_num(r.clip(0, quarter))
+            better = slope > best_slope
+            best_slope[better] = slope[better]
+            angle = facet * quarter + r if facet % 2 == 0 else (facet + 1) * quarter - r
+            angles[start:stop][better] = angle[better]
+            receivers[0, start:stop][better] = cardinal
+            receivers[1, start:stop][better] = diagonal
+            proportions[0, start:stop][better] = 1 - r[better] / quarter
+            proportions[1, start:stop][better] = r[better] / quarter
+
+        flat = ~(best_slope > 0)
+        if flat.any():
+            codes = _parent_codes(parents[start:stop], rows, cols, start, stop)
+            angles[start:stop][flat] = numpy.where(codes[flat] < 0, numpy.nan, codes[flat] * quarter)
+            receivers[:, start:stop][:, flat] = codes[flat]
+            proportions[0, start:stop][flat] = 1.
+            proportions[1, start:stop][flat] = 0.
+        angles[start:stop] %= 2 * math.pi
+
+    map_blocks(route, rows, block_rows, workers)
+    return angles, receivers, proportions
+
+
+def accumulate(codes: numpy.ndarray, proportions: numpy.ndarray = None, weights: numpy.ndarray = None):
+    """Accumulate flow along receivers, in topological order.
+
+    Instead of recursing from each cell, cells are processed in waves: the first wave holds all cells nobody drains
+    into, and each following wave the cells whose donors have all been processed. Every wave is a handful of
+    vectorized operations, so the total work is linear in the number of cells.
+
+    :param codes: D8 codes of the receivers, either with the shape of the grid or with an extra first axis to share
+    flow between several receivers.
+    :param proportions: Proportion of flow going to each receiver, with the shape of ``codes``. Defaults to all flow
+    going to the receivers.
+    :param weights: Amount of flow produced by each cell. Defaults to 1 (accumulation counts cells).
+    :returns: array of accumulated flow."""
+    codes = numpy.asarray(codes)
+    if codes.ndim == 2:
+        codes = codes[None]
+    rows, cols = codes.shape[1:]
+    size = rows * cols
+    if proportions is None:
+        proportions = numpy.ones(codes.shape)
+    proportions = numpy.asarray(proportions, dtype=float).reshape(len(codes), size)
+
+    receivers = numpy.full((len(codes), size), -1, dtype='int64')
+    for code, offset in enumerate(D8_OFFSETS):
+        targets = _flat_index(rows, cols, 0, rows, offset).ravel()
+        for k in range(len(codes)):
+            mask = codes[k].ravel() == code
+            receivers[k, mask] = targets[mask]
+    receivers[proportions <= 0] = -1
+
+    acc = numpy.ones(size) if weights is None else numpy.array(weights, dtype=float).ravel()
+    donors = numpy.zeros(size, dtype='int64')
+    for k in range(len(codes)):
+        numpy.add.at(donors, receivers[k][receivers[k] >= 0], 1)
+
+    # Deduplicates cells reached by several donors of a wave: only the last write of each cell's position survives
+    positions = numpy.empty(size, dtype='int64')
+
+    wave = numpy.flatnonzero(donors == 0)
+    waves = 0
+    while wave.size:
+        waves += 1
+        ready = []
+        for k in range(len(codes)):
+            targets = receivers[k, wave]
+            valid = targets >= 0
+            sources, targets = wave[valid], targets[valid]
+            numpy.add.at(acc, targets, acc[sources] * proportions[k, sources])
+            numpy.subtract.at(donors, targets, 1)
+            ready.append(targets)
+        ready = numpy.concatenate(ready)
+        ready = ready[donors[ready] == 0]
+        order = numpy.arange(ready.size)
+        positions[ready] = order
+        wave = ready[positions[ready] == order]
+    logger.debug('Flow accumulated in %i waves', waves)
+
+    return acc.reshape(rows, cols)
+
+
+class SinkFillReader(TerrainReader):
+    """Fills the depressions of the terrain so that every cell drains to an outlet."""
+    def __init__(self, wrap=False):
+        """Initialize the sink filling reader.
+
+        :param wrap: If True, the terrain wraps around and drains to its lowest cell. Otherwise water leaves the
+        terrain through its borders.
+        """
+        self.wrap = wrap
+
+    def __call__(self, terrain: Terrain):
+        """Fill the depressions of the terrain.
+
+        :param terrain: Terrain object to fill.
+        :returns: ``numpy.ndarray`` of filled heights."""
+        return priority_flood(terrain._heightmap, self.wrap)[0]
+
+
+class FlowDirectionReader(TerrainReader):
+    """Direction water flows in, for each cell of the depression-filled terrain."""
+    def __init__(self, method=D8, wrap=False, fill=True, block_rows=64, workers=1):
+        """Initialize the flow direction reader.
+
+        :param method: Either ``hydrology.D8`` (all flow goes to the steepest neighbour) or ``hydrology.DINF`` (flow
+        direction is continuous and shared between two neighbours).
+        :param wrap: If True, the terrain wraps around and drains to its lowest cell. Otherwise water leaves the
+        terrain through its borders.
+        :param fill: Fill depressions before routing water. Filling floods the terrain one step at a time and takes most
+        of the time on large terrains; without it, routing is several times faster but water stops in pits and flats,
+        which become outlets.
+        :param block_rows: Number of rows processed at once.
+        :param workers: Number of threads processing blocks concurrently.
+        """
+        if method not in (D8, DINF):
+            raise TypeError('Method should be one of hydrology.D8 or hydrology.DINF')
+        self.method = method
+        self.wrap = wrap
+        self.fill = fill
+        self.block_rows = block_rows
+        self.workers = workers
+
+    def __call__(self, terrain: Terrain):
+        """Compute the flow directions.
+
+        :param terrain: Terrain object to route water on.
+        :returns: for D8, ``numpy.ndarray`` of indices in ``hydrology.D8_OFFSETS`` (-1 for outlets); for D-infinity,
+        ``numpy.ndarray`` of angles in radians counter-clockwise from the x axis (NaN for outlets)."""
+        return self._route(terrain)[0]
+
+    def _route(self, terrain: Terrain):
+        """Routes water on the terrain. Should not be called directly.
+
+        :returns: tuple of the directions, receiver codes and proportions of flow going to each receiver."""
+        if self.fill:
+            heights, parents = priority_flood(terrain._heightmap, self.wrap)
+        else:
+            heights = terrain._heightmap
+            parents = numpy.full(heights.shape, -1, dtype='int64')
+        if self.method == D8:
+            codes = d8_directions(heights, parents, self.wrap, self.block_rows, self.workers)
+            return codes, codes, None
+        return dinf_directions(heights, parents, self.wrap, self.block_rows, self.workers)
+
+
+class FlowAccumulationReader(FlowDirectionReader):
+    """Amount of upstream cells draining through each cell. Scaled down, it makes an initial water distribution for
+    ``HydraulicErosionFilter``."""
+    def __init__(self, method=D8, wrap=False, fill=True, rainfall=None, block_rows=64, workers=1):
+        """Initialize the flow accumulation reader.
+
+        :param method: Either ``hydrology.D8`` or ``hydrology.DINF``, see ``FlowDirectionReader``.
+        :param wrap: If True, the terrain wraps around and drains to its lowest cell. Otherwise water leaves the
+        terrain through its borders.
+        :param fill: Fill depressions before routing water, see ``FlowDirectionReader``.
+        :param rainfall: Optional 2D array of the amount of water falling on each cell. Defaults to 1 everywhere.
+        :param block_rows: Number of rows processed at once.
+        :param workers: Number of threads processing blocks concurrently.
+        """
+        super().__init__(method, wrap, fill, block_rows, workers)
+        self.rainfall = rainfall
+
+    def __call__(self, terrain: Terrain):
+        """Compute the flow accumulation.
+
+        :param terrain: Terrain object to route water on.
+        :returns: ``numpy.ndarray`` of accumulated flow, at least 1 everywhere with default rainfall."""
+        _, codes, proportions = self._route(terrain)
+        return accumulate(codes, proportions, self.rainfall)
+
+
+class DrainageNetworkReader(FlowAccumulationReader):
+    """Cells belonging to the drainage network, where enough water accumulates to form streams and rivers."""
+    def __init__(self, threshold: float, method=D8, wrap=False, fill=True, rainfall=None, block_rows=64, workers=1):
+        """Initialize the drainage network reader.
+
+        :param threshold: Accumulated flow above which a cell is a channel.
+        :param method: Either ``hydrology.D8`` or ``hydrology.DINF``, see ``FlowDirectionReader``.
+        :param wrap: If True, the terrain wraps around and drains to its lowest cell. Otherwise water leaves the
+        terrain through its borders.
+        :param fill: Fill depressions before routing water, see ``FlowDirectionReader``.
+        :param rainfall: Optional 2D array of the amount of water falling on each cell. Defaults to 1 everywhere.
+        :param block_rows: Number of rows processed at once.
+        :param workers: Number of threads processing blocks concurrently.
+        """
+        super().__init__(method, wrap, fill, rainfall, block_rows, workers)
+        self.threshold = threshold
+
+    def __call__(self, terrain: Terrain):
+        """Extract the drainage network.
+
+        :param terrain: Terrain object to route water on.
+        :returns: boolean ``numpy.ndarray``, True on channels."""
+        return super().__call__(terrain) >= self.threshold
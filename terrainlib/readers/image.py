@@ -15,17 +15,23 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 import numpy
-from PIL import Image
 
 from .base import TerrainReader
+from ..lazy import lazy_import
 from ..terrain import Terrain
+from ..tiles import row_blocks
+
+Image = lazy_import('PIL.Image')
+
+# Number of cells scaled at once
+BLOCK_CELLS = 2**16
 
 
 class PILImageReader(TerrainReader):
     """Export terrain as a greyscale ``PIL.Image`` instance."""
     BITDEPTH_FLOAT = (1., 'F', float)
     BITDEPTH_32 = (2**32-1, 'I', 'uint32')
-    BITDEPTH_16 = (2**16-1, 'I', 'uint16')
+    BITDEPTH_16 = (2**16-1, 'I;16', 'uint16')
     BITDEPTH_8 = (2**8-1, 'L', 'uint8')
     
     def __init__(self, bitdepth: tuple):
@@ -44,7 +50,10 @@ class PILImageReader(TerrainReader):
         :param terrain: Terrain object to be exported.
         :returns: ``PIL.Image`` instance containing the greyscale image.
         """
-        arr = numpy.array(terrain._heightmap, dtype='float32')
+        heights = terrain._heightmap
         depth, mode, dtype = self.bitdepth
-        mult_arr = numpy.multiply(arr, depth)
-        return Image.fromarray(numpy.array(mult_arr, dtype=dtype), mode)
\ No newline at end of file
+        # Scaled in single precision block by block, so that the converted image data is the only full copy
+        data = numpy.empty(heights.shape, dtype=dtype)
+        for start, stop in row_blocks(heights.shape[0], max(1, BLOCK_CELLS // max(1, heights.shape[1]))):
+            data[start:stop] = numpy.multiply(heights[start:stop], depth, dtype='float32')
+        return Image.fromarray(data, mode)
\ No newline at end of file
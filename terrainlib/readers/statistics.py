@@ -0,0 +1,242 @@
+"""Summary statistics of the terrain, to validate generated terrains at a glance. Everything is computed in a single,
+chunked pass, so memory-mapped and tiled terrains never need to be loaded entirely."""
+# TerrainLib - A fast terrain generation library
+# Copyright © 2018  Nathan "SolarLiner" Graule
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+from itertools import zip_longest
+import math
+
+import numpy
+
+from .base import TerrainReader
+from ..terrain import Terrain
+from ..tiles import allclose, row_blocks
+
+
+class QuantileSketch:
+    """Fixed-size histogram approximating the distribution of a stream of values.
+
+    The bins cover a range that doubles, merging pairs of bins, whenever values fall outside of it. Memory stays
+    constant whatever the number of values, and quantiles are exact to within two bin widths."""
+    def __init__(self, bins=4096):
+        """Initialize an empty sketch.
+
+        :param bins: Number of bins. Rounded up to an even number.
+        """
+        self.bins = bins + bins % 2
+        self.counts = numpy.zeros(self.bins, dtype='int64')
+        self.low = None
+        self.width = None
+
+    @property
+    def edges(self):
+        """Edges of the bins, ``bins + 1`` values."""
+        if self.low is None:
+            return numpy.zeros(self.bins + 1)
+        return self.low + self.width * numpy.arange(self.bins + 1)
+
+    def update(self, values: numpy.ndarray, weights: numpy.ndarray = None):
+        """Add values to the sketch.
+
+        :param values: Array of values, NaNs are ignored.
+        :param weights: Optional number of occurrences of each value.
+        """
+        values = numpy.ravel(values)
+        finite = numpy.isfinite(values)
+        if not finite.all():
+            values = values[finite]
+            weights = None if weights is None else numpy.ravel(weights)[finite]
+        if not values.size:
+            return
+        low, high = values.min(), values.max()
+        if self.low is None:
+            self.low = float(low)
+            self.width = max(float(high - low), abs(self.low) * 1e-12, 1e-300) / self.bins
+        self._cover(low, high)
+
+        index = ((values - self.low) / self.width).astype('int64').clip(0, self.bins - 1)
+        self.counts += numpy.bincount(index, weights, minlength=self.bins).astype('int64')
+
+    def merge(self, other):
+        """Add the values of another sketch to this one.
+
+        :param other: ``QuantileSketch`` instance.
+        """
+        if other.low is None:
+            return
+        centres = other.edges[:-1] + other.width / 2
+        nonzero = other.counts > 0
+        self.update(centres[nonzero], other.counts[nonzero])
+
+    def _cover(self, low, high):
+        """Grows the range until it covers ``[low, high]``. Should not be called directly."""
+        half = self.bins // 2
+        while low < self.low or high > self.low + self.width * self.bins:
+            merged = self.counts.reshape(half, 2).sum(1)
+            self.counts = numpy.zeros(self.bins, dtype='int64')
+            if low < self.low:
+                self.counts[half:] = merged
+                self.low -= self.width * self.bins
+            else:
+                self.counts[:half] = merged
+            self.width *= 2
+
+    def quantile(self, q):
+        """Approximate quantiles of the values.
+
+        :param q: Quantile or array of quantiles, between 0 and 1.
+        :returns: value or array of values."""
+        cumulative = numpy.concatenate(([0], numpy.cumsum(self.counts)))
+        if not cumulative[-1]:
+            return numpy.full(numpy.shape(q), numpy.nan)[()]
+        return numpy.interp(numpy.asarray(q) * cumulative[-1], cumulative, self.edges)
+
+    def histogram(self, bins=None):
+        """Histogram of the values.
+
+        :param bins: Number of bins. Must divide the number of bins of the sketch. Defaults to all of them.
+        :returns: tuple of counts and bin edges, like ``numpy.histogram``."""
+        bins = bins or self.bins
+        if self.bins % bins:
+            raise ValueError('Histogram bins must divide the {} bins of the sketch'.format(self.bins))
+        step = self.bins // bins
+        return self.counts.reshape(bins, step).sum(1), self.edges[::step]
+
+
+class TerrainStatistics:
+    """Running statistics of heights. Blocks of values are added one after the other, and statistics of separate
+    terrains can be merged."""
+    def __init__(self, bins=4096):
+        """Initialize empty statistics.
+
+        :param bins: Number of bins of the quantile sketch.
+        """
+        self.count = 0
+        self.minimum = math.inf
+        self.maximum = -math.inf
+        self.mean = 0.
+        self._m2 = 0.
+        self.sketch = QuantileSketch(bins)
+
+    @property
+    def variance(self):
+        """Population variance of the values."""
+        return self._m2 / self.count if self.count else math.nan
+
+    @property
+    def std(self):
+        """Population standard deviation of the values."""
+        return math.sqrt(self.variance)
+
+    def update(self, values: numpy.ndarray):
+        """Add a block of values.
+
+        :param values: Array of values.
+        """
+        values = numpy.asarray(values, dtype=float)
+        if not values.size:
+            return
+        mean = values.mean()
+        m2 = numpy.square(values - mean).sum()
+        self._combine(values.size, float(values.min()), float(values.max()), float(mean), float(m2))
+        self.sketch.update(values)
+
+    def merge(self, other):
+        """Add the values of other statistics.
+
+        :param other: ``TerrainStatistics`` instance.
+        """
+        if other.count:
+            self._combine(other.count, other.minimum, other.maximum, other.mean, other._m2)
+            self.sketch.merge(other.sketch)
+
+    def _combine(self, count, minimum, maximum, mean, m2):
+        """Combines the moments of a group of values (Chan et al.). Should not be called directly."""
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self._m2 += m2 + delta * delta * self.count * count / total
+        self.count = total
+        self.minimum = min(self.minimum, minimum)
+        self.maximum = max(self.maximum, maximum)
+
+    def quantile(self, q):
+        """Approximate quantiles, see ``QuantileSketch.quantile``."""
+        return self.sketch.quantile(q)
+
+    def histogram(self, bins=None):
+        """Histogram of the values, see ``QuantileSketch.histogram``."""
+        return self.sketch.histogram(bins)
+
+    def __str__(self):
+        return "TerrainStatistics(count={}, min={:g}, max={:g}, mean={:g}, std={:g})".format(
+            self.count, self.minimum, self.maximum, self.mean, self.std)
+
+
+class StatisticsReader(TerrainReader):
+    """Computes minimum, maximum, mean, standard deviation, histogram and approximate quantiles of the heights in a
+    single pass over blocks of rows."""
+    def __init__(self, bins=4096, block_rows=256):
+        """Initialize the statistics reader.
+
+        :param bins: Number of bins of the quantile sketch. More bins give more precise quantiles.
+        :param block_rows: Number of rows read at once. This bounds the memory used.
+        """
+        self.bins = bins
+        self.block_rows = block_rows
+
+    def __call__(self, terrain, reference=None):
+        """Compute the statistics of the terrain.
+
+        :param terrain: Terrain object, or iterable of Terrain objects (for instance tiles of a larger terrain) whose
+        statistics are gathered together.
+        :param reference: Optional terrain of the same shape, or for an iterable of tiles, iterable of as many terrains
+        with the shapes of the tiles. Statistics are then computed on the differences between the terrains and their
+        references.
+        :returns: ``TerrainStatistics`` instance."""
+        if isinstance(terrain, Terrain):
+            terrain = [terrain]
+            if reference is not None:
+                reference = [reference]
+        elif isinstance(reference, Terrain):
+            raise TypeError('Tiles need an iterable of references, one per tile')
+
+        stats = TerrainStatistics(self.bins)
+        pairs = zip_longest(terrain, [] if reference is None else reference)
+        for tile, other in pairs:
+            if tile is None or (reference is not None and other is None):
+                raise TypeError('There should be as many references as tiles')
+            heightmap = tile._heightmap
+            if other is not None and other.shape != tile.shape:
+                raise TypeError('Reference of shape {} does not match terrain of shape {}'.format(other.shape,
+                                                                                                   tile.shape))
+            for start, stop in row_blocks(heightmap.shape[0], self.block_rows):
+                block = heightmap[start:stop]
+                if other is not None:
+                    block = numpy.subtract(block, other._heightmap[start:stop])
+                stats.update(block)
+        return stats
+
+    def allclose(self, terrain: Terrain, other, rtol=1e-05, atol=1e-08):
+        """Compare terrains block by block, stopping at the first mismatch.
+
+        :param terrain: Terrain object to compare.
+        :param other: Terrain object, array or scalar to compare to.
+        :param rtol: Relative tolerance.
+        :param atol: Absolute tolerance.
+        :returns: True if all heights are within tolerance."""
+        if isinstance(other, Terrain):
+            other = other._heightmap
+        return allclose(terrain._heightmap, other, rtol, atol, self.block_rows)
@@ -0,0 +1,289 @@
+"""Asynchronous HTTP server generating heightmap tiles on demand.
+
+Tiles are windows of an infinite Diamond Square terrain, optionally filtered, and sent as PNG images or raw float32
+heights. Generation runs on a process pool while the event loop keeps serving. Concurrent requests for the same tile
+share a single generation, and recently generated tiles are kept in an LRU cache.
+
+Start it with ``python -m terrainlib.server [--port 8000] [--size 8] [--seed 0]`` and request
+``/tiles/<row>/<col>.png`` or ``/tiles/<row>/<col>.raw``. ``/stats`` returns cache statistics as JSON."""
+# TerrainLib - A fast terrain generation library
+# Copyright © 2018  Nathan "SolarLiner" Graule
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import argparse
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import io
+import json
+import logging
+import re
+
+import numpy
+
+from .generators.procedural import DiamondSquareGenerator
+from .readers.image import PILImageReader
+from .terrain import Terrain
+from .tiles import crop
+
+logger = logging.getLogger(__name__)
+
+PNG = 'png'
+RAW = 'raw'
+CONTENT_TYPES = {PNG: 'image/png', RAW: 'application/octet-stream'}
+# Size of the pieces tiles are streamed in, letting slow clients apply back-pressure
+CHUNK_SIZE = 64 * 1024
+
+_TILE_PATH = re.compile(r'^/tiles/(-?\d+)/(-?\d+)\.({}|{})$'.format(PNG, RAW))
+_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 500: 'Internal Server Error'}
+
+
+def render_tile(size: int, roughness: float, seed, filters: tuple, row: int, col: int, fmt: str, height_range: tuple,
+                bitdepth: tuple):
+    """Generate, filter and encode one tile. Runs in the worker processes of the server.
+
+    Tiles are ``2**size + 1`` cells wide and share their border cells with their neighbours. Filters run on the tile
+    padded by the sum of their halos, so that tiles match across their borders. Filters without a bounded halo see the
+    tile alone.
+
+    :param size: Exponent of the Diamond Square chunk size.
+    :param roughness: Roughness of the Diamond Square generator.
+    :param seed: Seed of the Diamond Square generator.
+    :param filters: Sequence of ``TerrainFilter`` instances applied in order.
+    :param row: Row of the tile.
+    :param col: Column of the tile.
+    :param fmt: ``server.PNG`` or ``server.RAW``.
+    :param height_range: ``(low, high)`` heights mapped to black and white in PNG tiles. Heights outside are clipped.
+    :param bitdepth: Bitdepth of PNG tiles, ``PILImageReader.BITDEPTH_8`` or ``PILImageReader.BITDEPTH_16``.
+    :returns: encoded bytes."""
+    step = 2 ** size
+    halos = [filt.halo for filt in filters]
+    halo = 0 if None in halos else sum(halos)
+    generator = DiamondSquareGenerator(size, roughness, seed, extent=step + 1 + 2 * halo,
+                                       origin=(row * step - halo, col * step - halo))
+    terrain = generator()
+    for filt in filters:
+        terrain = filt(terrain)
+    heights = crop(terrain._heightmap, halo)
+
+    if fmt == RAW:
+        return numpy.ascontiguousarray(heights, dtype='<f4').tobytes()
+    low, high = height_range
+    levels = numpy.clip((heights - low) / (high - low), 0., 1.)
+    buffer = io.BytesIO()
+    PILImageReader(bitdepth)(Terrain(array=levels)).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+class TileServer:
+    """Serves tiles of a Diamond Square terrain over HTTP, from an asyncio event loop."""
+    def __init__(self, size=8, roughness=0.2, seed=0, filters=(), height_range=None,
+                 bitdepth=PILImageReader.BITDEPTH_16, workers=None, cache_size=256):
+        """Initialize the tile server.
+
+        :param size: Tiles are ``2**size + 1`` cells wide, see ``DiamondSquareGenerator``.
+        :param roughness: Roughness of the terrain, see ``DiamondSquareGenerator``.
+        :param seed: Seed of the terrain. All tiles are windows of the same terrain.
+        :param filters: Sequence of ``TerrainFilter`` instances applied to every tile. They must be picklable.
+        :param height_range: ``(low, high)`` heights mapped to black and white in PNG tiles. Defaults to plus or minus
+        the tile size, the range of the Diamond Square corners.
+        :param bitdepth: Bitdepth of PNG tiles, ``PILImageReader.BITDEPTH_8`` or ``PILImageReader.BITDEPTH_16``.
+        :param workers: Number of processes generating tiles. Defaults to the number of CPUs.
+        :param cache_size: Number of encoded tiles kept in memory.
+        """
+        if bitdepth not in (PILImageReader.BITDEPTH_8, PILImageReader.BITDEPTH_16):
+            raise TypeError('PNG tiles can only be 8 or 16 bits deep')
+        self.size = size
+        self.roughness = roughness
+        self.seed = seed
+        self.filters = tuple(filters)
+        side = 2 ** size + 1
+        self.height_range = tuple(height_range) if height_range is not None else (-side, side)
+        self.bitdepth = bitdepth
+        self.workers = workers
+        self.cache_size = cache_size
+        self.stats = {'requests': 0, 'hits': 0, 'coalesced': 0, 'rendered': 0}
+        self._cache = OrderedDict()
+        self._pending = {}
+        self._executor = None
+        self._server = None
+
+    async def tile(self, row: int, col: int, fmt=PNG):
+        """Encoded tile, from the cache, from a generation already running, or freshly generated.
+
+        :param row: Row of the tile.
+        :param col: Column of the tile.
+        :param fmt: ``server.PNG`` or ``server.RAW``.
+        :returns: encoded bytes."""
+        key = (row, col, fmt)
+        self.stats['requests'] += 1
+        data = self._cache.get(key)
+        if data is not None:
+            self._cache.move_to_end(key)
+            self.stats['hits'] += 1
+            return data
+
+        future = self._pending.get(key)
+        if future is None:
+            args = (self.size, self.roughness, self.seed, self.filters, row, col, fmt, self.height_range,
+                    self.bitdepth)
+            future = asyncio.get_running_loop().run_in_executor(self._executor, render_tile, *args)
+            future.add_done_callback(lambda done: self._store(key, done))
+            self._pending[key] = future
+            self.stats['rendered'] += 1
+        else:
+            self.stats['coalesced'] += 1
+        # Shielded, so that a client going away does not cancel the generation for the others
+        return await asyncio.shield(future)
+
+    def _store(self, key: tuple, future: asyncio.Future):
+        """Moves a finished generation into the cache. Should not be called directly."""
+        del self._pending[key]
+        if future.cancelled() or future.exception() is not None:
+            return
+        self._cache[key] = future.result()
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    async def start(self, host='127.0.0.1', port=8000):
+        """Start the worker processes and listen for connections.
+
+        :param host: Interface to listen on.
+        :param port: Port to listen on, 0 to pick a free one.
+        :returns: the ``(host, port)`` the server listens on."""
+        self._executor = ProcessPoolExecutor(self.workers)
+        # Start the workers before accepting connections, as forked workers would inherit the open sockets and keep
+        # connections alive after the server closes them
+        await asyncio.get_running_loop().run_in_executor(self._executor, int)
+        self._server = await asyncio.start_server(self._handle, host, port)
+        address = self._server.sockets[0].getsockname()[:2]
+        logger.info('Serving tiles on http://%s:%i', *address)
+        return address
+
+    async def close(self):
+        """Stop listening and shut the worker processes down."""
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        if self._executor is not None:
+            await asyncio.get_running_loop().run_in_executor(None, self._executor.shutdown)
+            self._executor = None
+
+    async def __aenter__(self):
+        await self.start(port=0)
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def serve_forever(self, host='127.0.0.1', port=8000):
+        """Serve until cancelled.
+
+        :param host: Interface to listen on.
+        :param port: Port to listen on."""
+        await self.start(host, port)
+        try:
+            await self._server.serve_forever()
+        finally:
+            await self.close()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Serves the requests of one connection, keeping it alive between requests. Should not be called directly."""
+        try:
+            while True:
+                request = await reader.readline()
+                if not request:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                parts = request.decode('latin-1').split()
+                keep_alive = len(parts) == 3 and parts[2] == 'HTTP/1.1' and \
+                    headers.get('connection', '').lower() != 'close'
+                await self._respond(writer, parts, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, writer: asyncio.StreamWriter, parts: list, keep_alive: bool):
+        """Routes one request and streams the response. Should not be called directly."""
+        if len(parts) != 3:
+            return await self._send(writer, 400, b'Malformed request line\n', 'text/plain', keep_alive)
+        method, path = parts[0], parts[1].split('?', 1)[0]
+        if method != 'GET':
+            return await self._send(writer, 405, b'Only GET is supported\n', 'text/plain', keep_alive)
+        if path == '/stats':
+            stats = dict(self.stats, cached=len(self._cache), pending=len(self._pending))
+            return await self._send(writer, 200, json.dumps(stats).encode(), 'application/json', keep_alive)
+        match = _TILE_PATH.match(path)
+        if match is None:
+            return await self._send(writer, 404, b'Unknown path\n', 'text/plain', keep_alive)
+
+        row, col, fmt = int(match.group(1)), int(match.group(2)), match.group(3)
+        try:
+            data = await self.tile(row, col, fmt)
+        except Exception:
+            logger.exception('Failed to generate tile (%i, %i)', row, col)
+            return await self._send(writer, 500, b'Tile generation failed\n', 'text/plain', keep_alive)
+        side = 2 ** self.size + 1
+        await self._send(writer, 200, data, CONTENT_TYPES[fmt], keep_alive,
+                         {'X-Tile-Shape': '{},{}'.format(side, side), 'X-Tile-Dtype': '<f4'} if fmt == RAW else {})
+
+    @staticmethod
+    async def _send(writer: asyncio.StreamWriter, status: int, body: bytes, content_type: str, keep_alive: bool,
+                    extra_headers=None):
+        """Writes the response headers, then streams the body in chunks. Should not be called directly."""
+        headers = {'Content-Type': content_type, 'Content-Length': len(body),
+                   'Connection': 'keep-alive' if keep_alive else 'close'}
+        headers.update(extra_headers or {})
+        head = 'HTTP/1.1 {} {}\r\n'.format(status, _REASONS[status])
+        head += ''.join('{}: {}\r\n'.format(name, value) for name, value in headers.items())
+        writer.write((head + '\r\n').encode('latin-1'))
+        view = memoryview(body)
+        for start in range(0, len(body), CHUNK_SIZE):
+            writer.write(view[start:start + CHUNK_SIZE])
+            await writer.drain()
+        await writer.drain()
+
+
+def main(argv=None):
+    """Command line entry point of the tile server."""
+    parser = argparse.ArgumentParser(description='Serve Diamond Square heightmap tiles over HTTP.')
+    parser.add_argument('--host', default='127.0.0.1', help='interface to listen on')
+    parser.add_argument('--port', type=int, default=8000, help='port to listen on')
+    parser.add_argument('--size', type=int, default=8, help='tiles are 2**size + 1 cells wide')
+    parser.add_argument('--roughness', type=float, default=0.2, help='roughness of the terrain')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the terrain')
+    parser.add_argument('--workers', type=int, default=None, help='number of generating processes')
+    parser.add_argument('--cache-size', type=int, default=256, help='number of tiles kept in memory')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(format='%(levelname)s: %(message)s', level=logging.INFO)
+    server = TileServer(args.size, args.roughness, args.seed, workers=args.workers, cache_size=args.cache_size)
+    try:
+        asyncio.run(server.serve_forever(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""Terrains backed by shared memory, to hand heightmaps over to worker processes without copying them.
+
+A ``SharedTerrain`` pickles as a small handle: a worker receiving one maps the same memory and reads or writes the
+heights in place. Any filter or reader accepts it like a regular terrain. To bring results back without pickling them,
+create the output as a ``SharedTerrain`` too and let workers write into it::
+
+    with SharedTerrain(array=heights) as terrain, SharedTerrain(size=terrain.shape) as out:
+        executor.submit(erode, terrain, out).result()
+        result = out.to_array()
+
+The process creating a shared terrain owns its memory, which lives until ``unlink`` is called (leaving the ``with``
+block does it). Every process should ``close`` its own mapping once done with it."""
+# TerrainLib - A fast terrain generation library
+# Copyright © 2018  Nathan "SolarLiner" Graule
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import sys
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy
+
+from .terrain import Terrain
+
+
+class SharedTerrain(Terrain):
+    """Terrain whose heights live in a named shared memory block."""
+    def __init__(self, array: numpy.ndarray = None, size=None, dtype=float):
+        """Create a terrain in a new shared memory block, owned by the calling process.
+
+        :param array: 2D array of heights, copied into shared memory.
+        :param size: If no array is given, side length of a square, flat terrain, or ``(rows, columns)`` tuple.
+        :param dtype: Data type of the heights.
+        """
+        if array is not None:
+            shape = numpy.shape(array)
+            if not len(shape) == 2:
+                raise TypeError('Input array must be 2-dimensional')
+        elif size is not None:
+            shape = size if isinstance(size, tuple) else (size, size)
+        else:
+            raise TypeError('Either size or input 2D array should be passed as input')
+        dtype = numpy.dtype(dtype)
+        # New shared memory blocks are zero-filled, which makes flat terrains free
+        self._map(SharedMemory(create=True, size=max(1, shape[0] * shape[1] * dtype.itemsize)), shape, dtype, True)
+        if array is not None:
+            self._heightmap[...] = array
+
+    @classmethod
+    def attach(cls, name: str, shape: tuple, dtype=float):
+        """Map an existing shared terrain, created by this or another process. This is how shared terrains unpickle.
+
+        :param name: Name of the shared memory block, see ``SharedTerrain.name``.
+        :param shape: ``(rows, columns)`` of the terrain.
+        :param dtype: Data type of the heights.
+        :returns: new ``SharedTerrain`` instance, not owning the memory."""
+        terrain = cls.__new__(cls)
+        if sys.version_info >= (3, 13):
+            # Only the owner should have the memory released when it exits
+            shm = SharedMemory(name=name, track=False)
+        else:
+            shm = SharedMemory(name=name)
+        terrain._map(shm, tuple(shape), numpy.dtype(dtype), False)
+        return terrain
+
+    def _map(self, shm: SharedMemory, shape: tuple, dtype: numpy.dtype, owner: bool):
+        """Wraps the shared memory block into the heightmap. Should not be called directly."""
+        self._shm = shm
+        self._owner = owner
+        self._heightmap = numpy.ndarray(shape, dtype, buffer=shm.buf)
+        self._dirty = []
+
+    @property
+    def name(self):
+        """Name of the shared memory block, to attach to it from another process."""
+        return self._shm.name
+
+    @property
+    def owner(self):
+        """Whether this process created the shared memory, and is responsible for unlinking it."""
+        return self._owner
+
+    @property
+    def closed(self):
+        """Whether the heights were unmapped from this process."""
+        return self._heightmap is None
+
+    def close(self):
+        """Unmap the heights from this process. Views of the heights must be released first. The shared memory itself
+        stays available to other processes until it is unlinked."""
+        if self._heightmap is not None:
+            self._heightmap = None
+            self._shm.close()
+
+    def unlink(self):
+        """Destroy the shared memory block, once all processes are done with it. Processes which still map it keep
+        their mapping until they close it."""
+        self._shm.unlink()
+        self._owner = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        owner = self._owner
+        self.close()
+        if owner:
+            self.unlink()
+
+    def __reduce__(self):
+        if self.closed:
+            raise TypeError('Cannot pickle a closed shared terrain')
+        return SharedTerrain.attach, (self.name, self.shape, self._heightmap.dtype.str)
+
+    def __str__(self):
+        if self.closed:
+            return "SharedTerrain(name={!r}, closed)".format(self.name)
+        return "SharedTerrain(name={!r}, shape={}): {}".format(self.name, self.shape, str(self._heightmap))
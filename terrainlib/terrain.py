@@ -19,85 +19,219 @@ to function."""
 
 import numpy
 
+from .fingerprint import Fingerprint, content_hash
+from .tiles import allclose, merge_regions
+
 
 class Terrain:
-    def __init__(self, array: numpy.ndarray = None, size: int = None):
+    # Dirty regions beyond this are merged together, to bound the bookkeeping cost of many small edits
+    MAX_DIRTY_REGIONS = 32
+
+    def __init__(self, array: numpy.ndarray = None, size=None, copy: bool = True):
+        """Create a terrain.
+
+        :param array: 2D array of heights, of any shape.
+        :param size: If no array is given, side length of a square, flat terrain, or ``(rows, columns)`` tuple.
+        :param copy: Copy the input array. Without copy, arrays such as ``numpy.memmap`` are used as they are, and
+        read lazily.
+        """
         if array is not None:
             shape = numpy.shape(array)
             if not len(shape) == 2:
                 raise TypeError('Input array must be 2-dimensional')
-            if not shape[1] == shape[0]:
-                raise TypeError('Input array must be square')
-            self._heightmap = numpy.array(array)
-            self._size = shape[0]
+            self._heightmap = numpy.array(array) if copy else numpy.asanyarray(array)
         elif size is not None:
-            self._size = size
-            self._heightmap = numpy.zeros((size, size))
+            self._heightmap = numpy.zeros(size if isinstance(size, tuple) else (size, size))
         else:
             raise TypeError('Either size or input 2D array should be passed as input')
+        self._dirty = []
+
+    @property
+    def shape(self):
+        """Number of ``(rows, columns)`` of the terrain."""
+        return self._heightmap.shape
 
     @property
     def size(self):
-        return self._size
+        """Side length of square terrains. Rectangular terrains have no single size, use ``shape`` instead."""
+        rows, cols = self._heightmap.shape
+        if rows != cols:
+            raise TypeError('Rectangular terrain of shape {} has no single size, use Terrain.shape'.format(self.shape))
+        return rows
+
+    @property
+    def dirty_regions(self):
+        """Regions edited since the last call to ``clear_dirty``, as half-open ``(top, left, bottom, right)`` row and
+        column bounds. Filters and readers use them to recompute their output incrementally."""
+        return list(self._dirty)
+
+    def mark_dirty(self, top: int, left: int, bottom: int, right: int):
+        """Record a region as edited. Use it after editing the heightmap without going through item assignment.
+
+        :param top: First row of the region.
+        :param left: First column of the region.
+        :param bottom: Row after the last row of the region.
+        :param right: Column after the last column of the region.
+        """
+        region = int(top), int(left), int(bottom), int(right)
+        self._dirty = merge_regions(self._dirty + [region], self.MAX_DIRTY_REGIONS)
+
+    def clear_dirty(self):
+        """Forget the edited regions, once all incremental outputs are up to date."""
+        self._dirty = []
 
     def __getitem__(self, key):
-        if isinstance(key[0], int):
-            cols = self._heightmap[key[0]]
-        if isinstance(key[0], float):
-            cols = self._heightmap[int(key[0]) % self.size]
-            next_cols = self._heightmap[int(key[0] + 1) % self.size]
-            frac_part = key[0] - int(key[0])
-            cols = frac_part * next_cols + (1.0 - frac_part) * cols
-
-        if isinstance(key[1], int):
-            val = cols[key[1]]
-        if isinstance(key[1], float):
-            val = cols[int(key[1]) % self.size]
-            val_next = cols[int(key[1]+1) % self.size]
-            frac_part = key[1] - int(key[1])
-            val = frac_part * val_next + (1.0 - frac_part) * val
-
-        return val
+        """Read heights with NumPy indexing along ``(row, column)`` axes: integers, slices, integer arrays and boolean
+        masks. Indices wrap around the terrain, as do slices running past its edges such as ``terrain[-2:3]``. Floats
+        and float arrays interpolate linearly between the surrounding grid points.
+
+        Integers and slices within the terrain return views of the heightmap, other indices return copies."""
+        key = self._expand_key(key)
+        for axis, index in enumerate(key):
+            if isinstance(index, float) or (isinstance(index, numpy.ndarray) and index.dtype.kind == 'f'):
+                low = numpy.floor(index)
+                frac = index - low
+                low = low.astype(int) if isinstance(low, numpy.ndarray) else int(low)
+                below = self[key[:axis] + (low,) + key[axis + 1:]]
+                above = self[key[:axis] + (low + 1,) + key[axis + 1:]]
+                if axis == 0 and isinstance(frac, numpy.ndarray) and isinstance(key[1], slice):
+                    frac = frac[..., None]
+                return (1. - frac) * below + frac * above
+        return self._heightmap[self._index(key)]
 
     def __setitem__(self, key, value):
-        self._heightmap[key[1] % self.size,key[0] % self.size] = value
+        """Write heights, with the same indexing as reading except for floats. The edited cells are marked dirty."""
+        key = self._expand_key(key)
+        for index in key:
+            if isinstance(index, float) or (isinstance(index, numpy.ndarray) and index.dtype.kind == 'f'):
+                raise TypeError('Float indices interpolate heights and can only be read')
+        index = self._index(key)
+        self._heightmap[index] = value
+        self._mark_index(index, key)
+
+    def _expand_key(self, key):
+        """Key as a ``(rows, columns)`` tuple. Should not be called directly."""
+        if not isinstance(key, tuple):
+            key = (key,)
+        if len(key) == 1 and numpy.ndim(key[0]) == 2:
+            mask = numpy.asarray(key[0])
+            if mask.dtype != bool or mask.shape != self.shape:
+                raise TypeError('2-dimensional keys must be boolean masks of shape {}'.format(self.shape))
+            return (mask,)
+        if len(key) > 2:
+            raise TypeError('Terrains have 2 axes, got a key of length {}'.format(len(key)))
+        key = tuple(index if isinstance(index, (slice, int, float, numpy.ndarray)) else numpy.asarray(index)
+                    for index in key)
+        return key + (slice(None),) * (2 - len(key))
+
+    def _index(self, key):
+        """NumPy index of an expanded key, wrapping indices around the terrain. Should not be called directly."""
+        if len(key) == 1:
+            return key[0]
+        rows, cols = (_wrap(index, length) for index, length in zip(key, self.shape))
+        # Slices running past the edges become index arrays, which must still select rows and columns independently
+        if isinstance(key[0], slice) and isinstance(rows, numpy.ndarray) and isinstance(cols, numpy.ndarray):
+            rows = rows.reshape((-1,) + (1,) * cols.ndim)
+        elif isinstance(key[1], slice) and isinstance(cols, numpy.ndarray) and isinstance(rows, numpy.ndarray):
+            rows = rows[..., None]
+        return rows, cols
+
+    def _mark_index(self, index, key):
+        """Marks the bounding box of the cells selected by an index as dirty. Should not be called directly."""
+        if len(key) == 1:
+            bounds = [numpy.flatnonzero(key[0].any(axis=1 - axis)) for axis in (0, 1)]
+            if bounds[0].size:
+                self.mark_dirty(bounds[0][0], bounds[1][0], bounds[0][-1] + 1, bounds[1][-1] + 1)
+            return
+        bounds = []
+        for original, wrapped, length in zip(key, index, self.shape):
+            if isinstance(original, slice) and isinstance(wrapped, numpy.ndarray):
+                # Slice running past the edges: keep its unwrapped bounds, as dirty regions wrap around too
+                span = range(original.start, original.stop, original.step or 1)
+                bounds.append((span[0], span[-1] + 1) if span else None)
+            elif isinstance(wrapped, slice):
+                span = range(*wrapped.indices(length))
+                bounds.append((min(span[0], span[-1]), max(span[0], span[-1]) + 1) if span else None)
+            elif isinstance(wrapped, numpy.ndarray):
+                bounds.append((int(wrapped.min()), int(wrapped.max()) + 1) if wrapped.size else None)
+            else:
+                bounds.append((wrapped, wrapped + 1))
+        if None not in bounds:
+            (top, bottom), (left, right) = bounds
+            self.mark_dirty(top, left, bottom, right)
+
+    def to_array(self):
+        """Copy of the heights.
+
+        :returns: new 2D ``numpy.ndarray``."""
+        return numpy.array(self._heightmap)
+
+    def content_hash(self, block_rows=256):
+        """Exact hash of the heights, see ``terrainlib.fingerprint.content_hash``.
+
+        :returns: SHA-256 hexadecimal digest."""
+        return content_hash(self._heightmap, block_rows)
+
+    def fingerprint(self, tolerance=1e-6, block=16):
+        """Tolerance-aware fingerprint of the heights, see ``terrainlib.fingerprint.Fingerprint``.
+
+        :returns: ``Fingerprint`` instance."""
+        return Fingerprint.of(self._heightmap, tolerance, block)
 
     def __eq__(self, other):
         if isinstance(other, Terrain):
-            return numpy.isclose(self._heightmap, other._heightmap).all()
+            return allclose(self._heightmap, other._heightmap)
         else:
-            return numpy.isclose(self._heightmap, other).all()
+            return allclose(self._heightmap, other)
 
     def __add__(self, other):
         if isinstance(other, Terrain):
             res = numpy.add(self._heightmap, other._heightmap)
         else:
             res = numpy.add(self._heightmap, other)
-        return Terrain(array=res)
+        return Terrain(array=res, copy=False)
 
     def __sub__(self, other):
         if isinstance(other, Terrain):
             res = numpy.subtract(self._heightmap, other._heightmap)
         else:
             res = numpy.subtract(self._heightmap, other)
-        return Terrain(array=res)
+        return Terrain(array=res, copy=False)
 
     def __mul__(self, other):
         if isinstance(other, Terrain):
             res = numpy.multiply(self._heightmap, other._heightmap)
         else:
             res = numpy.multiply(self._heightmap, other)
-        return Terrain(array=res)
+        return Terrain(array=res, copy=False)
 
     def __truediv__(self, other):
         if isinstance(other, Terrain):
             res = numpy.divide(self._heightmap, other._heightmap)
         else:
             res = numpy.divide(self._heightmap, other)
-        return Terrain(array=res)
+        return Terrain(array=res, copy=False)
 
     def __str__(self):
-        return "Terrain(size={}): {}".format(self.size, str(self._heightmap))
+        return "Terrain(shape={}): {}".format(self.shape, str(self._heightmap))
 
     def __repr__(self):
         return repr(self._heightmap)
+
+
+def _wrap(index, length: int):
+    """Wraps an index of one axis around the terrain. Should not be called directly."""
+    if isinstance(index, slice):
+        start, stop, step = index.start, index.stop, index.step or 1
+        if start is not None and stop is not None and step > 0 and (start < 0 <= stop or stop > length):
+            return numpy.arange(start, stop, step) % length
+        return index
+    if isinstance(index, int):
+        return index % length
+    if index.dtype == bool:
+        if index.shape != (length,):
+            raise TypeError('Boolean index of shape {} does not match axis of length {}'.format(index.shape, length))
+        return numpy.flatnonzero(index)
+    if index.dtype.kind not in 'iu':
+        raise TypeError('Unsupported index of type {}'.format(index.dtype))
+    return index % length
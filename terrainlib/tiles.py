@@ -0,0 +1,217 @@
+"""Helpers walking a heightmap in blocks of rows. Neighbourhood operations are evaluated on small, wrap-around padded
+blocks instead of full-size shifted copies of the grid, which keeps memory bounded and lets blocks run on threads."""
+# TerrainLib - A fast terrain generation library
+# Copyright © 2018  Nathan "SolarLiner" Graule
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import numpy
+
+# Offsets (rows, columns) of the neighbours, following the conventions of the ``north``, ``east``, ``south`` and
+# ``west`` helpers of ``terrainlib.filters.erosion``.
+NORTH = (1, 0)
+EAST = (0, -1)
+SOUTH = (-1, 0)
+WEST = (0, 1)
+NORTH_EAST = (1, -1)
+NORTH_WEST = (1, 1)
+SOUTH_EAST = (-1, -1)
+SOUTH_WEST = (-1, 1)
+
+
+def row_blocks(rows: int, block_rows: int):
+    """Split ``rows`` rows into consecutive ``(start, stop)`` ranges of at most ``block_rows`` rows.
+
+    :param rows: Total number of rows.
+    :param block_rows: Maximum number of rows per block.
+    :returns: list of ``(start, stop)`` tuples."""
+    block_rows = max(1, int(block_rows))
+    return [(start, min(start + block_rows, rows)) for start in range(0, rows, block_rows)]
+
+
+def wrapped_block(heightmap: numpy.ndarray, start: int, stop: int, halo: int, dtype=float, out=None):
+    """Copy rows ``start:stop`` of the heightmap, padded with ``halo`` cells on every side, wrapping around the grid.
+
+    Only the block is copied, so this is safe to call on memory-mapped heightmaps.
+
+    :param heightmap: 2D array to read from.
+    :param start: First row of the block.
+    :param stop: Row after the last row of the block.
+    :param halo: Number of padding cells on each side.
+    :param dtype: Data type of the returned block.
+    :param out: Optional array of the block shape receiving the block, to reuse it between calls.
+    :returns: array of shape ``(stop - start + 2 * halo, columns + 2 * halo)``."""
+    rows, cols = heightmap.shape
+    block = numpy.empty((stop - start + 2 * halo, cols + 2 * halo), dtype=dtype) if out is None else out
+    if start - halo >= 0 and stop + halo <= rows:
+        block[:, halo:halo + cols] = heightmap[start - halo:stop + halo]
+    else:
+        # Copy contiguous runs of rows, without gathering them into a temporary array
+        indices = numpy.arange(start - halo, stop + halo) % rows
+        breaks = numpy.flatnonzero(numpy.diff(indices) != 1) + 1
+        for first, last in zip(numpy.r_[0, breaks], numpy.r_[breaks, len(indices)]):
+            block[first:last, halo:halo + cols] = heightmap[indices[first]:indices[first] + last - first]
+    if halo:
+        columns = numpy.arange(-halo, 0) % cols
+        block[:, :halo] = block[:, halo + columns]
+        block[:, halo + cols:] = block[:, halo + (numpy.arange(cols, cols + halo) % cols)]
+    return block
+
+
+def shifted(block: numpy.ndarray, offset: tuple, halo: int):
+    """View of a padded block where each cell holds the value of its neighbour at ``offset``.
+
+    :param block: Block returned by :func:`wrapped_block`.
+    :param offset: ``(rows, columns)`` offset of the neighbour, one of the direction constants of this module.
+    :param halo: Padding used when creating the block. Offsets must not exceed it.
+    :returns: view of the block, with the shape of the unpadded block."""
+    rows, cols = block.shape[0] - 2 * halo, block.shape[1] - 2 * halo
+    drow, dcol = offset
+    return block[halo + drow:halo + drow + rows, halo + dcol:halo + dcol + cols]
+
+
+def map_blocks(func, rows: int, block_rows: int, workers: int = 1):
+    """Call ``func(start, stop)`` for every block of rows, on a thread pool when ``workers`` is above 1.
+
+    NumPy and numexpr release the GIL while crunching numbers, so blocks effectively run in parallel.
+
+    :param func: Callable taking the block ``start`` and ``stop`` rows.
+    :param rows: Total number of rows.
+    :param block_rows: Maximum number of rows per block.
+    :param workers: Number of threads to use.
+    :returns: list of the values returned by ``func``, in block order."""
+    blocks = row_blocks(rows, block_rows)
+    if workers is None or workers <= 1 or len(blocks) == 1:
+        return [func(start, stop) for start, stop in blocks]
+    # Imported here as most processes never start threads, and terrainlib.terrain depends on this module
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(lambda block: func(*block), blocks))
+
+
+def allclose(a, b, rtol=1e-05, atol=1e-08, block_rows=256):
+    """Chunked equivalent of ``numpy.allclose``, which stops at the first block holding a mismatch.
+
+    Temporaries are only as big as a block of rows, so this is suitable for comparing memory-mapped heightmaps.
+
+    :param a: 2D array to compare.
+    :param b: Array or scalar to compare to, broadcastable to the shape of ``a``.
+    :param rtol: Relative tolerance.
+    :param atol: Absolute tolerance.
+    :param block_rows: Number of rows compared at once.
+    :returns: True if all values are within tolerance."""
+    a = numpy.asanyarray(a)
+    b = numpy.broadcast_to(b, a.shape)
+    for start, stop in row_blocks(a.shape[0], block_rows):
+        if not numpy.isclose(a[start:stop], b[start:stop], rtol, atol).all():
+            return False
+    return True
+
+
+def expand_region(region: tuple, halo: int):
+    """Grow a ``(top, left, bottom, right)`` region by ``halo`` cells on every side. The result may extend past the
+    grid, which then wraps around.
+
+    :param region: Region, as half-open ``(top, left, bottom, right)`` row and column bounds.
+    :param halo: Number of cells to add on each side.
+    :returns: expanded region."""
+    top, left, bottom, right = region
+    return top - halo, left - halo, bottom + halo, right + halo
+
+
+def merge_regions(regions: list, limit=None):
+    """Merge overlapping or touching regions into their bounding boxes.
+
+    :param regions: List of ``(top, left, bottom, right)`` regions.
+    :param limit: Maximum number of regions to return. The pairs of regions whose bounding box wastes the least area
+    are merged until there are few enough.
+    :returns: new list of regions."""
+    def union(a, b):
+        return min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])
+
+    def area(r):
+        return (r[2] - r[0]) * (r[3] - r[1])
+
+    merged = []
+    for region in regions:
+        while True:
+            for other in merged:
+                if region[0] <= other[2] and other[0] <= region[2] and region[1] <= other[3] and other[1] <= region[3]:
+                    merged.remove(other)
+                    region = union(region, other)
+                    break
+            else:
+                break
+        merged.append(region)
+
+    while limit is not None and len(merged) > limit:
+        _, i, j = min((area(union(a, b)) - area(a) - area(b), i, j) for i, a in enumerate(merged)
+                          for j, b in enumerate(merged) if i < j)
+        region = union(merged[i], merged.pop(j))
+        merged.pop(i)
+        merged = merge_regions(merged + [region])
+    return merged
+
+
+def dirty_windows(regions: list, halo, shape: tuple):
+    """Plan the incremental update of an output after edits of its input.
+
+    An edit changes the output up to ``halo`` cells away, and computing these cells needs the input up to ``halo``
+    cells further. Each edited region is thus recomputed on a window grown by ``2 * halo`` cells, of which only the
+    region grown by ``halo`` cells is written back.
+
+    :param regions: Edited ``(top, left, bottom, right)`` regions, see ``Terrain.dirty_regions``.
+    :param halo: Distance over which edits change the output, or None if any edit may change all of it.
+    :param shape: ``(rows, columns)`` of the grid.
+    :returns: list of ``(window, region)`` tuples, or None when recomputing everything is cheaper."""
+    if halo is None:
+        return None
+    updated = merge_regions([expand_region(region, halo) for region in regions])
+    windows = [(expand_region(region, halo), region) for region in updated]
+    if sum((bottom - top) * (right - left) for (top, left, bottom, right), _ in windows) >= shape[0] * shape[1]:
+        return None
+    return windows
+
+
+def crop(array: numpy.ndarray, halo: int):
+    """View of an array without ``halo`` cells on each side of its first two axes.
+
+    :param array: Array computed on a window returned by :func:`dirty_windows`.
+    :param halo: Number of cells to remove on each side.
+    :returns: view of the array."""
+    return array[halo:array.shape[0] - halo, halo:array.shape[1] - halo]
+
+
+def _region_indices(region: tuple, shape: tuple):
+    """Row and column indices of a region, wrapping around the grid. Should not be called directly."""
+    top, left, bottom, right = region
+    return numpy.arange(top, bottom)[:, None] % shape[0], numpy.arange(left, right)[None, :] % shape[1]
+
+
+def read_region(heightmap: numpy.ndarray, region: tuple):
+    """Copy a region of the heightmap, wrapping around the grid.
+
+    :param heightmap: 2D array to read from.
+    :param region: ``(top, left, bottom, right)`` region, possibly extending past the grid.
+    :returns: new array of the region shape."""
+    return heightmap[_region_indices(region, heightmap.shape[:2])]
+
+
+def write_region(array: numpy.ndarray, region: tuple, values: numpy.ndarray):
+    """Write values into a region of an array, wrapping around the grid.
+
+    :param array: Array to write into. Only its first two axes are indexed.
+    :param region: ``(top, left, bottom, right)`` region, possibly extending past the grid.
+    :param values: Values of the region.
+    """
+    array[_region_indices(region, array.shape[:2])] = values
@@ -1,5 +1,21 @@
+from pathlib import Path
+
+import numpy
+from nose.tools import raises
+
 from terrainlib.generators.procedural import DiamondSquareGenerator
-from terrainlib.filters.erosion import ThermalErosionFilter, StrataErosionFilter
+from terrainlib.filters.composite import CurveFilter, HeightSelectFilter, LerpFilter, MaxFilter, MinFilter, \
+    SoftMaxFilter
+from terrainlib.filters.convolution import DIRECT, FFT, BoxBlurFilter, ConvolutionFilter, GaussianBlurFilter, \
+    UnsharpMaskFilter
+from terrainlib.filters.erosion import DEPOSITION, DIFFERENCE, EROSION, SEDIMENT, WATER, HydraulicErosionFilter, \
+    ThermalErosionFilter, StrataErosionFilter
+from terrainlib.filters.multiresolution import MultiResolutionFilter, downsample, upsample
+from terrainlib.filters.resample import AREA, BICUBIC, BILINEAR, LANCZOS, ResampleFilter
+from terrainlib.filters.warp import WarpFilter
+from terrainlib.readers.hydrology import FlowAccumulationReader
+from terrainlib.terrain import Terrain
+from terrainlib.tiles import dirty_windows
 
 
 class TestThermalErosion:
@@ -14,6 +30,70 @@ class TestThermalErosion:
         assert self.terr.size == self.terr_eroded.size
 
 
+class TestAdaptiveThermalErosion:
+    def _terrain(self):
+        x = numpy.linspace(0, 8 * numpy.pi, 96)
+        heights = numpy.add.outer(numpy.sin(x), numpy.cos(x)) * 2
+        heights[40:50, 40:50] += numpy.random.uniform(0, 30, (10, 10))
+        return Terrain(array=heights)
+
+    def test_default_runs_all_iterations(self):
+        assert ThermalErosionFilter(25).run(self._terrain()).iterations == 25
+
+    def test_early_exit(self):
+        terrain = self._terrain()
+        result = ThermalErosionFilter(1000, talus=300, tolerance=1e-3).run(terrain)
+        eroded = result.terrain
+
+        assert 10 < result.iterations < 1000
+        assert numpy.abs(ThermalErosionFilter(1, talus=300).erode_once(eroded._heightmap) - eroded._heightmap).max() \
+            < 1e-3
+
+    def test_active_mask_matches_full_run(self):
+        terrain = self._terrain()
+        full = ThermalErosionFilter(1000, talus=300, tolerance=1e-4).run(terrain)
+        masked = ThermalErosionFilter(1000, talus=300, tolerance=1e-4, active_mask=True, block_size=16).run(terrain)
+
+        assert numpy.allclose(full.terrain._heightmap, masked.terrain._heightmap, atol=1e-2)
+        assert masked.iterations <= full.iterations
+
+    def test_deposit_conserves_volume(self):
+        terrain = self._terrain()
+        for eroder in (ThermalErosionFilter(20, deposit=True),
+                       ThermalErosionFilter(200, talus=300, tolerance=1e-3, active_mask=True, deposit=True,
+                                            block_size=16)):
+            assert numpy.isclose(eroder(terrain)._heightmap.sum(), terrain._heightmap.sum())
+
+    def test_maps(self):
+        terrain = self._terrain()
+        for eroder in (ThermalErosionFilter(20, deposit=True),
+                       ThermalErosionFilter(200, talus=300, tolerance=1e-3, active_mask=True, deposit=True,
+                                            block_size=16)):
+            difference = numpy.full(terrain.shape, numpy.nan)
+            result = eroder.run(terrain, {DIFFERENCE: difference, EROSION: None, DEPOSITION: None})
+
+            assert result[DIFFERENCE] is difference
+            assert numpy.allclose(difference, result.terrain._heightmap - terrain._heightmap)
+            assert numpy.allclose(difference, result[DEPOSITION] - result[EROSION])
+            assert result.terrain == eroder(terrain)
+
+    def test_deposition_without_deposit(self):
+        terrain = self._terrain()
+        result = ThermalErosionFilter(20).run(terrain, (EROSION, DEPOSITION))
+
+        assert result.terrain == ThermalErosionFilter(20)(terrain)
+        assert numpy.allclose(result[DEPOSITION].sum(), result[EROSION].sum())
+        assert sorted(ThermalErosionFilter(20).run(terrain).maps) == []
+
+    @raises(TypeError)
+    def test_throws_on_mask_without_tolerance(self):
+        ThermalErosionFilter(10, active_mask=True)
+
+    @raises(TypeError)
+    def test_throws_on_unknown_map(self):
+        ThermalErosionFilter(10).run(self._terrain(), (WATER,))
+
+
 class TestStrataErosion:
     def setup(self):
         gen = DiamondSquareGenerator(5, 0.1)
@@ -23,4 +103,238 @@ class TestStrataErosion:
         self.terr_eroded = eroder(self.terr)
 
     def test_same_terrain_size(self):
-        assert self.terr.size == self.terr_eroded.size
\ No newline at end of file
+        assert self.terr.size == self.terr_eroded.size
+
+    def test_unit_sharpness_is_identity(self):
+        arr = numpy.random.uniform(size=(32, 32))
+        terr = StrataErosionFilter(6, sharpness=1., warp=.4, seed=1)(Terrain(array=arr))
+
+        assert terr == arr
+
+    def test_terraces(self):
+        arr = numpy.add.outer(numpy.linspace(0., 1., 64), numpy.zeros(64))
+        terr = StrataErosionFilter(4, sharpness=50.)(Terrain(array=arr))
+
+        assert len(numpy.unique(numpy.round(terr._heightmap, 2))) < 16
+        assert numpy.isclose(terr._heightmap.min(), 0.) and numpy.isclose(terr._heightmap.max(), 1.)
+
+    def test_in_place(self):
+        terr = Terrain(array=numpy.random.uniform(size=(32, 32)))
+        eroded = StrataErosionFilter(4, hardness=(1., 3.), warp=.2, in_place=True)(terr)
+
+        assert eroded is terr
+
+
+class TestMultiResolution:
+    def test_resampling_keeps_smooth_terrains(self):
+        x = numpy.linspace(0, 2 * numpy.pi, 64, endpoint=False)
+        arr = numpy.add.outer(numpy.sin(x), numpy.cos(2 * x))
+        coarse = downsample(arr)
+
+        assert coarse.shape == (32, 32)
+        assert numpy.isclose(coarse.mean(), arr.mean())
+        assert numpy.abs(upsample(coarse, arr.shape) - arr).max() < .05
+        assert downsample(numpy.ones((33, 17))).shape == (17, 9)
+
+    def test_single_level_runs_coarse_filter(self):
+        terrain = DiamondSquareGenerator(5, .3, seed=2)()
+        eroded = MultiResolutionFilter(ThermalErosionFilter(20), levels=1)(terrain)
+
+        assert eroded == ThermalErosionFilter(20)(terrain)
+
+    def test_matches_full_resolution(self):
+        terrain = DiamondSquareGenerator(7, .3, seed=2, extent=128)()
+        full = ThermalErosionFilter(200)(terrain)._heightmap
+        multi = MultiResolutionFilter(ThermalErosionFilter(100), ThermalErosionFilter(10), levels=2)(terrain)
+        change = full - terrain._heightmap
+
+        assert multi.shape == terrain.shape
+        assert numpy.sqrt(numpy.mean((multi._heightmap - full) ** 2) / numpy.mean(change ** 2)) < .1
+
+    @raises(TypeError)
+    def test_throws_on_no_level(self):
+        MultiResolutionFilter(ThermalErosionFilter(10), levels=0)
+
+
+class TestResampleFilter:
+    def test_keeps_constants(self):
+        terrain = Terrain(array=numpy.full((30, 40), 3.))
+        for mode in (AREA, BILINEAR, BICUBIC, LANCZOS):
+            resampled = ResampleFilter((77, 13), mode)(terrain)
+
+            assert resampled.shape == (77, 13)
+            assert resampled == 3.
+
+    def test_area_averages_blocks(self):
+        arr = numpy.random.uniform(0, 1, (32, 48))
+        resampled = ResampleFilter((8, 12), AREA, block_rows=3, workers=2)(Terrain(array=arr))
+
+        assert resampled == arr.reshape(8, 4, 12, 4).mean(axis=(1, 3))
+
+    def test_interpolates_ramps(self):
+        centres = (numpy.arange(128) + .5) / 2 - .5
+        arr = numpy.add.outer(numpy.arange(64.), numpy.arange(64.) * 2)
+        for mode in (BILINEAR, BICUBIC):
+            resampled = ResampleFilter(128, mode)(Terrain(array=arr))
+
+            assert numpy.allclose(resampled._heightmap[4:-4, 4:-4], numpy.add.outer(centres, centres * 2)[4:-4, 4:-4])
+
+    def test_reads_memory_maps(self):
+        arr = numpy.random.uniform(0, 1, (40, 40)).astype(numpy.float32)
+        path = Path('test_terrain_resample.npy')
+        memmap = numpy.lib.format.open_memmap(str(path), 'w+', numpy.float32, arr.shape)
+        memmap[:] = arr
+        resampled = ResampleFilter((100, 90), LANCZOS, wrap=True, block_rows=7)(Terrain(array=memmap, copy=False))
+        del memmap
+        path.unlink()
+
+        assert resampled == ResampleFilter((100, 90), LANCZOS, wrap=True)(Terrain(array=arr.astype(float)))
+
+    @raises(TypeError)
+    def test_throws_on_unknown_mode(self):
+        ResampleFilter(16, 'nearest')
+
+
+class TestHydraulicErosion:
+    def test_initial_water(self):
+        terr = DiamondSquareGenerator(5, 0.1, 1)()
+        acc = FlowAccumulationReader()(terr)
+        eroded = HydraulicErosionFilter(5)(terr, water=acc / acc.max())
+
+        assert eroded.size == terr.size
+        assert numpy.isfinite(eroded._heightmap).all()
+
+    def test_maps(self):
+        terr = DiamondSquareGenerator(5, 0.1, 1)()
+        eroder = HydraulicErosionFilter(5)
+        water = numpy.empty(terr.shape)
+        result = eroder.run(terr, outputs={WATER: water, SEDIMENT: None, DIFFERENCE: None})
+
+        assert result[WATER] is water and result.iterations == 5
+        assert result.terrain == eroder(terr)
+        assert numpy.allclose(result[DIFFERENCE], result.terrain._heightmap - terr._heightmap)
+        # Dissolved soil is either still carried or part of the terrain
+        assert numpy.isclose(result[SEDIMENT].sum() + result.terrain._heightmap.sum(), terr._heightmap.sum())
+        assert not hasattr(eroder, 'water_map')
+
+    @raises(TypeError)
+    def test_throws_on_integer_map(self):
+        HydraulicErosionFilter(5).run(Terrain(size=8), outputs={WATER: numpy.zeros((8, 8), dtype=int)})
+
+
+class TestConvolutionFilters:
+    def test_methods_agree(self):
+        arr = numpy.random.uniform(size=(40, 40))
+        kernel = numpy.random.uniform(size=(5, 3))
+
+        direct = ConvolutionFilter(kernel, DIRECT)(Terrain(array=arr))
+        fft = ConvolutionFilter(kernel, FFT)(Terrain(array=arr))
+        assert direct == fft
+
+    def test_wraps_around(self):
+        arr = numpy.random.uniform(size=(32, 32))
+        kernel = numpy.zeros((3, 3))
+        kernel[0, 1] = 1.
+
+        assert ConvolutionFilter(kernel)(Terrain(array=arr)) == numpy.roll(arr, -1, 0)
+
+    def test_separable_blurs(self):
+        arr = numpy.random.uniform(size=(48, 48))
+        for blur in (GaussianBlurFilter(2.), BoxBlurFilter(3)):
+            assert blur(Terrain(array=arr)) == ConvolutionFilter(blur.kernel, FFT)(Terrain(array=arr))
+
+    def test_blur_preserves_mean(self):
+        arr = numpy.random.uniform(size=(32, 32))
+        for blur in (GaussianBlurFilter(1.), BoxBlurFilter(10), UnsharpMaskFilter(1., 2.)):
+            assert numpy.isclose(blur(Terrain(array=arr))._heightmap.mean(), arr.mean())
+
+
+class TestWarpFilter:
+    def test_matches_float_indexing(self):
+        terrain = Terrain(array=numpy.random.uniform(size=(40, 56)))
+        filt = WarpFilter(amplitude=5., seed=3, block_rows=7, workers=2)
+        field = filt.displacement(terrain.shape)
+        rows = numpy.arange(40)[:, None] + field[0]
+        cols = numpy.arange(56)[None, :] + field[1]
+
+        assert numpy.allclose(filt(terrain)._heightmap, terrain[rows, cols])
+
+    def test_explicit_field(self):
+        arr = numpy.random.uniform(size=(16, 16))
+        field = numpy.zeros((2, 16, 16))
+        field[1] = 3.
+
+        assert WarpFilter(field=field)(Terrain(array=arr)) == numpy.roll(arr, -3, axis=1)
+
+    def test_caches_sampling(self):
+        filt = WarpFilter(seed=1)
+        first = filt(Terrain(array=numpy.random.uniform(size=(32, 32))))
+
+        assert filt.sampling((32, 32)) is filt.sampling((32, 32))
+        assert filt(first) != first
+
+    @raises(TypeError)
+    def test_throws_on_field_shape_mismatch(self):
+        WarpFilter(field=numpy.zeros((2, 8, 8)))(Terrain(array=numpy.zeros((8, 9))))
+
+
+class TestCompositeFilters:
+    def test_blends(self):
+        a, b, mask = (numpy.random.uniform(size=(60, 40)) for _ in range(3))
+        terrain = Terrain(array=a)
+        expected = [
+            (LerpFilter(b, mask, block_rows=7, workers=3), a + (b - a) * mask),
+            (MaxFilter(Terrain(array=b)), numpy.maximum(a, b)),
+            (MinFilter(.5), numpy.minimum(a, .5)),
+            (SoftMaxFilter(b, .1), .1 * numpy.log(numpy.exp(a / .1) + numpy.exp(b / .1))),
+            (SoftMaxFilter(b, -.1), -.1 * numpy.log(numpy.exp(-a / .1) + numpy.exp(-b / .1))),
+            (HeightSelectFilter(b, .3, .6, .1), a + (b - a) * numpy.clip(1 - numpy.maximum(.3 - a, a - .6) / .1, 0, 1)),
+            (HeightSelectFilter(b, .3, .6), numpy.where((a >= .3) & (a <= .6), b, a)),
+            (CurveFilter([0, .5, 1], [0, .1, 1]), numpy.interp(a, [0, .5, 1], [0, .1, 1])),
+        ]
+        for filt, result in expected:
+            assert numpy.allclose(filt(terrain)._heightmap, result, atol=1e-3)
+        assert numpy.array_equal(CurveFilter([0, .5, 1], [0, .1, 1], block_rows=7)(terrain)._heightmap,
+                                 numpy.interp(a, [0, .5, 1], [0, .1, 1]))
+        assert terrain == a
+
+    def test_output_buffers(self):
+        a, b = numpy.random.uniform(size=(2, 32, 32))
+        terrain = Terrain(array=a)
+
+        out = numpy.empty((32, 32))
+        assert MaxFilter(b)(terrain, out=out)._heightmap is out
+        out_terrain = Terrain(size=32)
+        assert MaxFilter(b)(terrain, out=out_terrain) is out_terrain
+        assert MaxFilter(b, in_place=True)(terrain) is terrain
+        for result in (terrain, out_terrain, Terrain(array=out)):
+            assert result == numpy.maximum(a, b)
+
+    @raises(TypeError)
+    def test_throws_on_layer_shape_mismatch(self):
+        LerpFilter(numpy.zeros((8, 8)), .5)(Terrain(size=16))
+
+    @raises(TypeError)
+    def test_throws_on_integer_output(self):
+        MaxFilter(0.)(Terrain(size=8), out=numpy.zeros((8, 8), dtype=int))
+
+
+class TestIncrementalFilters:
+    def test_matches_full_update(self):
+        terrain = Terrain(array=numpy.random.uniform(size=(160, 128)))
+        for filt in (ThermalErosionFilter(10), HydraulicErosionFilter(3), GaussianBlurFilter(1.5)):
+            terrain.clear_dirty()
+            previous = filt(terrain)
+            terrain[2, 140] = 2.
+            terrain[90, 40] = -1.
+
+            assert dirty_windows(terrain.dirty_regions, filt.halo, terrain.shape) is not None
+            assert filt.incremental(terrain, previous) == filt(terrain)
+
+    def test_global_filter_recomputes_everything(self):
+        terrain = Terrain(array=numpy.random.uniform(size=(32, 32)))
+        filt = StrataErosionFilter(seed=4)
+        previous = filt(terrain)
+        terrain[0, 0] = 5.
+
+        assert filt.incremental(terrain, previous) == filt(terrain)
@@ -1,7 +1,11 @@
+import os
 import random
+import tempfile
 
 import numpy
+from nose.tools import raises
 
+from terrainlib.generators.pointcloud import IDW, NEAREST, PointCloudGenerator
 from terrainlib.generators.procedural import DiamondSquareGenerator, VoronoiGenerator
 from terrainlib.terrain import Terrain
 
@@ -37,6 +41,31 @@ class TestDiamondSquareGenerator:
 
             yield self.assert_terrains_different, gen1(), gen2()
 
+class TestChunkedDiamondSquare:
+    def test_extent(self):
+        terr = DiamondSquareGenerator(4, 0.1, 1, extent=(20, 50))()
+
+        assert terr.shape == (20, 50)
+
+    def test_chunks_are_cropped(self):
+        chunk = DiamondSquareGenerator(4, 0.1, 1)()
+        terr = DiamondSquareGenerator(4, 0.1, 1, extent=(40, 40))()
+
+        assert Terrain(array=terr._heightmap[:17, :17]) == chunk
+
+    def test_borders_are_generated(self):
+        terr = DiamondSquareGenerator(5, 0.1, 1)()
+
+        assert numpy.count_nonzero(terr._heightmap[-1]) == 33
+        assert numpy.count_nonzero(terr._heightmap[:, -1]) == 33
+
+    def test_origin(self):
+        terr = DiamondSquareGenerator(4, 0.1, 1, extent=(50, 70))()
+        window = DiamondSquareGenerator(4, 0.1, 1, extent=(20, 37), origin=(17, 30))()
+
+        assert Terrain(array=terr._heightmap[17:37, 30:67]) == window
+
+
 class TestVoronoiGenerator:
     def test_terrain_size(self):
         points = numpy.random.uniform(0, 1024, (50, 2))
@@ -45,3 +74,83 @@ class TestVoronoiGenerator:
         terr = gen(points.tolist())
 
         assert terr.size == 1024
+
+    def test_rectangular(self):
+        points = numpy.random.uniform(0, 64, (10, 2))
+        terr = VoronoiGenerator((64, 32))(points.tolist())
+
+        assert terr.shape == (64, 32)
+
+
+class TestPointCloudGenerator:
+    def _points(self, count=3000):
+        points = numpy.random.uniform(0, 100, (count, 3))
+        points[:, 2] = numpy.sin(points[:, 0] / 10) + points[:, 1] / 50
+        return points
+
+    def _nearest_samples(self, generator, points):
+        """Squared distances from every cell to the centroids of the non-empty cells, and their heights."""
+        heights, sample_rows, sample_cols = generator.bin(points, generator.bounds)
+        cells = numpy.flatnonzero(~numpy.isnan(heights))
+        rows, cols = numpy.indices(heights.shape).reshape(2, -1, 1)
+        distances = (sample_rows.flat[cells] - rows) ** 2 + (sample_cols.flat[cells] - cols) ** 2
+        return heights, distances, heights.flat[cells]
+
+    def test_bins_average_heights(self):
+        points = numpy.array([[.5, .5, 1.], [.6, .2, 3.], [3.5, 1.5, 5.], [4., 2., 7.], [9., 9., 1.]])
+        terr = PointCloudGenerator((2, 4), bounds=(0, 0, 4, 2), fill=None)(points)
+
+        assert terr.shape == (2, 4)
+        assert terr._heightmap[0, 0] == 2. and terr._heightmap[1, 3] == 6.
+        assert numpy.isnan(terr._heightmap).sum() == 6
+
+    def test_streams_chunks_and_files(self):
+        points = self._points()
+        generator = PointCloudGenerator((30, 40), bounds=(0, 0, 100, 100), chunk_size=700)
+        terr = generator(points)
+
+        assert generator(numpy.array_split(points, 7)) == terr
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'points.npy')
+            numpy.save(path, points)
+            assert generator(path) == terr
+        assert PointCloudGenerator((30, 40))(points).shape == (30, 40)
+
+    def test_nearest_fill(self):
+        points = self._points(500)
+        generator = PointCloudGenerator((40, 50), bounds=(0, 0, 100, 100), fill=NEAREST, block_rows=7, workers=3)
+        heights, distances, values = self._nearest_samples(generator, points)
+        filled = generator(points)._heightmap
+        empty = numpy.isnan(heights)
+
+        assert numpy.array_equal(filled[empty], values[distances.argmin(axis=1)].reshape(heights.shape)[empty])
+        assert numpy.array_equal(filled[~empty], heights[~empty])
+
+    def test_inverse_distance_weighting(self):
+        points = self._points(500)
+        generator = PointCloudGenerator((40, 50), bounds=(0, 0, 100, 100), fill=IDW, radius=3., power=1.5,
+                                        block_rows=4, workers=2)
+        heights, distances, values = self._nearest_samples(generator, points)
+        weights = numpy.where(distances <= 9., distances ** -.75, 0.)
+        expected = ((weights @ values) / weights.sum(axis=1)).reshape(heights.shape)
+        interpolated = numpy.isnan(heights) & (weights.sum(axis=1) > 0).reshape(heights.shape)
+        filled = generator(points)._heightmap
+
+        assert numpy.allclose(filled[interpolated], expected[interpolated])
+        assert not numpy.isnan(filled).any()
+
+    def test_nearest_fallback_beyond_radius(self):
+        # Interpolation leaves only the corners, far from the sample but next to interpolated cells
+        points = numpy.array([[.5, .5, 5.]])
+        generator = PointCloudGenerator((64, 64), bounds=(0, 0, 1, 1), fill=IDW, radius=44.)
+        heights, distances, values = self._nearest_samples(generator, points)
+        filled = generator(points)._heightmap
+        beyond = (distances.min(axis=1) > 44. ** 2).reshape(heights.shape)
+
+        assert beyond.any() and numpy.isfinite(filled).all()
+        assert numpy.array_equal(filled[beyond], values[distances.argmin(axis=1)].reshape(heights.shape)[beyond])
+
+    @raises(TypeError)
+    def test_throws_on_streams_without_bounds(self):
+        PointCloudGenerator(16)(iter([self._points()]))
+
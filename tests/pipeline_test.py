@@ -0,0 +1,98 @@
+import json
+import os
+import tempfile
+
+import numpy
+from nose.tools import raises
+
+from terrainlib.cli import FAILED, RAN, SKIPPED, main, run_batch, summary
+from terrainlib.filters.erosion import ThermalErosionFilter
+from terrainlib.pipeline import Pipeline, run_pipelines, substitute, sweep
+from terrainlib.terrain import Terrain
+
+SPEC = {
+    'stages': [
+        {'type': 'DiamondSquareGenerator', 'size': 4, 'roughness': 0.2, 'seed': '$seed'},
+        {'type': 'ThermalErosionFilter', 'iterations': '$iterations'},
+    ],
+    'output': {'path': 'out/{seed}_{iterations}.npy'},
+    'sweep': {'seed': [1, 2], 'iterations': [10, 12]},
+}
+
+
+def _write_spec(directory, spec, name='spec.json'):
+    path = os.path.join(directory, name)
+    with open(path, 'w') as file:
+        json.dump(spec, file)
+    return path
+
+
+class TestPipeline:
+    def test_sweep(self):
+        jobs = sweep(SPEC)
+
+        assert len(jobs) == 4
+        assert {'seed': 2, 'iterations': 10} in jobs
+        assert sweep({'stages': []}) == [{}]
+
+    def test_substitute(self):
+        assert substitute({'a': ['$x', 'x'], 'b': '$y'}, {'x': 1, 'y': 2.}) == {'a': [1, 'x'], 'b': 2.}
+
+    def test_stages(self):
+        pipeline = Pipeline.from_spec(SPEC, {'seed': 1, 'iterations': 10})
+        record = []
+        terrain = pipeline(record)
+
+        assert isinstance(pipeline.stages[1], ThermalErosionFilter)
+        assert isinstance(terrain, Terrain)
+        assert [name for name, _, _ in record] == ['DiamondSquareGenerator', 'ThermalErosionFilter']
+
+    def test_threads_match_sequential_runs(self):
+        pipelines = [Pipeline.from_spec(SPEC, variables) for variables in sweep(SPEC)] * 3
+        sequential = [pipeline() for pipeline in pipelines]
+
+        for terrain, expected in zip(run_pipelines(pipelines, workers=4), sequential):
+            assert terrain.content_hash() == expected.content_hash()
+
+    @raises(TypeError)
+    def test_throws_on_misplaced_stage(self):
+        Pipeline([{'type': 'ThermalErosionFilter', 'iterations': 10}])
+
+    @raises(TypeError)
+    def test_throws_on_unknown_variable(self):
+        Pipeline.from_spec(SPEC)
+
+
+class TestCommandLine:
+    def test_batch_skips_up_to_date_outputs(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = _write_spec(directory, SPEC)
+            results = run_batch([path], workers=2)
+            assert [result['status'] for result in results] == [RAN] * 4
+            assert numpy.load(os.path.join(directory, 'out', '2_12.npy')).shape == (17, 17)
+
+            assert [result['status'] for result in run_batch([path])] == [SKIPPED] * 4
+            assert [result['status'] for result in run_batch([path], force=True)] == [RAN] * 4
+
+    def test_batch_on_threads(self):
+        with tempfile.TemporaryDirectory() as directory:
+            results = run_batch([_write_spec(directory, SPEC)], workers=2, threads=True)
+            assert [result['status'] for result in results] == [RAN] * 4
+            assert all(peak is None for result in results for _, _, peak in result['stages'])
+            assert 'total' in summary(results)
+
+    def test_batch_reports_missing_output(self):
+        spec = dict(SPEC, output=None, sweep={'seed': [1], 'iterations': [10]})
+        with tempfile.TemporaryDirectory() as directory:
+            results = run_batch([_write_spec(directory, spec), _write_spec(directory, SPEC, 'other.json')])
+            assert [result['status'] for result in results] == [FAILED] + [RAN] * 4
+            assert 'no output' in results[0]['error']
+            assert FAILED.upper() in summary(results)
+
+    def test_main_writes_summary(self):
+        spec = dict(SPEC, stages=SPEC['stages'] + [{'type': 'NotAReader'}], sweep={'seed': [1], 'iterations': [10]})
+        with tempfile.TemporaryDirectory() as directory:
+            path = _write_spec(directory, spec)
+            assert main(['run', path, '-j', '1']) == 1
+            with open(os.path.join(directory, 'spec.summary.txt')) as file:
+                assert FAILED.upper() in file.read()
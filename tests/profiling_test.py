@@ -0,0 +1,67 @@
+import numpy
+from nose.tools import raises
+
+from terrainlib.filters.erosion import ThermalErosionFilter
+from terrainlib.generators.procedural import DiamondSquareGenerator
+from terrainlib.profiling import Profiler, allocation_budget
+from terrainlib.readers.image import PILImageReader
+
+
+class TestProfiler:
+    def test_stages(self):
+        profiler = Profiler()
+        with profiler.stage('outer'):
+            with profiler.stage('inner'):
+                kept = numpy.ones((256, 256))
+            del kept
+            with profiler.stage('small'):
+                numpy.ones(16)
+
+        inner, small, outer = profiler.stages
+        assert [stage.name for stage in profiler.stages] == ['inner', 'small', 'outer']
+        assert inner.peak >= 2**19 and inner.retained >= 2**19
+        assert small.peak < 2**12
+        assert outer.peak >= inner.peak and outer.retained < 2**12
+        assert 'inner' in profiler.table()
+
+    def test_records_failing_stages(self):
+        profiler = Profiler(trace_memory=False)
+        try:
+            with profiler.stage('failing'):
+                raise ValueError()
+        except ValueError:
+            pass
+
+        assert profiler.stages[0].name == 'failing' and profiler.stages[0].peak is None
+
+    @raises(AssertionError)
+    def test_budget_exceeded(self):
+        with allocation_budget(2**16):
+            numpy.ones((256, 256))
+
+
+class TestAllocationBudgets:
+    def _terrain(self):
+        return DiamondSquareGenerator(9, .2, seed=1)()
+
+    def test_thermal_erosion(self):
+        terrain = self._terrain()
+        grid = terrain._heightmap.nbytes
+        # A copy of the heights, the padded heights, the soil moved towards a neighbour and the soil lost, reused by
+        # every iteration; depositing adds the soil gained
+        for eroder, grids in ((ThermalErosionFilter(20), 4), (ThermalErosionFilter(20, tolerance=1e-9), 4),
+                              (ThermalErosionFilter(20, deposit=True), 5)):
+            with allocation_budget(grids * grid + 2**18, 'thermal erosion'):
+                eroder(terrain)
+
+    def test_terrain_operators(self):
+        terrain = self._terrain()
+        with allocation_budget(terrain._heightmap.nbytes + 2**12, 'terrain addition'):
+            terrain + terrain
+
+    def test_image_export(self):
+        terrain = self._terrain()
+        PILImageReader(PILImageReader.BITDEPTH_16)(terrain)
+        # The 16-bit image data, and one block of single precision heights
+        with allocation_budget(terrain._heightmap.nbytes // 4 + 2**19, 'image export'):
+            PILImageReader(PILImageReader.BITDEPTH_16)(terrain)
@@ -1,7 +1,16 @@
 from pathlib import Path
 
+import numpy
+from nose.tools import raises
+
+from terrainlib.filters.erosion import north, east, south, west
 from terrainlib.generators.procedural import DiamondSquareGenerator
+from terrainlib.readers.analysis import TerrainAnalysisReader, SlopeReader, NormalMapReader
+from terrainlib.readers.hydrology import D8, DINF, FlowAccumulationReader, FlowDirectionReader, SinkFillReader, \
+    priority_flood
 from terrainlib.readers.image import PILImageReader
+from terrainlib.readers.statistics import StatisticsReader
+from terrainlib.terrain import Terrain
 
 
 class TestImageExport:
@@ -21,7 +30,7 @@ class TestImageExport:
 
     def test_save_16bit_png(self):
         self.save_bitdepth_factory(PILImageReader.BITDEPTH_16, self.file_png.resolve())
-        assert self.file_png.is_fifo(), '16 bit PNG file exists'
+        assert self.file_png.is_file(), '16 bit PNG file exists'
 
     def test_save_32bit_tif(self):
         self.save_bitdepth_factory(PILImageReader.BITDEPTH_32, self.file_tif.resolve())
@@ -30,3 +39,147 @@ class TestImageExport:
     def test_save_float_tif(self):
         self.save_bitdepth_factory(PILImageReader.BITDEPTH_FLOAT, self.file_tif.resolve())
         assert self.file_tif.is_file(), 'Float TIFF file exists'
+
+
+class TestAnalysisReaders:
+    def test_flat_terrain(self):
+        terr = Terrain(array=numpy.ones((32, 32)))
+        maps = TerrainAnalysisReader()(terr)
+
+        assert numpy.allclose(maps[TerrainAnalysisReader.SLOPE], 0.)
+        assert numpy.allclose(maps[TerrainAnalysisReader.CURVATURE], 0.)
+        assert numpy.allclose(maps[TerrainAnalysisReader.NORMALS][..., 2], 1.)
+
+    def test_matches_wrapping_neighbours(self):
+        arr = numpy.random.uniform(size=(48, 48))
+        maps = TerrainAnalysisReader(block_rows=5, workers=3)(Terrain(array=arr))
+
+        dx = (west(arr) - east(arr)) / 2.
+        dy = (north(arr) - south(arr)) / 2.
+        laplacian = north(arr) + east(arr) + south(arr) + west(arr) - 4 * arr
+
+        assert numpy.allclose(maps[TerrainAnalysisReader.SLOPE], numpy.arctan(numpy.hypot(dx, dy)))
+        assert numpy.allclose(maps[TerrainAnalysisReader.ASPECT], numpy.arctan2(-dy, -dx))
+        assert numpy.allclose(maps[TerrainAnalysisReader.CURVATURE], laplacian)
+
+    def test_single_output_readers(self):
+        terr = DiamondSquareGenerator(5, .1, 1)()
+
+        assert SlopeReader()(terr).shape == (33, 33)
+        assert NormalMapReader()(terr).shape == (33, 33, 3)
+        assert numpy.allclose(numpy.linalg.norm(NormalMapReader()(terr), axis=2), 1.)
+
+    def test_incremental(self):
+        terrain = Terrain(array=numpy.random.uniform(size=(40, 40)))
+        reader = TerrainAnalysisReader()
+        previous = reader(terrain)
+        terrain[39, 0] = 3.
+
+        maps = reader.incremental(terrain, previous)
+        for name, expected in reader(terrain).items():
+            assert numpy.allclose(maps[name], expected)
+
+
+class TestHydrologyReaders:
+    def test_sink_fill(self):
+        arr = numpy.ones((9, 9))
+        arr[1:-1, 1:-1] = 2.
+        arr[4, 4] = 0.
+        filled = SinkFillReader()(Terrain(array=arr))
+
+        assert filled[4, 4] == 2.
+        assert numpy.equal(filled[arr > 0], arr[arr > 0]).all()
+
+    def test_sink_fill_nested_depressions(self):
+        # A pit inside a basin spilling at 3 over its rim, inside a plateau draining through a notch at 1
+        arr = numpy.full((12, 12), 5.)
+        arr[0, 6] = 1.
+        arr[1:-1, 1:-1] = 4.
+        arr[1:6, 6] = 1.
+        arr[3:9, 3:9] = 3.
+        arr[4:8, 4:8] = 0.
+        arr[5, 5] = -2.
+        for levels in (1, 4, 64):
+            filled, parents = priority_flood(arr, levels=levels)
+
+            assert (filled[4:8, 4:8] == 3.).all()
+            assert (filled[arr >= 1] == arr[arr >= 1]).all()
+            # Every cell drains to a border cell through cells no higher than itself
+            cells = numpy.arange(arr.size)
+            for _ in range(arr.size):
+                up = parents.ravel()[cells]
+                assert (filled.ravel()[up[up >= 0]] <= filled.ravel()[cells[up >= 0]]).all()
+                cells = numpy.where(up >= 0, up, cells)
+            rows, cols = numpy.divmod(cells, 12)
+            assert ((rows % 11 == 0) | (cols % 11 == 0)).all()
+
+    def test_directions_follow_slope(self):
+        arr = numpy.add.outer(numpy.arange(16.), numpy.zeros(16))
+
+        codes = FlowDirectionReader(D8)(Terrain(array=arr))
+        angles = FlowDirectionReader(DINF)(Terrain(array=arr))
+
+        assert (codes[1:] == 6).all()
+        assert numpy.allclose(angles[1:], 1.5 * numpy.pi)
+
+    def test_accumulation_conserves_flow(self):
+        arr = numpy.random.uniform(size=(32, 32))
+        for method in (D8, DINF):
+            for wrap in (False, True):
+                reader = FlowAccumulationReader(method, wrap)
+                _, codes, _ = reader._route(Terrain(array=arr))
+                acc = reader(Terrain(array=arr))
+                outlets = (codes if codes.ndim == 2 else codes[0]) == -1
+
+                assert numpy.isclose(acc[outlets].sum(), 32 * 32)
+
+
+class TestStatisticsReader:
+    def test_matches_numpy(self):
+        arr = numpy.random.normal(size=(200, 200))
+        stats = StatisticsReader(block_rows=7)(Terrain(array=arr))
+
+        assert stats.count == arr.size
+        assert stats.minimum == arr.min() and stats.maximum == arr.max()
+        assert numpy.isclose(stats.mean, arr.mean()) and numpy.isclose(stats.std, arr.std())
+        width = (arr.max() - arr.min()) / 1000
+        assert numpy.allclose(stats.quantile([.05, .5, .95]), numpy.percentile(arr, [5, 50, 95]), atol=width)
+        assert stats.histogram(64)[0].sum() == arr.size
+
+    def test_tiles_and_memmap(self):
+        path = Path('test_terrain_stats.npy')
+        memmap = numpy.lib.format.open_memmap(str(path), 'w+', float, (64, 64))
+        memmap[:] = 2.
+        tiles = [Terrain(array=memmap, copy=False), Terrain(array=numpy.zeros((64, 64)))]
+        stats = StatisticsReader(block_rows=16)(tiles)
+        del memmap, tiles
+        path.unlink()
+
+        assert stats.count == 2 * 64 * 64
+        assert numpy.isclose(stats.mean, 1.) and numpy.isclose(stats.std, 1.)
+
+    def test_tile_references(self):
+        tiles = [Terrain(array=numpy.full((8, 8), 2.)), Terrain(array=numpy.full((4, 8), 5.))]
+        references = [Terrain(array=numpy.ones((8, 8))), Terrain(array=numpy.full((4, 8), 3.))]
+        stats = StatisticsReader(block_rows=3)(iter(tiles), iter(references))
+
+        assert stats.count == 96
+        assert stats.minimum == 1. and stats.maximum == 2.
+
+    @raises(TypeError)
+    def test_throws_on_single_reference_for_tiles(self):
+        tiles = [Terrain(array=numpy.ones((8, 8))), Terrain(array=numpy.ones((8, 8)))]
+        StatisticsReader()(tiles, tiles[0])
+
+    @raises(TypeError)
+    def test_throws_on_missing_reference(self):
+        tiles = [Terrain(array=numpy.ones((8, 8))), Terrain(array=numpy.ones((8, 8)))]
+        StatisticsReader()(tiles, tiles[:1])
+
+    def test_allclose(self):
+        arr = numpy.random.uniform(size=(64, 64))
+        other = arr.copy()
+        other[-1, -1] += 1.
+
+        assert StatisticsReader(block_rows=8).allclose(Terrain(array=arr), Terrain(array=arr))
+        assert not StatisticsReader(block_rows=8).allclose(Terrain(array=arr), other)
@@ -0,0 +1,161 @@
+"""Golden output regression tests. Each generator and filter runs with fixed seeds, and the fingerprint of its output
+is compared to the one stored in ``golden.json``, so that optimizations cannot change the results unnoticed.
+
+After an intended change of the results, regenerate the golden fingerprints with ``python tests/regression_test.py``
+and review the diff."""
+import json
+import os
+
+import numpy
+from nose.tools import raises
+from PIL import Image
+
+from terrainlib.filters.composite import CurveFilter, HeightSelectFilter, LerpFilter, MaxFilter, SoftMaxFilter
+from terrainlib.filters.convolution import BandPassFilter, BoxBlurFilter, GaussianBlurFilter, UnsharpMaskFilter
+from terrainlib.filters.erosion import HydraulicErosionFilter, StrataErosionFilter, ThermalErosionFilter
+from terrainlib.filters.multiresolution import MultiResolutionFilter
+from terrainlib.filters.warp import WarpFilter
+from terrainlib.fingerprint import Fingerprint, content_hash
+from terrainlib.generators.image import PILInputGenerator
+from terrainlib.generators.pointcloud import IDW, PointCloudGenerator
+from terrainlib.generators.procedural import DiamondSquareGenerator, VoronoiGenerator
+from terrainlib.terrain import Terrain
+
+GOLDEN = os.path.join(os.path.dirname(__file__), 'golden.json')
+TOLERANCE = 1e-6
+
+
+def _base():
+    return DiamondSquareGenerator(6, .1, seed=42)()
+
+
+def _image():
+    gradient = numpy.add.outer(numpy.arange(48), numpy.arange(40) * 2).astype(numpy.uint8)
+    return PILInputGenerator(Image.fromarray(gradient), PILInputGenerator.BITDEPTH_8)()
+
+
+def _samples():
+    samples = numpy.random.RandomState(3).uniform(0, 1, (600, 3))
+    samples[:, 2] = numpy.cos(samples[:, 0] * 6) * samples[:, 1]
+    return samples
+
+
+def _other():
+    return DiamondSquareGenerator(6, .2, seed=7)()
+
+
+CASES = {
+    'diamond_square': lambda: _base(),
+    'voronoi': lambda: VoronoiGenerator((40, 48))([(3, 5), (20, 30), (35, 10), (12, 44)]),
+    'image': _image,
+    'pointcloud_nearest': lambda: PointCloudGenerator((48, 40), bounds=(0, 0, 1, 1))(_samples()),
+    'pointcloud_idw': lambda: PointCloudGenerator((48, 40), bounds=(0, 0, 1, 1), fill=IDW, radius=3.)(_samples()),
+    'thermal': lambda: ThermalErosionFilter(20)(_base()),
+    'thermal_adaptive': lambda: ThermalErosionFilter(200, talus=.05, tolerance=1e-4, active_mask=True, deposit=True,
+                                                     block_size=16)(_base()),
+    'hydraulic': lambda: HydraulicErosionFilter(10)(_base()),
+    'strata': lambda: StrataErosionFilter(6, hardness=(1., 2.), warp=.3, seed=5)(_base()),
+    'gaussian_blur': lambda: GaussianBlurFilter(2.)(_base()),
+    'box_blur': lambda: BoxBlurFilter(3)(_base()),
+    'unsharp_mask': lambda: UnsharpMaskFilter(1., 2.)(_base()),
+    'band_pass': lambda: BandPassFilter(1., 4.)(_base()),
+    'multiresolution': lambda: MultiResolutionFilter(ThermalErosionFilter(10), ThermalErosionFilter(5), levels=2,
+                                                     min_size=8)(_base()),
+    'warp': lambda: WarpFilter(amplitude=3., seed=11)(_base()),
+    'lerp': lambda: LerpFilter(_other(), numpy.outer(numpy.ones(65), numpy.linspace(0, 1, 65)))(_base()),
+    'max': lambda: MaxFilter(_other())(_base()),
+    'soft_max': lambda: SoftMaxFilter(_other(), .05)(_base()),
+    'height_select': lambda: HeightSelectFilter(_other(), -.1, .1, .05)(_base()),
+    'curve': lambda: CurveFilter([-1, 0, 1], [-1, -.5, 1])(_base()),
+}
+
+
+def fingerprint(name: str):
+    return CASES[name]().fingerprint(TOLERANCE)
+
+
+class TestGoldenOutputs:
+    def test_outputs_match_golden(self):
+        with open(GOLDEN) as file:
+            golden = json.load(file)
+        assert sorted(golden) == sorted(CASES)
+
+        failures = {}
+        for name in sorted(CASES):
+            mismatches = fingerprint(name).mismatches(Fingerprint.from_dict(golden[name]))
+            if mismatches:
+                failures[name] = mismatches
+        assert not failures, 'Outputs differ from golden ones in blocks {}'.format(failures)
+
+
+class TestContentHash:
+    def test_independent_of_blocks_and_dtype(self):
+        heights = numpy.random.uniform(-1, 1, (37, 23)).astype(numpy.float32)
+        digest = content_hash(heights)
+
+        assert content_hash(heights, block_rows=5) == digest
+        assert content_hash(heights.astype('>f4')) == digest
+        assert content_hash(heights.astype(numpy.float64)) == digest
+        assert content_hash(numpy.asfortranarray(heights)) == digest
+        assert Terrain(array=heights).content_hash() == digest
+
+    def test_detects_changes(self):
+        heights = numpy.zeros((16, 16))
+        digest = content_hash(heights)
+        heights[7, 3] = 1e-12
+
+        assert content_hash(heights) != digest
+        assert content_hash(heights.T) != content_hash(heights)
+        assert content_hash(numpy.zeros((8, 32))) != content_hash(numpy.zeros((16, 16)))
+
+    def test_canonical_zero_and_nan(self):
+        heights = numpy.zeros((4, 4))
+        signed = -heights
+        signed[1, 1] = numpy.nan
+        heights[1, 1] = numpy.frombuffer(numpy.array([0x7ff8000000000001]).astype('<u8').tobytes(), '<f8')[0]
+
+        assert content_hash(heights) == content_hash(signed)
+
+
+class TestFingerprint:
+    def test_tolerates_small_differences(self):
+        heights = numpy.random.uniform(0, 1, (40, 50))
+        fingerprint = Fingerprint.of(heights, tolerance=1e-4)
+
+        assert Fingerprint.of(heights + 1e-9, tolerance=1e-4) == fingerprint
+        assert Fingerprint.from_dict(json.loads(json.dumps(fingerprint.to_dict()))) == fingerprint
+
+    def test_locates_differences(self):
+        heights = numpy.random.uniform(0, 1, (40, 50))
+        fingerprint = Fingerprint.of(heights, tolerance=1e-4)
+        heights[20, 35] += 1e-2
+
+        assert Fingerprint.of(heights, tolerance=1e-4).mismatches(fingerprint) == [(16, 32)]
+
+    def test_checks_every_cell(self):
+        # Seeded, as swapping heights which differ by about a multiple of 256 tolerances goes unnoticed
+        heights = numpy.random.RandomState(0).uniform(0, 1, (32, 32))
+        fingerprint = Fingerprint.of(heights, tolerance=1e-6)
+        swapped = heights.copy()
+        swapped[3, 4], swapped[9, 12] = heights[9, 12], heights[3, 4]
+        shifted = heights.copy()
+        shifted[5, 5] += .05
+        shifted[6, 6] -= .05
+        transposed = heights.copy()
+        transposed[16:, :16] = heights[16:, :16].T
+
+        assert Fingerprint.of(swapped, tolerance=1e-6).mismatches(fingerprint) == [(0, 0)]
+        assert Fingerprint.of(shifted, tolerance=1e-6).mismatches(fingerprint) == [(0, 0)]
+        assert Fingerprint.of(transposed, tolerance=1e-6).mismatches(fingerprint) == [(16, 0)]
+        assert Fingerprint.of(heights + 4e-7, tolerance=1e-6) == fingerprint
+
+    @raises(TypeError)
+    def test_throws_on_shape_mismatch(self):
+        Fingerprint.of(numpy.zeros((16, 16))).mismatches(Fingerprint.of(numpy.zeros((16, 32))))
+
+
+if __name__ == '__main__':
+    fingerprints = {name: fingerprint(name).to_dict() for name in sorted(CASES)}
+    with open(GOLDEN, 'w') as file:
+        json.dump(fingerprints, file, indent=1, sort_keys=True)
+        file.write('\n')
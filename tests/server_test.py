@@ -0,0 +1,67 @@
+import asyncio
+import io
+
+import numpy
+from PIL import Image
+
+from terrainlib.filters.erosion import ThermalErosionFilter
+from terrainlib.readers.image import PILImageReader
+from terrainlib.server import PNG, RAW, TileServer, render_tile
+
+
+def _raw_tile(row, col, filters=()):
+    data = render_tile(4, 0.2, 3, filters, row, col, RAW, (-17, 17), PILImageReader.BITDEPTH_16)
+    return numpy.frombuffer(data, dtype='<f4').reshape((17, 17))
+
+
+async def _get(port, path):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write('GET {} HTTP/1.1\r\nConnection: close\r\n\r\n'.format(path).encode())
+    response = await reader.read()
+    writer.close()
+    head, _, body = response.partition(b'\r\n\r\n')
+    return int(head.split()[1]), body
+
+
+class TestTileServer:
+    def test_tiles_share_borders(self):
+        filters = (ThermalErosionFilter(10),)
+        left, right = _raw_tile(2, -1, filters), _raw_tile(2, 0, filters)
+        below = _raw_tile(3, 0, filters)
+
+        assert numpy.allclose(left[:, -1], right[:, 0])
+        assert numpy.allclose(right[-1], below[0])
+
+    def test_png_tiles_match_raw_heights(self):
+        heights = _raw_tile(1, 1)
+        for bitdepth in (PILImageReader.BITDEPTH_8, PILImageReader.BITDEPTH_16):
+            data = render_tile(4, 0.2, 3, (), 1, 1, PNG, (-17, 17), bitdepth)
+            image = Image.open(io.BytesIO(data))
+            depth, mode, _ = bitdepth
+
+            assert image.mode == mode
+            assert numpy.allclose(numpy.asarray(image) / depth, (heights + 17) / 34, atol=1.01 / depth)
+
+    def test_coalesces_and_caches(self):
+        async def run():
+            async with TileServer(size=4, workers=1) as server:
+                tiles = await asyncio.gather(*(server.tile(0, 0, RAW) for _ in range(5)))
+                await server.tile(0, 0, RAW)
+                return tiles, server.stats
+
+        tiles, stats = asyncio.run(run())
+        assert all(tile == tiles[0] for tile in tiles)
+        assert stats['rendered'] == 1
+        assert stats['coalesced'] == 4
+        assert stats['hits'] == 1
+
+    def test_http(self):
+        async def run():
+            async with TileServer(size=4, workers=1) as server:
+                port = server._server.sockets[0].getsockname()[1]
+                return await _get(port, '/tiles/1/-2.png'), await _get(port, '/unknown')
+
+        (status, body), (missing, _) = asyncio.run(run())
+        assert status == 200
+        assert body.startswith(b'\x89PNG')
+        assert missing == 404
@@ -1,6 +1,15 @@
+import os
+import pickle
+import subprocess
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy
 from nose.tools import raises
 
+import terrainlib
+from terrainlib.lazy import lazy_import
+from terrainlib.shared import SharedTerrain
 from terrainlib.terrain import Terrain
 
 
@@ -17,9 +26,19 @@ class TestTerrain:
         assert terr.size == 256
         assert numpy.equal(terr._heightmap, array).all()
 
+    def test_accepts_rectangular_array(self):
+        terr = Terrain(array=numpy.random.uniform(size=(256, 128)))
+
+        assert terr.shape == (256, 128)
+
+    def test_accepts_rectangular_size(self):
+        terr = Terrain(size=(16, 32))
+
+        assert terr.shape == (16, 32)
+
     @raises(TypeError)
-    def test_throws_on_nonsquare_array(self):
-        Terrain(array=numpy.random.uniform(size=(256, 128)))
+    def test_throws_on_rectangular_size(self):
+        Terrain(size=(16, 32)).size
 
     @raises(TypeError)
     def test_throws_on_non_2d_array(self):
@@ -48,6 +67,77 @@ class TestTerrain:
         assert terr[::2] == arr[::2]
         assert terr[1:4, 1:4] == arr[1:4, 1:4]
 
+    def test_get_item_wraps_around(self):
+        arr = numpy.arange(48.).reshape((6, 8))
+        terr = Terrain(array=arr)
+
+        assert terr[-1, 9] == arr[5, 1]
+        assert numpy.array_equal(terr[-1:2, 0], arr[[5, 0, 1], 0])
+        assert numpy.array_equal(terr[4:8, -1:1], arr[[4, 5, 0, 1]][:, [7, 0]])
+
+    def test_get_item_views(self):
+        terr = Terrain(array=numpy.zeros((8, 8)))
+
+        view = terr[2:4, 1:3]
+        view[:] = 1.
+        assert terr._heightmap.sum() == 4.
+
+    def test_get_item_fancy(self):
+        arr = numpy.arange(48.).reshape((6, 8))
+        terr = Terrain(array=arr)
+
+        assert numpy.array_equal(terr[[0, 5, 7], [1, 9, -1]], [arr[0, 1], arr[5, 1], arr[1, 7]])
+        assert numpy.array_equal(terr[arr > 40], arr[arr > 40])
+        assert numpy.allclose(terr[numpy.array([0.5, 5.5]), 0], [4., 20.])
+
+    def test_set_item_vectorized(self):
+        terr = Terrain(size=(6, 8))
+        terr[[1, 2, 2], [0, 3, 9]] = [1., 2., 3.]
+        terr[-1:1, 7] = 4.
+
+        expected = numpy.zeros((6, 8))
+        expected[[1, 2, 2], [0, 3, 1]] = [1., 2., 3.]
+        expected[[5, 0], 7] = 4.
+        assert terr == expected
+
+    def test_set_item_order_matches_get_item(self):
+        terr = Terrain(size=(6, 8))
+        terr[1, 7] = 2.
+
+        assert terr[1, 7] == 2.
+        assert terr._heightmap[1, 7] == 2.
+
+    @raises(TypeError)
+    def test_throws_on_float_set_item(self):
+        terr = Terrain(size=8)
+        terr[0.5, 1] = 1.
+
+    def test_set_item_marks_dirty(self):
+        terr = Terrain(size=16)
+        assert terr.dirty_regions == []
+
+        terr[3, 5] = 1.
+        terr[4, 5] = 1.
+        terr[-1, 20] = 1.
+        assert sorted(terr.dirty_regions) == [(3, 5, 5, 6), (15, 4, 16, 5)]
+
+        terr.clear_dirty()
+        assert terr.dirty_regions == []
+
+    def test_dirty_regions_are_bounded(self):
+        terr = Terrain(size=64)
+        for i in range(0, 64, 2):
+            for j in range(0, 64, 2):
+                terr.mark_dirty(i, j, i + 1, j + 1)
+        assert len(terr.dirty_regions) <= Terrain.MAX_DIRTY_REGIONS
+
+    def test_set_item_marks_bounding_box_dirty(self):
+        terr = Terrain(size=16)
+        terr[-2:3, 4:6] = 1.
+        terr[numpy.array([9, 11]), numpy.array([0, 2])] = 1.
+
+        assert sorted(terr.dirty_regions) == [(-2, 4, 3, 6), (9, 0, 12, 3)]
+
     def test_terrain_addition(self):
         arr1 = numpy.ones((128, 128)) * 0.1
         arr2 = numpy.ones((128, 128)) * 0.2
@@ -101,3 +191,65 @@ class TestTerrain:
 
         copy_arr[::2] = 0
         assert not numpy.equal(arr, copy_arr).all()
+
+
+class TestLazyImports:
+    def test_top_level_namespace(self):
+        assert terrainlib.Terrain is Terrain
+        assert 'DiamondSquareGenerator' in dir(terrainlib)
+
+    @raises(AttributeError)
+    def test_throws_on_unknown_name(self):
+        terrainlib.NotATerrain
+
+    @raises(ImportError)
+    def test_throws_on_missing_module(self):
+        lazy_import('terrainlib_missing_module')
+
+    def test_first_use_from_threads(self):
+        # Needs a fresh interpreter, where numexpr and PIL are not loaded yet.
+        code = '''
+import numpy
+from concurrent.futures import ThreadPoolExecutor
+from terrainlib import Terrain, TerrainAnalysisReader
+from terrainlib.readers.image import PILImageReader
+terrain = Terrain(array=numpy.random.uniform(size=(64, 64)))
+TerrainAnalysisReader(block_rows=1, workers=16)(terrain)
+with ThreadPoolExecutor(max_workers=16) as executor:
+    list(executor.map(lambda _: PILImageReader(PILImageReader.BITDEPTH_8)(terrain), range(16)))
+'''
+        subprocess.check_call([sys.executable, '-c', code], cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _double_shared(terrain, out):
+    """Worker writing into a shared output terrain."""
+    out[:] = (terrain * 2.)._heightmap
+    terrain.close()
+    out.close()
+
+
+class TestSharedTerrain:
+    def test_pickles_as_handle(self):
+        arr = numpy.random.uniform(size=(256, 128))
+        with SharedTerrain(array=arr) as terr:
+            data = pickle.dumps(terr)
+            assert len(data) < 1024
+
+            other = pickle.loads(data)
+            assert not other.owner
+            other[0, 0] = -1.
+            assert terr[0, 0] == -1.
+            other.close()
+
+    def test_process_pool(self):
+        arr = numpy.random.uniform(size=(64, 64))
+        with SharedTerrain(array=arr) as terr, SharedTerrain(size=terr.shape) as out:
+            with ProcessPoolExecutor(max_workers=1) as executor:
+                executor.submit(_double_shared, terr, out).result()
+            assert out == arr * 2.
+
+    @raises(FileNotFoundError)
+    def test_unlinked_on_exit(self):
+        with SharedTerrain(size=8) as terr:
+            name = terr.name
+        SharedTerrain.attach(name, (8, 8))